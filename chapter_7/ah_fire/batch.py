@@ -0,0 +1,197 @@
+"""
+Run the simulation headless, with no Pacemaker, keyboard, or windows,
+as fast as the computer can go. This is handy for sweeping through
+settings, like how hard the ship's thrusters push, running
+each episode many times faster than real time.
+
+An episode is one Simulation, run for a fixed stretch of simulated time,
+with a script of commands standing in for the keyboard. A script is
+a list of (time, key) pairs, where time is in simulated seconds.
+For example, [(0.1, "u"), (0.5, " ")] fires the thrusters
+a tenth of a second in, and a torpedo at half a second.
+
+run_episode() runs one episode in this process. run_batch() spreads
+a list of episodes across a pool of processes.
+
+BatchSimulation takes a different tack. It runs many copies of
+the simulation in lockstep, all in one process, with one call
+into Numba stepping every copy. This is the way to go for training
+a controller, which needs to act on every copy at every step.
+
+To try it out, run
+    python batch.py
+to sweep through a handful of thrust and torque settings.
+"""
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+
+import config
+from sim import Simulation
+from world_batch import WorldBatch
+
+
+def run_episode(duration, script=(), overrides=None, record_freq=100):
+    """
+    Run one Simulation for duration seconds of simulated time.
+    overrides is a dict of settings, as passed to Simulation().
+
+    The state of every body slot is recorded record_freq times
+    per second, and returned in a dict of arrays, one row per record
+    and one column per slot: "x", "y", "angle", and "alive".
+    "t" holds the simulated time of each record, "names" and "types"
+    the name and type of each slot at the end of the episode,
+    and "wall_time" how long the episode took to run, in seconds.
+    """
+    start = time.monotonic()
+    sim = Simulation(overrides)
+    world = sim.world
+
+    n_steps = int(round(duration * config.PHYSICS_FREQ))
+    steps_per_record = max(1, int(config.PHYSICS_FREQ / record_freq))
+    n_records = n_steps // steps_per_record + 1
+
+    # Sort the commands by the physics step they land on.
+    commands = sorted(
+        (int(round(t * config.PHYSICS_FREQ)), key) for t, key in script
+    )
+    i_command = 0
+
+    # The number of slots can grow when the torpedo pool runs dry.
+    # Make room for more columns when that happens.
+    n_slots = world.n_bodies
+    trajectory = {
+        "x": np.zeros((n_records, n_slots)),
+        "y": np.zeros((n_records, n_slots)),
+        "angle": np.zeros((n_records, n_slots)),
+        "alive": np.zeros((n_records, n_slots), dtype=np.bool_),
+    }
+    t = np.zeros(n_records)
+    i_record = 0
+
+    for i_step in range(n_steps + 1):
+        while i_command < len(commands) and commands[i_command][0] <= i_step:
+            sim.command(commands[i_command][1])
+            i_command += 1
+
+        if i_step % steps_per_record == 0:
+            if world.n_bodies > n_slots:
+                n_new = world.n_bodies - n_slots
+                for name, values in trajectory.items():
+                    trajectory[name] = np.concatenate(
+                        (values, np.zeros((n_records, n_new), values.dtype)),
+                        axis=1,
+                    )
+                n_slots = world.n_bodies
+            n = world.n_bodies
+            trajectory["x"][i_record, :n] = world.x[:n]
+            trajectory["y"][i_record, :n] = world.y[:n]
+            trajectory["angle"][i_record, :n] = world.angle[:n]
+            trajectory["alive"][i_record, :n] = world.alive[:n]
+            t[i_record] = i_step * config.PHYSICS_PERIOD
+            i_record += 1
+
+        if i_step < n_steps:
+            sim.step()
+
+    trajectory["t"] = t
+    trajectory["names"] = list(world.names)
+    trajectory["types"] = list(world.types)
+    trajectory["wall_time"] = time.monotonic() - start
+    return trajectory
+
+
+class BatchSimulation:
+    """
+    n_envs copies of a Simulation, each one an environment
+    in a WorldBatch. They all start out the same, but are steered
+    independently with command(). The state of every environment
+    is in the arrays of the WorldBatch, batch.x, batch.v_x, and so on,
+    one row per environment.
+    """
+
+    def __init__(self, n_envs, overrides=None):
+        self.sim = Simulation(overrides)
+        self.batch = WorldBatch(self.sim.world, n_envs)
+        self.i_ship = self.sim.world.index[self.sim.ship_id]
+
+    def command(self, i_env, key):
+        self.sim.command(key, self.batch.envs[i_env])
+
+    def step(self, n_physics_steps=1):
+        start = time.time()
+        for _ in range(n_physics_steps):
+            self.batch.step()
+        return time.time() - start
+
+
+def _run_episode_from_dict(episode):
+    return run_episode(**episode)
+
+
+def run_batch(episodes, n_processes=None):
+    """
+    Run each of the episodes, a list of dicts of arguments
+    for run_episode(), spread across n_processes processes.
+    By default there is one process per core.
+    Returns a list of the trajectories, in the same order.
+
+    The processes are forked, so they inherit config as it is
+    in this process, including the randomly chosen velocities of
+    the asteroid. Every episode starts from the same state unless
+    it is overridden.
+    """
+    if n_processes is None:
+        n_processes = os.cpu_count()
+
+    # Each process loads the compiled kernels from the on-disk cache
+    # for itself. Don't warm up here before forking. Processes forked
+    # after Numba has been started up in the parent can hang on exit.
+    with mp.get_context("fork").Pool(n_processes) as pool:
+        return pool.map(_run_episode_from_dict, episodes, chunksize=1)
+
+
+if __name__ == "__main__":
+    duration = 5.0
+    script = [(0.1, "u"), (0.5, "l"), (1.0, "u"), (1.5, " "), (2.0, "u")]
+    thrusts = [0.5, 1.5, 4.5]
+    torques = [0.02, 0.05, 0.1]
+
+    episodes = []
+    for thrust in thrusts:
+        for torque in torques:
+            episodes.append(
+                {
+                    "duration": duration,
+                    "script": script,
+                    "overrides": {
+                        "THRUST_MAGNITUDE": thrust,
+                        "TORQUE_MAGNITUDE": torque,
+                    },
+                }
+            )
+
+    start = time.monotonic()
+    trajectories = run_batch(episodes)
+    elapsed = time.monotonic() - start
+
+    print(f"{len(episodes)} episodes of {duration} s each")
+    print("  thrust   torque   ship distance   ship turns")
+    for episode, trajectory in zip(episodes, trajectories):
+        i_ship = trajectory["names"].index(config.SHIP_BODY["id"])
+        x = trajectory["x"][:, i_ship]
+        y = trajectory["y"][:, i_ship]
+        distance = np.sum(np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2))
+        turns = (
+            trajectory["angle"][-1, i_ship] - trajectory["angle"][0, i_ship]
+        ) / (2 * np.pi)
+        print(
+            f"  {episode['overrides']['THRUST_MAGNITUDE']:6.2f}"
+            + f"   {episode['overrides']['TORQUE_MAGNITUDE']:6.2f}"
+            + f"   {distance:10.3f} m   {turns:8.3f}"
+        )
+    print(
+        f"{len(episodes) * duration:.1f} s simulated in {elapsed:.1f} s,"
+        + f" {len(episodes) * duration / elapsed:.1f} times real time"
+    )
@@ -0,0 +1,49 @@
+"""
+Compare how many environment-steps per second get done when many
+copies of the simulation are each stepped on their own, one call
+into Numba apiece, and when they are all stepped together
+as one WorldBatch, with a single call into Numba.
+"""
+from time import perf_counter
+import numpy as np
+
+from batch import BatchSimulation
+from sim import Simulation
+
+n_steps = 200
+env_counts = [1, 16, 64, 256]
+
+
+def time_separate(n_envs):
+    sims = [Simulation() for _ in range(n_envs)]
+    # Ensure jitted functions are pre-compiled
+    for sim in sims:
+        sim.step()
+
+    start = perf_counter()
+    for _ in range(n_steps):
+        for sim in sims:
+            sim.step()
+    return perf_counter() - start
+
+
+def time_batch(n_envs):
+    sim = BatchSimulation(n_envs)
+    # Ensure jitted functions are pre-compiled
+    sim.step()
+
+    start = perf_counter()
+    sim.step(n_steps)
+    return perf_counter() - start
+
+
+print("  environments   separate steps       batched steps")
+for n_envs in env_counts:
+    np.random.seed(0)
+    separate_time = time_separate(n_envs)
+    batch_time = time_batch(n_envs)
+    n_env_steps = n_envs * n_steps
+    print(
+        f"  {n_envs:12d}   {n_env_steps / separate_time:9.0f} per s"
+        + f"   {n_env_steps / batch_time:9.0f} per s"
+    )
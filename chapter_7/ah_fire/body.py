@@ -1,11 +1,20 @@
 import math
 import numpy as np
 from numba import njit
-import config
-from tools.ring_buffer import RingBuffer
+
+# Turns smaller than this, in radians, can be made incrementally.
+# See turn_numba().
+SMALL_ANGLE = 0.05
 
 
 class Body:
+    """
+    The description of a rigid body, built up from its init_dict.
+    The positions, masses, and sizes of its atoms are worked out here,
+    and then the whole thing is copied into a World,
+    which takes care of it from there.
+    """
+
     def __init__(self, init_dict):
         self.type = init_dict["type"]
         self.name = init_dict["id"]
@@ -89,231 +98,126 @@ class Body:
         except KeyError:
             self.free = True
 
-        self.f_x_atoms = np.zeros(self.n_atoms)
-        self.f_y_atoms = np.zeros(self.n_atoms)
-
-        # Create one second buffers for forces on the body.
-        self.f_x_ext_buffer = RingBuffer(config.CLOCK_FREQ_SIM)
-        self.f_y_ext_buffer = RingBuffer(config.CLOCK_FREQ_SIM)
-        self.torque_ext_buffer = RingBuffer(config.CLOCK_FREQ_SIM)
-
-    def start_step(self):
-        self.f_x_atoms = np.zeros(self.n_atoms)
-        self.f_y_atoms = np.zeros(self.n_atoms)
-
-        # Create one second buffers for forces on the body.
-        # self.f_x_ext = 0
-        # self.f_y_ext = 0
-        # self.torque_ext = 0
-
-    def calculate_interactions(self, body):
-        sliding_friction = (self.sliding_friction + body.sliding_friction) / 2
-        inelasticity = (self.inelasticity + body.inelasticity) / 2
-
-        is_contacting = body_interactions_numba(
-            self.f_x_atoms,
-            body.f_x_atoms,
-            self.f_y_atoms,
-            body.f_y_atoms,
-            self.stiffness_atoms,
-            body.stiffness_atoms,
-            self.r_atoms,
-            body.r_atoms,
-            self.x_atoms,
-            body.x_atoms,
-            self.y_atoms,
-            body.y_atoms,
-            self.v_x_atoms,
-            body.v_x_atoms,
-            self.v_y_atoms,
-            body.v_y_atoms,
-            sliding_friction,
-            inelasticity,
-        )
-        return is_contacting
-
-    def calculate_wall_forces(self, walls):
-        sliding_friction = (self.sliding_friction + walls.sliding_friction) / 2
-        inelasticity = (self.inelasticity + walls.inelasticity) / 2
-        wall_forces_numba(
-            self.f_x_atoms,
-            self.f_y_atoms,
-            self.stiffness_atoms,
-            self.r_atoms,
-            walls.x,
-            walls.x_n,
-            self.x_atoms,
-            walls.y,
-            walls.y_n,
-            self.y_atoms,
-            self.v_x_atoms,
-            self.v_y_atoms,
-            sliding_friction,
-            inelasticity,
-        )
+        # Some bodies, like torpedoes, are destroyed
+        # as soon as they touch anything.
+        try:
+            self.destroy_on_contact = init_dict["destroy_on_contact"]
+        except KeyError:
+            self.destroy_on_contact = False
 
-    def update_positions(self):
-        f_x_ext = self.f_x_ext_buffer.pop()
-        f_y_ext = self.f_y_ext_buffer.pop() + config.GRAVITY * self.m
-        torque_ext = self.torque_ext_buffer.pop()
-
-        if self.free:
-            (
-                self.x,
-                self.y,
-                self.angle,
-                self.v_x,
-                self.v_y,
-                self.v_rot,
-            ) = update_positions_numba(
-                self.x_atoms_local,
-                self.y_atoms_local,
-                self.x_atoms,
-                self.y_atoms,
-                self.v_x_atoms,
-                self.v_y_atoms,
-                self.f_x_atoms,
-                self.f_y_atoms,
-                self.x,
-                self.y,
-                self.angle,
-                self.v_x,
-                self.v_y,
-                self.v_rot,
-                self.m,
-                self.rot_inertia,
-                f_x_ext,
-                f_y_ext,
-                torque_ext,
-                config.CLOCK_PERIOD_SIM,
-            )
-
-    def get_state(self):
-        viz_info = {
-            "x": self.x,
-            "y": self.y,
-            "angle": self.angle,
-            "type": self.type,
-        }
-        return viz_info
-
-
-@njit
-def body_interactions_numba(
-    f_x_a,
-    f_x_b,
-    f_y_a,
-    f_y_b,
-    k_a,
-    k_b,
-    r_a,
-    r_b,
+
+@njit(cache=True)
+def atom_interaction_numba(
     x_a,
-    x_b,
     y_a,
-    y_b,
     v_x_a,
-    v_x_b,
     v_y_a,
+    r_a,
+    x_b,
+    y_b,
+    v_x_b,
     v_y_b,
+    r_b,
+    k_ab,
     sliding_friction,
     inelasticity,
+    float_type,
 ):
-    epsilon = 1e-12
-    is_contacting = False
-
-    for i_row in range(x_a.size):
-        for j_col in range(x_b.size):
-            d_x = x_a[i_row] - x_b[j_col]
-            d_y = y_a[i_row] - y_b[j_col]
-
-            d_v_x = v_x_a[i_row] - v_x_b[j_col]
-            d_v_y = v_y_a[i_row] - v_y_b[j_col]
-
-            r_ab = r_a[i_row] + r_b[j_col]
-            k_ab = 1 / (
-                (1 / (k_a[i_row] + epsilon)) + (1 / (k_b[j_col] + epsilon))
-            )
-            distance = (d_x**2 + d_y**2) ** 0.5 + epsilon
-            compression = r_ab - distance
-            # Negative distance indicates that the center of the disc
-            # is inside the wall.
-            compression = max(0, compression)
-            if compression > 0:
-                is_contacting = True
-
-            f_ab_contact = k_ab * compression
-
-            # Breaking the contact forces into their x- and y-components
-            # requires multiplying them by the sin and cos of the angle
-            # of the line of connecting the centers of the two:
-            # sin(angle) = d_y / distance
-            # cos(angle) = d_x / distance
-            #
-            # All together it looks like this
-            # f_x_ab_contact = f_ab_contact * d_x / distance
-            # f_y_ab_contact = f_ab_contact * d_y / distance
-            #
-            # To save an extra element-wise division operation, this is broken
-            # out here into two steps.
-            # First, f_ab_contact is divided by distance,
-            # then it is multiplied by d_x and d_y separately.
-            f_norm = f_ab_contact / distance
-
-            # The normal forces due to contact
-            f_x_ab_contact = f_norm * d_x
-            f_y_ab_contact = f_norm * d_y
-
-            # Aggregate to sum the forces of all other atoms
-            # on each one individualy.
-            f_x_a[i_row] += f_x_ab_contact
-            f_x_b[j_col] -= f_x_ab_contact
-            f_y_a[i_row] += f_y_ab_contact
-            f_y_b[j_col] -= f_y_ab_contact
-
-            # Friction
-            # Forces from energy dissipation due to lateral velocity
-            f_x_ab_sliding = (
-                -sliding_friction * np.abs(f_y_ab_contact) * np.sign(d_v_x)
-            )
-            f_y_ab_sliding = (
-                -sliding_friction * np.abs(f_x_ab_contact) * np.sign(d_v_y)
-            )
-            f_x_a[i_row] += f_x_ab_sliding
-            f_x_b[j_col] -= f_x_ab_sliding
-            f_y_a[i_row] += f_y_ab_sliding
-            f_y_b[j_col] -= f_y_ab_sliding
-
-            # Inelasticity
-            # Forces from energy dissipation due to normal velocity
-            f_x_ab_inelastic = -inelasticity * f_x_ab_contact * np.sign(d_v_x)
-            f_y_ab_inelastic = -inelasticity * f_y_ab_contact * np.sign(d_v_y)
-            f_x_a[i_row] += f_x_ab_inelastic
-            f_x_b[j_col] -= f_x_ab_inelastic
-            f_y_a[i_row] += f_y_ab_inelastic
-            f_y_b[j_col] -= f_y_ab_inelastic
-
-    return is_contacting
-
-
-@njit
+    """
+    Find the force that atom b exerts on atom a. Atom a feels it
+    in the opposite direction.
+
+    Returns the x- and y-components of the force,
+    and whether the two atoms are touching at all.
+
+    float_type is the type of the atoms' floats, np.float64 or
+    np.float32. The constants get made in it too, so that single
+    precision atoms get single precision math all the way through.
+    """
+    epsilon = float_type(1e-12)
+    d_x = x_a - x_b
+    d_y = y_a - y_b
+
+    r_ab = r_a + r_b
+    distance = np.sqrt(d_x**2 + d_y**2) + epsilon
+    compression = r_ab - distance
+    # Most of the time the atoms aren't touching,
+    # and there's no force to calculate.
+    if compression <= 0:
+        return float_type(0), float_type(0), False
+
+    d_v_x = v_x_a - v_x_b
+    d_v_y = v_y_a - v_y_b
+
+    f_ab_contact = k_ab * compression
+
+    # Breaking the contact forces into their x- and y-components
+    # requires multiplying them by the sin and cos of the angle
+    # of the line of connecting the centers of the two:
+    # sin(angle) = d_y / distance
+    # cos(angle) = d_x / distance
+    #
+    # All together it looks like this
+    # f_x_ab_contact = f_ab_contact * d_x / distance
+    # f_y_ab_contact = f_ab_contact * d_y / distance
+    #
+    # To save an extra element-wise division operation, this is broken
+    # out here into two steps.
+    # First, f_ab_contact is divided by distance,
+    # then it is multiplied by d_x and d_y separately.
+    f_norm = f_ab_contact / distance
+
+    # The normal forces due to contact
+    f_x_ab_contact = f_norm * d_x
+    f_y_ab_contact = f_norm * d_y
+
+    # Friction
+    # Forces from energy dissipation due to lateral velocity
+    f_x_ab_sliding = (
+        -sliding_friction * np.abs(f_y_ab_contact) * np.sign(d_v_x)
+    )
+    f_y_ab_sliding = (
+        -sliding_friction * np.abs(f_x_ab_contact) * np.sign(d_v_y)
+    )
+
+    # Inelasticity
+    # Forces from energy dissipation due to normal velocity
+    f_x_ab_inelastic = -inelasticity * f_x_ab_contact * np.sign(d_v_x)
+    f_y_ab_inelastic = -inelasticity * f_y_ab_contact * np.sign(d_v_y)
+
+    return (
+        f_x_ab_contact + f_x_ab_sliding + f_x_ab_inelastic,
+        f_y_ab_contact + f_y_ab_sliding + f_y_ab_inelastic,
+        True,
+    )
+
+
+@njit(cache=True)
 def wall_forces_numba(
     f_x,
     f_y,
-    stiffness_atoms,
+    material_atoms,
+    wall_material,
     r_atoms,
     x_wall,
-    x_n_wall,
-    x_atoms,
     y_wall,
+    x_n_wall,
     y_n_wall,
+    x_t_wall,
+    y_t_wall,
+    length_wall,
+    thickness_wall,
+    x_atoms,
     y_atoms,
     v_x_atoms,
     v_y_atoms,
-    sliding_friction,
-    inelasticity,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
 ):
     """
+    Find the forces between one wall and each of a body's atoms.
+
     Taken from
     https://en.wikipedia.org/wiki/Distance_from_a_point_to_a_line
     and modfied to the form
@@ -323,88 +227,112 @@ def wall_forces_numba(
     This is a signed distance.
     A positive value indicates distance away from the wall.
     A negative value indicates distance *into* the wall.
+
+    Past either end of the wall, the nearest part of it is the end
+    point. There the wall pushes straight away from that point,
+    as if it had rounded ends, so that a body that clips the end
+    of a wall gets knocked aside rather than slipping past it.
     """
-    # i_wall is also i_row
-    for i_wall in range(x_wall.size):
-        # j_atom is also j_col
-        for j_atom in range(x_atoms.size):
-            d_x = x_atoms[j_atom] - x_wall[i_wall]
-            d_y = y_atoms[j_atom] - y_wall[i_wall]
-
-            dx_n = d_x * x_n_wall[i_wall]
-            dy_n = d_y * y_n_wall[i_wall]
-            # Negative distance indicates that the center of the disc
-            # is inside the wall.
-            distance = dx_n + dy_n
-            compression = r_atoms[j_atom] - distance
-            compression = max(compression, 0.0)
-
-            f_total = stiffness_atoms[j_atom] * compression
-
-            # Find the x- and y-components of the total force
-            # with calculated sin (y_n / 1)
-            # and cos (x_n / 1) terms.
-            f_x_wall_contact = f_total * x_n_wall[i_wall]
-            f_y_wall_contact = f_total * y_n_wall[i_wall]
-            f_x[j_atom] += f_x_wall_contact
-            f_y[j_atom] += f_y_wall_contact
-
-            # Friction
-            # Forces from energy dissipation due to lateral velocity
-            f_x_wall_sliding = (
-                -sliding_friction
-                * np.abs(f_y_wall_contact)
-                * np.sign(v_x_atoms[j_atom])
-            )
-            f_y_wall_sliding = (
-                -sliding_friction
-                * np.abs(f_x_wall_contact)
-                * np.sign(v_y_atoms[j_atom])
-            )
-            f_x[j_atom] += f_x_wall_sliding
-            f_y[j_atom] += f_y_wall_sliding
-
-            # Inelasticity
-            # Forces from energy dissipation due to normal velocity
-            f_x_wall_inelastic = (
-                -inelasticity
-                * f_x_wall_contact
-                * np.sign(v_x_atoms[j_atom])
-                * np.sign(x_n_wall[i_wall])
-            )
-            f_y_wall_inelastic = (
-                -inelasticity
-                * f_y_wall_contact
-                * np.sign(v_y_atoms[j_atom])
-                * np.sign(y_n_wall[i_wall])
-            )
-            f_x[j_atom] += f_x_wall_inelastic
-            f_y[j_atom] += f_y_wall_inelastic
-
-
-@njit
-def update_positions_numba(
-    x_atoms_local,
-    y_atoms_local,
+    for j_atom in range(x_atoms.size):
+        d_x = x_atoms[j_atom] - x_wall
+        d_y = y_atoms[j_atom] - y_wall
+
+        dx_n = d_x * x_n_wall
+        dy_n = d_y * y_n_wall
+        # Negative distance indicates that the center of the disc
+        # is inside the wall.
+        distance = dx_n + dy_n
+        compression = r_atoms[j_atom] - distance
+
+        # Most atoms aren't touching the wall at all,
+        # and there's no force to calculate.
+        if compression <= 0.0:
+            continue
+        # Atoms behind the wall aren't touching it either.
+        if distance < -thickness_wall:
+            continue
+
+        # The direction the wall pushes in
+        x_n = x_n_wall
+        y_n = y_n_wall
+        along = d_x * x_t_wall + d_y * y_t_wall
+        if along < 0.0 or along > length_wall:
+            # Past one end, measure from the end point instead.
+            along_end = min(max(along, 0.0), length_wall)
+            d_x_end = d_x - along_end * x_t_wall
+            d_y_end = d_y - along_end * y_t_wall
+            gap = math.sqrt(d_x_end**2 + d_y_end**2)
+            compression = r_atoms[j_atom] - gap
+            if compression <= 0.0 or gap == 0.0:
+                continue
+            x_n = d_x_end / gap
+            y_n = d_y_end / gap
+
+        i_material = material_atoms[j_atom]
+        sliding_friction = pair_sliding_friction[i_material, wall_material]
+        inelasticity = pair_inelasticity[i_material, wall_material]
+        f_total = pair_stiffness[i_material, wall_material] * compression
+
+        # Find the x- and y-components of the total force
+        # with calculated sin (y_n / 1)
+        # and cos (x_n / 1) terms.
+        f_x_wall_contact = f_total * x_n
+        f_y_wall_contact = f_total * y_n
+        f_x[j_atom] += f_x_wall_contact
+        f_y[j_atom] += f_y_wall_contact
+
+        # Friction
+        # Forces from energy dissipation due to lateral velocity
+        f_x_wall_sliding = (
+            -sliding_friction
+            * np.abs(f_y_wall_contact)
+            * np.sign(v_x_atoms[j_atom])
+        )
+        f_y_wall_sliding = (
+            -sliding_friction
+            * np.abs(f_x_wall_contact)
+            * np.sign(v_y_atoms[j_atom])
+        )
+        f_x[j_atom] += f_x_wall_sliding
+        f_y[j_atom] += f_y_wall_sliding
+
+        # Inelasticity
+        # Forces from energy dissipation due to normal velocity
+        f_x_wall_inelastic = (
+            -inelasticity
+            * f_x_wall_contact
+            * np.sign(v_x_atoms[j_atom])
+            * np.sign(x_n)
+        )
+        f_y_wall_inelastic = (
+            -inelasticity
+            * f_y_wall_contact
+            * np.sign(v_y_atoms[j_atom])
+            * np.sign(y_n)
+        )
+        f_x[j_atom] += f_x_wall_inelastic
+        f_y[j_atom] += f_y_wall_inelastic
+
+
+@njit(cache=True)
+def body_acceleration_numba(
     x_atoms,
     y_atoms,
-    v_x_atoms,
-    v_y_atoms,
     f_x_atoms,
     f_y_atoms,
     x,
     y,
-    angle,
-    v_x,
-    v_y,
-    v_rot,
     m,
     rot_inertia,
     f_x_ext,
     f_y_ext,
     torque_ext,
-    CLOCK_PERIOD_SIM,
 ):
+    """
+    Add up the forces on a body's atoms, and the external forces
+    on the body as a whole, and find how fast they are accelerating it,
+    both along x and y and in rotation.
+    """
     epsilon = 1e-10
     n_atoms = x_atoms.size
     f_x = 0
@@ -420,27 +348,180 @@ def update_positions_numba(
     a_x = (f_x + f_x_ext) / m
     a_y = (f_y + f_y_ext) / m
     a_rot = (torque + torque_ext) / (rot_inertia + epsilon)
+    return a_x, a_y, a_rot
 
-    v_x += CLOCK_PERIOD_SIM * a_x
-    v_y += CLOCK_PERIOD_SIM * a_y
-    v_rot += CLOCK_PERIOD_SIM * a_rot
 
-    x += CLOCK_PERIOD_SIM * v_x
-    y += CLOCK_PERIOD_SIM * v_y
-    angle += CLOCK_PERIOD_SIM * v_rot
+@njit(cache=True)
+def update_positions_numba(
+    x_atoms_local,
+    y_atoms_local,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    f_x_atoms,
+    f_y_atoms,
+    x,
+    y,
+    angle,
+    cos_angle,
+    sin_angle,
+    v_x,
+    v_y,
+    v_rot,
+    m,
+    rot_inertia,
+    f_x_ext,
+    f_y_ext,
+    torque_ext,
+    dt,
+    incremental_rotation,
+):
+    """
+    Take one semi-implicit Euler step. The velocities are updated
+    first, and then the new velocities are used to update the positions.
 
-    for i_atom in range(n_atoms):
-        x_atom_rel = x_atoms_local[i_atom] * math.cos(angle) - y_atoms_local[
-            i_atom
-        ] * math.sin(angle)
-        y_atom_rel = y_atoms_local[i_atom] * math.cos(angle) + x_atoms_local[
-            i_atom
-        ] * math.sin(angle)
+    cos_angle and sin_angle are the body's rotation, cached from
+    the last time it turned. See turn_numba().
+    """
+    a_x, a_y, a_rot = body_acceleration_numba(
+        x_atoms,
+        y_atoms,
+        f_x_atoms,
+        f_y_atoms,
+        x,
+        y,
+        m,
+        rot_inertia,
+        f_x_ext,
+        f_y_ext,
+        torque_ext,
+    )
+
+    v_x += dt * a_x
+    v_y += dt * a_y
+    v_rot += dt * a_rot
+
+    x += dt * v_x
+    y += dt * v_y
+    angle, cos_angle, sin_angle = turn_numba(
+        angle, cos_angle, sin_angle, dt * v_rot, incremental_rotation
+    )
+
+    place_atoms_rotated_numba(
+        x_atoms_local,
+        y_atoms_local,
+        x_atoms,
+        y_atoms,
+        v_x_atoms,
+        v_y_atoms,
+        x,
+        y,
+        cos_angle,
+        sin_angle,
+        v_x,
+        v_y,
+        v_rot,
+    )
+
+    return x, y, angle, cos_angle, sin_angle, v_x, v_y, v_rot
+
+
+@njit(cache=True)
+def turn_numba(angle, cos_angle, sin_angle, d_angle, incremental_rotation):
+    """
+    Turn a body by d_angle, and work out its new rotation, the cosine
+    and sine of its new angle, to be shared by all of its atoms.
+
+    With incremental_rotation, small turns skip the trig functions.
+    The old rotation is turned by d_angle using the first few terms of
+    the Taylor series for its cosine and sine, which are plenty
+    for the fraction of a degree a body turns in one step.
+    Then it's nudged back to unit length, so that rounding errors
+    don't slowly shrink or stretch the body. Turns too big for that
+    to be accurate fall back to calculating it from scratch.
+    """
+    angle += d_angle
+    if incremental_rotation and abs(d_angle) < SMALL_ANGLE:
+        d2 = d_angle * d_angle
+        cos_d = 1.0 - d2 / 2.0 * (1.0 - d2 / 12.0)
+        sin_d = d_angle * (1.0 - d2 / 6.0 * (1.0 - d2 / 20.0))
+        cos_new = cos_angle * cos_d - sin_angle * sin_d
+        sin_new = sin_angle * cos_d + cos_angle * sin_d
+        renormalize = 1.5 - 0.5 * (cos_new**2 + sin_new**2)
+        return angle, cos_new * renormalize, sin_new * renormalize
+    return angle, math.cos(angle), math.sin(angle)
+
+
+@njit(cache=True)
+def place_atoms_numba(
+    x_atoms_local,
+    y_atoms_local,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    x,
+    y,
+    angle,
+    v_x,
+    v_y,
+    v_rot,
+):
+    """
+    Find the positions and velocities of a body's atoms, given
+    the position, orientation, and velocity of the body as a whole.
+    """
+    place_atoms_rotated_numba(
+        x_atoms_local,
+        y_atoms_local,
+        x_atoms,
+        y_atoms,
+        v_x_atoms,
+        v_y_atoms,
+        x,
+        y,
+        math.cos(angle),
+        math.sin(angle),
+        v_x,
+        v_y,
+        v_rot,
+    )
+
+
+@njit(cache=True)
+def place_atoms_rotated_numba(
+    x_atoms_local,
+    y_atoms_local,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    x,
+    y,
+    cos_angle,
+    sin_angle,
+    v_x,
+    v_y,
+    v_rot,
+):
+    """
+    The same as place_atoms_numba(), for when the cosine and sine
+    of the body's angle are already known. The rotation is worked out
+    once for the whole body, rather than once for every atom.
+    """
+    for i_atom in range(x_atoms.size):
+        x_atom_rel = (
+            x_atoms_local[i_atom] * cos_angle
+            - y_atoms_local[i_atom] * sin_angle
+        )
+        y_atom_rel = (
+            y_atoms_local[i_atom] * cos_angle
+            + x_atoms_local[i_atom] * sin_angle
+        )
         v_x_atom_rel = -v_rot * y_atom_rel
         v_y_atom_rel = v_rot * x_atom_rel
         x_atoms[i_atom] = x + x_atom_rel
         y_atoms[i_atom] = y + y_atom_rel
         v_x_atoms[i_atom] = v_x + v_x_atom_rel
         v_y_atoms[i_atom] = v_y + v_y_atom_rel
-
-    return x, y, angle, v_x, v_y, v_rot
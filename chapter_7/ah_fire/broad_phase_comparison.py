@@ -0,0 +1,108 @@
+"""
+Compare the time it takes to find the pairs of bodies that are close
+enough to interact, checking every pair against using the grid,
+and show how long a full simulation step takes as the number of
+bodies grows.
+"""
+from time import perf_counter
+import numpy as np
+from numba import njit
+
+import config
+from body import Body
+from sim import Simulation
+
+n_reps = 100
+body_counts = [10, 30, 100, 300, 1000]
+
+
+@njit
+def all_pairs_proximity(x, y, r, is_close):
+    n = x.size
+    for i_row in range(n):
+        for j_col in range(i_row + 1, n):
+            is_close[i_row, j_col] = 0
+            d_x = x[i_row] - x[j_col]
+            d_y = y[i_row] - y[j_col]
+            distance = (d_x**2 + d_y**2) ** 0.5
+            compression = r[i_row] + r[j_col] - distance
+            if compression > 0:
+                is_close[i_row, j_col] = 1
+
+
+def create_sim(n_bodies):
+    """
+    Scatter a bunch of small bodies around the world. They are made
+    from torpedoes, but relabeled so they aren't destroyed on contact.
+    """
+    np.random.seed(0)
+    sim = Simulation()
+    for i_body in range(n_bodies):
+        params = dict(config.TORPEDO_BODY)
+        params["type"] = "a00"
+        params["id"] = f"pebble_{i_body:06}"
+        params["x"] = np.random.sample() * config.WORLD_WIDTH
+        params["y"] = np.random.sample() * config.WORLD_HEIGHT
+        params["v_x"] = 0.5 - np.random.sample()
+        params["v_y"] = 0.5 - np.random.sample()
+        sim.world.add_body(Body(params))
+    sim.warmup()
+    sim.step()
+    return sim
+
+
+def time_all_pairs(sim):
+    n_bodies = sim.world.n_bodies
+    x = sim.world.x[:n_bodies]
+    y = sim.world.y[:n_bodies]
+    r = sim.world.radius[:n_bodies]
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        # Allocating the matrix every step is part of the old approach.
+        is_close = np.zeros((n_bodies, n_bodies))
+        all_pairs_proximity(x, y, r, is_close)
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+def time_grid(sim):
+    n_bodies = sim.world.n_bodies
+    x = sim.world.x[:n_bodies]
+    y = sim.world.y[:n_bodies]
+    r = sim.world.radius[:n_bodies]
+    alive = sim.world.alive[:n_bodies]
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        sim.world.grid.update(x, y, alive)
+        sim.world.grid.find_pairs(x, y, r, alive)
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+def time_step(sim):
+    total_time = 0
+    for i_rep in range(n_reps):
+        total_time += sim.step()
+    return total_time / n_reps
+
+
+# Ensure jitted functions are pre-compiled
+all_pairs_proximity(np.zeros(2), np.zeros(2), np.ones(2), np.zeros((2, 2)))
+
+print()
+print("Time per step, in microseconds")
+print()
+print("  bodies   all pairs    grid     full step")
+for n_bodies in body_counts:
+    sim = create_sim(n_bodies)
+    all_pairs_time = time_all_pairs(sim)
+    grid_time = time_grid(sim)
+    step_time = time_step(sim)
+    print(
+        f"{n_bodies:8d}"
+        + f"{int(1e6 * all_pairs_time):12d}"
+        + f"{int(1e6 * grid_time):9d}"
+        + f"{int(1e6 * step_time):12d}"
+    )
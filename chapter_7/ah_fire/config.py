@@ -5,11 +5,36 @@ import logging
 # Time control
 CLOCK_FREQ_SIM = 1000  # Hertz
 CLOCK_PERIOD_SIM = 1 / float(CLOCK_FREQ_SIM)  # seconds
+# Busy-wait the last fraction of a millisecond before each simulation
+# beat, rather than trusting time.sleep() to wake up on time.
+# It's much more precise, but it keeps part of a core busy.
+SPIN_SIM = True
+# The physics is stepped at its own fixed rate. Each time the simulation
+# loop wakes up, it takes as many physics steps as it needs to catch up
+# to the wall clock. With PHYSICS_FREQ a multiple of CLOCK_FREQ_SIM,
+# several cheap steps get taken each time, so the physics can run at,
+# say, 10 kHz while the loop only wakes up at 1 kHz.
+PHYSICS_FREQ = 1000  # Hertz
+PHYSICS_PERIOD = 1 / float(PHYSICS_FREQ)  # seconds
+# If False, always take PHYSICS_FREQ / CLOCK_FREQ_SIM steps per wakeup,
+# and let simulated time fall behind the wall clock when a wakeup is late.
+CATCH_UP = True
+# After a stall, take no more than this many physics steps in one go.
+# Any time still owed after that is dropped.
+MAX_STEPS_PER_BEAT = 10 * int(np.ceil(PHYSICS_FREQ / CLOCK_FREQ_SIM))
 CLOCK_FREQ_VIZ = 30  # Hertz
 CLOCK_FREQ_DASH = 4  # Hertz
 CLOCK_FREQ_RUN = 4  # Hertz
 HEARTBEAT_FREQ_KEYS = 4  # Hertz
 ALIVE_CHECK_FREQ = 1  # Hertz
+KEY_CHECK_FREQ = 100  # Hertz
+# A process that hasn't sent a heartbeat for this long is presumed dead.
+HEARTBEAT_TIMEOUT = 1 / ALIVE_CHECK_FREQ  # seconds
+
+# Each process's Pacemaker posts how well it's keeping time to
+# this block of shared memory. To watch it from the command line, run
+#     python -m tools.timing_stats ah_fire_timing --watch
+TIMING_STATS_NAME = "ah_fire_timing"
 
 # Logging settings
 LOGGING_LEVEL_SIM = logging.ERROR
@@ -27,13 +52,69 @@ WORLD_HEIGHT = 5.5
 
 GRAVITY = 0.0
 
+# Calculate contact forces using all the available cores.
+# This only pays off when there are thousands of atoms.
+PARALLEL_CONTACTS = False
+
+# How the bodies get moved according to the forces on them.
+#   "euler"    Semi-implicit Euler. Update the velocities, then use
+#              them to update the positions. One force calculation
+#              per step. It's simple and hard to beat for the cost.
+#   "substep"  Semi-implicit Euler, with each step broken into enough
+#              substeps that the stiffest contact stays stable.
+#              The physics can then be stepped less often, at
+#              the cost of more force calculations per step.
+#   "verlet"   Velocity Verlet. One force calculation per step,
+#              and more accurate velocities than Euler.
+#   "rk2"      Heun's method, a second-order Runge-Kutta.
+#              Two force calculations per step.
+# Run integrator_comparison.py to see how long a step each can take.
+INTEGRATORS = ["euler", "substep", "verlet", "rk2"]
+INTEGRATOR = "euler"
+# Keep substeps to this fraction of the longest stable step.
+SUBSTEP_SAFETY = 0.5
+
+# Each body's rotation, the cosine and sine of its angle, is worked out
+# once per step and shared by all of its atoms. With this turned on,
+# it isn't even worked out from scratch. The rotation from the last step
+# is turned by however much the body turned, without calling any
+# trig functions. It's a little less exact.
+INCREMENTAL_ROTATION = False
+
+# How precisely the per-atom arrays are stored. Single precision
+# nearly halves the memory they take up, and the contact forces between
+# atoms are worked out in it too, but in practice a step doesn't run
+# measurably faster. Bodies' positions and velocities are always
+# kept in float64.
+#   "float64"  Full double precision.
+#   "float32"  Single precision for all the per-atom arrays.
+#   "mixed"    Single precision for atom positions and velocities,
+#              but the forces are added up in float64.
+# Run precision_comparison.py to see how far each drifts from float64.
+PRECISIONS = ["float64", "float32", "mixed"]
+PRECISION = "float64"
+
+# The pairs of atoms that are within CONTACT_SKIN of touching are cached,
+# and only those are checked for contact. The cache is refreshed once
+# any atom has moved more than half of CONTACT_SKIN. A thicker skin
+# means more pairs to check, but refreshing less often.
+CONTACT_SKIN = 0.02
+
+# A body that has been moving slower than SLEEP_SPEED and spinning
+# slower than SLEEP_SPIN for SLEEP_STEPS physics steps in a row
+# is put to sleep. Sleeping bodies stay put and cost next to nothing
+# until they are bumped or pushed. Set SLEEP_STEPS to 0 to never sleep.
+SLEEP_SPEED = 0.01  # meters per second
+SLEEP_SPIN = 0.01  # radians per second
+SLEEP_STEPS = int(0.5 * PHYSICS_FREQ)
+
 force_duration = 0.1  # seconds
-FORCE_SHAPE = np.ones(int(force_duration * CLOCK_FREQ_SIM))
+FORCE_SHAPE = np.ones(int(force_duration * PHYSICS_FREQ))
 THRUST_MAGNITUDE = 1.5
 TORQUE_MAGNITUDE = 0.05
 
 recoil_duration = 0.03  # seconds
-RECOIL_SHAPE = np.ones(int(recoil_duration * CLOCK_FREQ_SIM))
+RECOIL_SHAPE = np.ones(int(recoil_duration * PHYSICS_FREQ))
 RECOIL_MAGNITUDE = 15
 
 # Initialize crystals
@@ -138,6 +219,9 @@ POLY_PATHS["a02"] = body_scale * np.array(
     ]
 )
 
+# Every type of body gets a numerical id, its position in this list.
+BODY_TYPES = ["ship", "torpedo", "a0", "a00", "a01", "a02"]
+
 FACECOLOR = {
     "ship": BLACK,
     "torpedo": WHITE,
@@ -288,8 +372,18 @@ TORPEDO_BODY = {
     "stiffness_atoms": atom_stiffness,
     "sliding_friction": 2.0,
     "inelasticity": 0.0,
+    "destroy_on_contact": True,
 }
 
+# Torpedoes come and go quickly. Rather than creating new ones from
+# scratch each time, they are drawn from a pool that is set up
+# ahead of time. If it runs out, it will double in size.
+TORPEDO_POOL_SIZE = 64
+
+# The number of body slots shared with the visualization.
+# Bodies in slots past this aren't drawn.
+STATE_BLOCK_SLOTS = 1024
+
 A0_BODY = {
     "type": "a0",
     "x": 3,
@@ -356,29 +450,39 @@ A02_BODY = {
 }
 """
 
+# The walls around the edge of the world reach a little past
+# its corners, so that a body jammed into a corner still
+# feels both of them. They are infinitely thick, so that
+# nothing gets pushed out of the world through them.
+wall_overhang = 1.0
+
 right_wall = {
     "x_left": WORLD_WIDTH,
-    "y_left": 1.0,
+    "y_left": WORLD_HEIGHT + wall_overhang,
     "x_right": WORLD_WIDTH,
-    "y_right": 0.0,
+    "y_right": -wall_overhang,
+    "thickness": np.inf,
 }
 left_wall = {
     "x_left": 0.0,
-    "y_left": 0.0,
+    "y_left": -wall_overhang,
     "x_right": 0.0,
-    "y_right": 1.0,
+    "y_right": WORLD_HEIGHT + wall_overhang,
+    "thickness": np.inf,
 }
 floor = {
-    "x_left": 1.0,
+    "x_left": WORLD_WIDTH + wall_overhang,
     "y_left": 0.0,
-    "x_right": 0.0,
+    "x_right": -wall_overhang,
     "y_right": 0.0,
+    "thickness": np.inf,
 }
 ceiling = {
-    "x_left": 0.0,
+    "x_left": -wall_overhang,
     "y_left": WORLD_HEIGHT,
-    "x_right": 1.0,
+    "x_right": WORLD_WIDTH + wall_overhang,
     "y_right": WORLD_HEIGHT,
+    "thickness": np.inf,
 }
 
 WALLS = [
@@ -407,6 +511,11 @@ DASH_Y = 50  # pixels from the top
 DASH_WIDTH = 600  # In pixels
 DASH_HEIGHT = 300  # In pixels
 
+# The step durations are handed to the dashboard through a ring buffer
+# in shared memory. It holds enough for the dashboard to fall a couple
+# of seconds behind without losing any.
+DASH_DURATION_RING_SIZE = 2 * CLOCK_FREQ_SIM
+
 DASH_BACKGROUND_COLOR = "#222222"
 DASH_FOREGROUND_COLOR = "#FFFFFF"
 DASH_SECOND_COLOR = "#888888"
@@ -422,6 +531,12 @@ DASH_LABEL_PARAMS = {
     "color": DASH_SECOND_COLOR,
     "fontsize": 9,
 }
+DASH_TIMING_TEXT_PARAMS = {
+    "color": DASH_SECOND_COLOR,
+    "fontsize": 7,
+    "family": "monospace",
+    "verticalalignment": "top",
+}
 DASH_X_TICK_LABELS = ["60", "45", "30", "15", "now"]
 DASH_Y_TICK_LABELS = ["50%", "100%", "150%", "200%"]
 DASH_X_TICK_POSITIONS = [-59, -45, -30, -15, 0]
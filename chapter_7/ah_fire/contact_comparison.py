@@ -0,0 +1,123 @@
+"""
+Compare the time it takes to step a crowded world when contact forces
+are calculated on a single thread and when they are split across
+1 to N threads.
+
+The world is filled with asteroids packed tightly enough that each one
+overlaps its neighbors. Next to each time is the number of cached
+pairs of atoms whose contact forces get calculated each step,
+and how many of the asteroids are touching something.
+"""
+from time import perf_counter
+import numpy as np
+from numba import get_num_threads, set_num_threads
+
+import config
+from body import Body
+from walls import Walls
+from world import World
+
+n_reps = 10
+atom_counts = [1000, 10000, 100000]
+
+
+def create_world(n_atoms, parallel):
+    np.random.seed(0)
+    params = dict(config.A0_BODY)
+    params["id"] = "a0"
+    template = Body(params)
+    n_bodies = int(np.ceil(n_atoms / template.n_atoms))
+
+    # Pack the asteroids on a square lattice, close enough to touch.
+    # Their outermost atoms sit inside the radius, so at much more
+    # than 1.7 radii apart they would miss each other entirely.
+    spacing = 1.7 * template.radius
+    n_side = int(np.ceil(n_bodies**0.5))
+    width = (n_side + 1) * spacing
+
+    # The walls bound the arena, so make them infinitely thick.
+    walls = Walls(thickness=np.inf)
+    overhang = spacing
+    for x_left, y_left, x_right, y_right in [
+        (width, width + overhang, width, -overhang),
+        (0, -overhang, 0, width + overhang),
+        (width + overhang, 0, -overhang, 0),
+        (-overhang, width, width + overhang, width),
+    ]:
+        walls.add_wall(
+            {
+                "x_left": x_left,
+                "y_left": y_left,
+                "x_right": x_right,
+                "y_right": y_right,
+            }
+        )
+
+    world = World(
+        walls,
+        2 * template.radius,
+        parallel=parallel,
+        width=width,
+        height=width,
+    )
+    for i_body in range(n_bodies):
+        params["id"] = f"a0_{i_body:06}"
+        params["x"] = (i_body % n_side + 1) * spacing
+        params["y"] = (i_body // n_side + 1) * spacing
+        params["v_x"] = 0.5 - np.random.sample()
+        params["v_y"] = 0.5 - np.random.sample()
+        params["v_rot"] = 0.5 - np.random.sample()
+        world.add_body(Body(params))
+
+    # Ensure jitted functions are pre-compiled
+    world.step()
+    return world
+
+
+def time_world(world):
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        world.step()
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+def contact_counts(world):
+    n = world.n_bodies
+    return (
+        f"    {world.n_contacts:7d} contacts"
+        + f"    {np.sum(world.is_contacting[:n]):6d} of {n} touching"
+    )
+
+
+max_threads = get_num_threads()
+thread_counts = [1]
+while thread_counts[-1] * 2 <= max_threads:
+    thread_counts.append(thread_counts[-1] * 2)
+if thread_counts[-1] < max_threads:
+    thread_counts.append(max_threads)
+
+for n_atoms in atom_counts:
+    print()
+    print(f"{n_atoms} atoms")
+
+    world = create_world(n_atoms, parallel=False)
+    serial_time = time_world(world)
+    print(
+        f"    single-threaded     {1000 * serial_time:8.2f} ms"
+        + " " * 10
+        + contact_counts(world)
+    )
+
+    world = create_world(n_atoms, parallel=True)
+    for n_threads in thread_counts:
+        set_num_threads(n_threads)
+        parallel_time = time_world(world)
+        print(
+            f"    {n_threads:3d} threads         "
+            + f"{1000 * parallel_time:8.2f} ms"
+            + f"    {serial_time / parallel_time:5.2f}x"
+            + contact_counts(world)
+        )
+    set_num_threads(max_threads)
@@ -9,9 +9,13 @@ from tools.pacemaker import Pacemaker
 import config
 
 
-def run(sim_dash_duration_q, run_dash_alive_q, dash_run_alive_q):
+def run(sim_dash_duration_ring, heartbeats, timing_stats):
     frame = Frame()
-    pacemaker = Pacemaker(config.CLOCK_FREQ_DASH)
+    pacemaker = Pacemaker(
+        config.CLOCK_FREQ_DASH,
+        timing_stats=timing_stats,
+        process_name="dash",
+    )
     n_alive_check = int(config.CLOCK_FREQ_DASH / config.ALIVE_CHECK_FREQ)
     i_alive_check = 0
 
@@ -20,28 +24,27 @@ def run(sim_dash_duration_q, run_dash_alive_q, dash_run_alive_q):
 
         # Send a heartbeat from this process to the parent runner process,
         # reassuring it that everything here is okie dokie.
-        dash_run_alive_q.put(True)
+        heartbeats.beat("dash")
 
         # Watch for a heartbeat from the parent runner process.
         # If it is not found, then shut down this process too.
         i_alive_check += 1
 
         if i_alive_check == n_alive_check:
-            runner_is_alive = False
-            while not run_dash_alive_q.empty():
-                runner_is_alive = run_dash_alive_q.get()
-            if not runner_is_alive:
+            if not heartbeats.is_alive("run", config.HEARTBEAT_TIMEOUT):
                 print("Runner process has shut down.")
                 print("Shutting down dashboard process.")
                 os._exit(os.EX_OK)
             else:
                 i_alive_check = 0
 
-        while not sim_dash_duration_q.empty():
-            duration = sim_dash_duration_q.get()
-            frame.update_history(duration)
+        # Collect all the step durations since the last update at once.
+        durations, n_lost = sim_dash_duration_ring.read_all()
+        if n_lost > 0:
+            print(f"Dashboard fell behind. Lost {n_lost} step durations.")
+        frame.update_history(durations)
 
-        frame.update()
+        frame.update(timing_stats.read())
 
 
 class Frame:
@@ -130,23 +133,60 @@ class Frame:
         self.line = self.ax.plot(
             time_values, self.one_minute_history, **config.DASH_LINE_PARAMS
         )[0]
+        # A summary of how well each process is keeping time
+        self.timing_text = self.fig.text(
+            config.DASH_BORDER,
+            0.97,
+            "",
+            **config.DASH_TIMING_TEXT_PARAMS,
+        )
+
         self.ax.set_xlabel(config.DASH_X_LABEL, **config.DASH_LABEL_PARAMS)
         self.ax.set_ylabel(config.DASH_Y_LABEL, **config.DASH_LABEL_PARAMS)
 
         plt.ion()
         plt.show()
 
-    def update_history(self, duration):
-        duration_cycles = duration * config.CLOCK_FREQ_SIM
-        self.one_second_history[self.i_sample] = duration_cycles
-        self.i_sample += 1
-        if self.i_sample == self.n_samples:
-            self.i_sample = 0
-            p90 = np.percentile(self.one_second_history, 90)
-            self.one_minute_history[0] = p90
-            self.one_minute_history = np.roll(self.one_minute_history, -1)
-
-    def update(self):
+    def update_history(self, durations):
+        durations_cycles = durations * config.CLOCK_FREQ_SIM
+        i_start = 0
+        while i_start < durations_cycles.size:
+            # Fill in as much of the current second as there is room for.
+            n_copy = min(
+                self.n_samples - self.i_sample,
+                durations_cycles.size - i_start,
+            )
+            self.one_second_history[
+                self.i_sample : self.i_sample + n_copy
+            ] = durations_cycles[i_start : i_start + n_copy]
+            self.i_sample += n_copy
+            i_start += n_copy
+
+            if self.i_sample == self.n_samples:
+                self.i_sample = 0
+                p90 = np.percentile(self.one_second_history, 90)
+                self.one_minute_history[0] = p90
+                self.one_minute_history = np.roll(
+                    self.one_minute_history, -1
+                )
+
+    def update(self, timing):
+        lines = []
+        for process_name, summary in timing.items():
+            if summary is None:
+                lines.append(f"{process_name:5s} stale")
+                continue
+            # The percentiles are over the last second or so,
+            # to show how each process is doing right now.
+            lines.append(
+                f"{process_name:5s}"
+                + f" late p99 {1e3 * summary['interval_lateness_p99']:6.2f} ms"
+                + f"  work p99 {1e3 * summary['interval_work_p99']:6.2f} ms"
+                + f"  overruns {int(summary['interval_n_overruns'])}"
+                + f" ({int(summary['n_overruns'])} total)"
+            )
+        self.timing_text.set_text("\n".join(lines))
+
         self.line.set_ydata(self.one_minute_history)
         self.ax.set_ylim(0, np.maximum(2.0, np.max(self.one_minute_history)))
         self.fig.canvas.flush_events()
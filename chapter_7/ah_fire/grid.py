@@ -0,0 +1,218 @@
+import numpy as np
+from numba import njit
+import config
+
+
+class Grid:
+    """
+    A uniform grid laid over the world, used as a broad phase for
+    finding which bodies are close enough to be worth checking for contact.
+
+    Each body is filed into the cell that holds its center of gravity.
+    The cells are kept as doubly linked lists, so that from one time step
+    to the next only the bodies that have crossed into a new cell
+    need to be moved. Finding candidate pairs then only requires looking
+    in the handful of cells that a body can reach, rather than
+    checking it against every other body.
+
+    Initialize with the cell_size, ideally about twice the radius
+    of a typical body. Bodies that drift outside of the world
+    are kept in the cells along its edges.
+    """
+
+    def __init__(
+        self,
+        cell_size,
+        width=config.WORLD_WIDTH,
+        height=config.WORLD_HEIGHT,
+    ):
+        self.cell_size = cell_size
+        self.n_cols = max(1, int(np.ceil(width / cell_size)))
+        self.n_rows = max(1, int(np.ceil(height / cell_size)))
+        self.cell_head = -np.ones(self.n_cols * self.n_rows, dtype=np.int64)
+
+        self.capacity = 0
+        self.body_cell = np.zeros(0, dtype=np.int64)
+        self.body_next = np.zeros(0, dtype=np.int64)
+        self.body_prev = np.zeros(0, dtype=np.int64)
+
+        # Candidate pairs are written into this array in place.
+        # It grows if it ever runs out of room.
+        self.pairs = np.zeros((16, 2), dtype=np.int64)
+
+    def rebuild(self, x, y, alive):
+        """
+        Re-file every body from scratch. This is needed whenever
+        the number of body slots grows.
+        """
+        if x.size > self.capacity:
+            self.capacity = max(x.size, 2 * self.capacity)
+            self.body_cell = np.zeros(self.capacity, dtype=np.int64)
+            self.body_next = np.zeros(self.capacity, dtype=np.int64)
+            self.body_prev = np.zeros(self.capacity, dtype=np.int64)
+
+        self.cell_head[:] = -1
+        self.body_cell[:] = -1
+        self.update(x, y, alive)
+
+    def update(self, x, y, alive):
+        """
+        Move the bodies that have changed cells since the last update.
+        Bodies that are no longer alive are taken out of the grid.
+        """
+        update_cells_numba(
+            x,
+            y,
+            alive,
+            self.cell_size,
+            self.n_cols,
+            self.n_rows,
+            self.cell_head,
+            self.body_cell,
+            self.body_next,
+            self.body_prev,
+        )
+
+    def find_pairs(self, x, y, r, active):
+        """
+        Return an (n_pairs, 2) array of the indices of bodies
+        whose bounding circles overlap. In each pair the first index
+        is always lower than the second.
+
+        Only pairs with at least one active body in them are returned.
+        Pairs of bodies that are both inactive, say because they
+        are asleep, are skipped.
+        """
+        r_max = np.max(r) if r.size > 0 else 0.0
+        while True:
+            n_pairs = find_pairs_numba(
+                x,
+                y,
+                r,
+                active,
+                r_max,
+                self.cell_size,
+                self.n_cols,
+                self.n_rows,
+                self.cell_head,
+                self.body_next,
+                self.pairs,
+            )
+            if n_pairs <= self.pairs.shape[0]:
+                return self.pairs[:n_pairs]
+            self.pairs = np.zeros((2 * n_pairs, 2), dtype=np.int64)
+
+
+@njit(cache=True)
+def cell_index_numba(position, cell_size, n_cells):
+    # Clamp to the edges of the grid so that no body is ever lost.
+    i_cell = int(position / cell_size)
+    if position < 0:
+        i_cell = 0
+    if i_cell > n_cells - 1:
+        i_cell = n_cells - 1
+    return i_cell
+
+
+@njit(cache=True)
+def update_cells_numba(
+    x,
+    y,
+    alive,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_cell,
+    body_next,
+    body_prev,
+):
+    for i_body in range(x.size):
+        i_cell_old = body_cell[i_body]
+        if not alive[i_body]:
+            i_cell = -1
+        else:
+            i_col = cell_index_numba(x[i_body], cell_size, n_cols)
+            i_row = cell_index_numba(y[i_body], cell_size, n_rows)
+            i_cell = i_row * n_cols + i_col
+        if i_cell == i_cell_old:
+            continue
+
+        # Unlink the body from its old cell.
+        if i_cell_old >= 0:
+            if body_prev[i_body] >= 0:
+                body_next[body_prev[i_body]] = body_next[i_body]
+            else:
+                cell_head[i_cell_old] = body_next[i_body]
+            if body_next[i_body] >= 0:
+                body_prev[body_next[i_body]] = body_prev[i_body]
+
+        body_cell[i_body] = i_cell
+        if i_cell < 0:
+            continue
+
+        # Link it in at the head of its new cell.
+        body_prev[i_body] = -1
+        body_next[i_body] = cell_head[i_cell]
+        if cell_head[i_cell] >= 0:
+            body_prev[cell_head[i_cell]] = i_body
+        cell_head[i_cell] = i_body
+
+
+@njit(cache=True)
+def find_pairs_numba(
+    x,
+    y,
+    r,
+    active,
+    r_max,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_next,
+    pairs,
+):
+    """
+    Returns the number of overlapping pairs found. If that is more than
+    will fit in pairs, only the first ones are written and the caller
+    needs to try again with a bigger array.
+
+    Only active bodies are searched around, so the cost grows with
+    the number of active bodies. Inactive bodies that are still in
+    the grid are found as neighbors of the active ones.
+    """
+    n_pairs = 0
+    capacity = pairs.shape[0]
+    for i_body in range(x.size):
+        if not active[i_body]:
+            continue
+
+        # Any body that can touch this one will have its center
+        # no further away than this.
+        reach = r[i_body] + r_max
+        col_lo = cell_index_numba(x[i_body] - reach, cell_size, n_cols)
+        col_hi = cell_index_numba(x[i_body] + reach, cell_size, n_cols)
+        row_lo = cell_index_numba(y[i_body] - reach, cell_size, n_rows)
+        row_hi = cell_index_numba(y[i_body] + reach, cell_size, n_rows)
+
+        for i_row in range(row_lo, row_hi + 1):
+            for i_col in range(col_lo, col_hi + 1):
+                j_body = cell_head[i_row * n_cols + i_col]
+                while j_body >= 0:
+                    # Only count each pair once. Pairs of active bodies
+                    # get counted from the lower index. Pairs with
+                    # an inactive body only get counted from the active one.
+                    if j_body > i_body or not active[j_body]:
+                        d_x = x[i_body] - x[j_body]
+                        d_y = y[i_body] - y[j_body]
+                        distance = (d_x**2 + d_y**2) ** 0.5
+                        compression = r[i_body] + r[j_body] - distance
+                        if compression > 0:
+                            if n_pairs < capacity:
+                                pairs[n_pairs, 0] = min(i_body, j_body)
+                                pairs[n_pairs, 1] = max(i_body, j_body)
+                            n_pairs += 1
+                    j_body = body_next[j_body]
+
+    return n_pairs
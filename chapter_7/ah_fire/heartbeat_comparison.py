@@ -0,0 +1,107 @@
+"""
+Compare the overhead that keeping in touch with the other processes
+adds to each pass through the simulation loop.
+
+The old way puts a heartbeat on a Queue every step, drains the runner's
+Queue once per second, and checks the keypress Queue every step.
+The new way posts a heartbeat to shared memory every step, reads the
+runner's heartbeat once per second, and checks the keypress Queue
+only a hundred times per second.
+
+In both cases a separate runner process keeps up its end at 4 Hz.
+"""
+import multiprocessing as mp
+import time
+from time import perf_counter
+
+import config
+from tools.heartbeat import Heartbeats
+
+n_steps = 100000
+n_alive_check = int(config.CLOCK_FREQ_SIM / config.ALIVE_CHECK_FREQ)
+steps_per_key_check = int(config.CLOCK_FREQ_SIM / config.KEY_CHECK_FREQ)
+
+
+def queue_runner(run_sim_alive_q, sim_run_alive_q, done):
+    while not done.is_set():
+        time.sleep(1 / config.CLOCK_FREQ_RUN)
+        run_sim_alive_q.put(True)
+        while not sim_run_alive_q.empty():
+            sim_run_alive_q.get()
+
+
+def heartbeat_runner(heartbeats, done):
+    while not done.is_set():
+        time.sleep(1 / config.CLOCK_FREQ_RUN)
+        heartbeats.beat("run")
+        heartbeats.is_alive("sim", config.HEARTBEAT_TIMEOUT)
+
+
+def time_queues():
+    keys_sim_keys_q = mp.Queue()
+    run_sim_alive_q = mp.Queue()
+    sim_run_alive_q = mp.Queue()
+    done = mp.Event()
+    p_run = mp.Process(
+        target=queue_runner, args=(run_sim_alive_q, sim_run_alive_q, done)
+    )
+    p_run.start()
+
+    i_alive_check = 0
+    start = perf_counter()
+    for i_step in range(n_steps):
+        sim_run_alive_q.put(True)
+        i_alive_check += 1
+        if i_alive_check == n_alive_check:
+            while not run_sim_alive_q.empty():
+                run_sim_alive_q.get()
+            i_alive_check = 0
+
+        while not keys_sim_keys_q.empty():
+            keys_sim_keys_q.get()
+    elapsed = perf_counter() - start
+
+    done.set()
+    p_run.join()
+    return elapsed / n_steps
+
+
+def time_heartbeats():
+    keys_sim_keys_q = mp.Queue()
+    heartbeats = Heartbeats(["run", "sim"], create=True)
+    done = mp.Event()
+    p_run = mp.Process(target=heartbeat_runner, args=(heartbeats, done))
+    p_run.start()
+
+    i_alive_check = 0
+    steps_since_key_check = 0
+    start = perf_counter()
+    for i_step in range(n_steps):
+        heartbeats.beat("sim")
+        i_alive_check += 1
+        if i_alive_check == n_alive_check:
+            heartbeats.is_alive("run", config.HEARTBEAT_TIMEOUT)
+            i_alive_check = 0
+
+        steps_since_key_check += 1
+        if steps_since_key_check >= steps_per_key_check:
+            while not keys_sim_keys_q.empty():
+                keys_sim_keys_q.get()
+            steps_since_key_check = 0
+    elapsed = perf_counter() - start
+
+    done.set()
+    p_run.join()
+    heartbeats.close()
+    heartbeats.unlink()
+    return elapsed / n_steps
+
+
+if __name__ == "__main__":
+    mp.set_start_method("fork")
+    queue_time = time_queues()
+    heartbeat_time = time_heartbeats()
+    print(f"Overhead per simulation step, {n_steps} steps")
+    print(f"    Queues          {1e6 * queue_time:8.3f} us")
+    print(f"    shared memory   {1e6 * heartbeat_time:8.3f} us")
+    print(f"    {queue_time / heartbeat_time:5.1f}x faster")
@@ -0,0 +1,94 @@
+"""
+Find the longest physics time step that each integrator can take
+and still keep the simulation stable, and how long it takes
+to simulate one second at that time step.
+
+The ship and the asteroid are sent careening around the arena,
+bouncing off the walls and each other. A time step counts as stable
+if, over the whole run, nothing escapes the arena, and the kinetic
+energy never climbs much above what they started with. Contacts
+can only take energy away, so any gain is the integrator's doing.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from sim import Simulation
+
+duration = 5.0  # seconds
+energy_limit = 1.2
+dts = [0.001, 0.002, 0.003, 0.004, 0.006, 0.008, 0.012, 0.016, 0.024, 0.032]
+
+
+def kinetic_energy(world):
+    n = world.n_bodies
+    moving = world.alive[:n] & world.free[:n]
+    return np.sum(
+        (
+            0.5 * world.m[:n] * (world.v_x[:n] ** 2 + world.v_y[:n] ** 2)
+            + 0.5 * world.rot_inertia[:n] * world.v_rot[:n] ** 2
+        )[moving]
+    )
+
+
+def run(integrator, dt):
+    """
+    Returns whether the run stayed stable, and how long it took
+    to simulate one second.
+    """
+    sim = Simulation()
+    world = sim.world
+    world.integrator = integrator
+    world.sleep_steps = 0
+    i_ship = world.index[sim.ship_id]
+    i_asteroid = 1 - i_ship
+    world.v_x[i_ship] = 3.0
+    world.v_y[i_ship] = 2.0
+    world.v_rot[i_ship] = 4.0
+    world.v_x[i_asteroid] = -2.0
+    world.v_y[i_asteroid] = -1.5
+    world.v_rot[i_asteroid] = -1.0
+    # Ensure jitted functions are pre-compiled
+    world.step(dt)
+    energy_start = kinetic_energy(world)
+
+    n_steps = int(duration / dt)
+    margin = 1.0
+    total_time = 0
+    for _ in range(n_steps):
+        start = perf_counter()
+        world.step(dt)
+        total_time += perf_counter() - start
+        n = world.n_bodies
+        x = world.x[:n][world.alive[:n]]
+        y = world.y[:n][world.alive[:n]]
+        if (
+            not np.all(np.isfinite(x))
+            or np.any(x < -margin)
+            or np.any(x > config.WORLD_WIDTH + margin)
+            or np.any(y < -margin)
+            or np.any(y > config.WORLD_HEIGHT + margin)
+            or kinetic_energy(world) > energy_limit * energy_start
+        ):
+            return False, None
+    return True, total_time / duration
+
+
+print(f"Bouncing around the arena for {duration} s")
+print("  integrator   longest stable step   time per simulated second")
+for integrator in config.INTEGRATORS:
+    longest = None
+    cost = None
+    for dt in dts:
+        is_stable, time_per_second = run(integrator, dt)
+        if not is_stable:
+            break
+        longest = dt
+        cost = time_per_second
+    if longest is None:
+        print(f"  {integrator:10}   none of them")
+        continue
+    print(
+        f"  {integrator:10}   {1000 * longest:11.1f} ms"
+        + f"         {1000 * cost:11.2f} ms"
+    )
@@ -0,0 +1,79 @@
+"""
+Keep Numba's on-disk cache of compiled kernels from going stale.
+
+Kernels compiled with cache=True are saved in __pycache__, and loaded
+from there the next time they are called. Numba throws out a saved
+kernel when the file it lives in changes, but it doesn't look at
+the files of the kernels it calls. After an edit to body.py,
+the kernels in world.py that call into it would carry on
+running the old body.py code.
+
+clear_stale() covers for this. CACHED_MODULES lists every module
+with cache=True kernels, along with the modules whose kernels they
+call. Any cache file older than the most recent edit to one of those
+gets deleted, so the kernels in it are compiled afresh.
+"""
+import glob
+import os
+
+here = os.path.dirname(os.path.abspath(__file__))
+cache_dir = os.path.join(here, "__pycache__")
+
+# Every module with cache=True kernels, and the modules
+# whose kernels they call, directly or through another module.
+CACHED_MODULES = {
+    "body": [],
+    "grid": [],
+    "world": ["body", "grid"],
+    "world_batch": ["world", "body", "grid"],
+}
+
+
+def cache_files(module):
+    """
+    The index (.nbi) and data (.nbc) files of module's cached kernels.
+    """
+    return glob.glob(os.path.join(cache_dir, f"{module}.*.nb[ci]"))
+
+
+def remove(paths):
+    for path in paths:
+        # Another process may have got to it first.
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def clear():
+    """
+    Delete the cached kernels of every module in CACHED_MODULES.
+    """
+    for module in CACHED_MODULES:
+        remove(cache_files(module))
+
+
+def clear_stale():
+    """
+    Delete every cache file that is older than the latest edit
+    to its module, or to any module it depends on.
+    Returns the names of the modules that had files deleted.
+
+    Numba can cope with an index file that refers to a deleted data
+    file. It compiles that kernel again and saves it alongside the rest.
+    """
+    cleared = []
+    for module, dependencies in CACHED_MODULES.items():
+        edited = max(
+            os.path.getmtime(os.path.join(here, f"{name}.py"))
+            for name in [module] + dependencies
+        )
+        stale = [
+            path
+            for path in cache_files(module)
+            if os.path.getmtime(path) < edited
+        ]
+        if len(stale) > 0:
+            remove(stale)
+            cleared.append(module)
+    return cleared
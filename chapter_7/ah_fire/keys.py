@@ -6,7 +6,7 @@ from getkey import getkey, keys
 import config
 
 
-def run(keys_sim_keys_q, run_keys_alive_q):
+def run(keys_sim_keys_q, heartbeats):
     alive_check_interval = 1 / config.ALIVE_CHECK_FREQ
     last_alive_check = time.time()
     time_last_keypress = time.time()
@@ -22,10 +22,7 @@ def run(keys_sim_keys_q, run_keys_alive_q):
         key = getkey()
 
         if (time.time() - last_alive_check) > alive_check_interval:
-            runner_is_alive = False
-            while not run_keys_alive_q.empty():
-                runner_is_alive = run_keys_alive_q.get()
-            if not runner_is_alive:
+            if not heartbeats.is_alive("run", config.HEARTBEAT_TIMEOUT):
                 os._exit(os.EX_OK)
             else:
                 last_alive_check = time.time()
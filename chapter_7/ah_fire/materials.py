@@ -0,0 +1,81 @@
+import numpy as np
+
+
+class Materials:
+    """
+    Every atom is made of a material, a combination of stiffness,
+    sliding friction, and inelasticity. When two atoms press into
+    each other, the coefficients of their two materials get combined.
+    The stiffnesses combine like two springs in series, and the friction
+    and inelasticity coefficients get averaged.
+
+    None of these ever change once a material is created, so rather
+    than combining them again for every pair of atoms on every
+    time step, the combinations for every pair of materials are worked
+    out up front and kept in tables. pair_stiffness[i, j] is the
+    stiffness of a contact between material i and material j,
+    and the same goes for pair_sliding_friction and pair_inelasticity.
+
+    Walls are made of a material too, one with infinite stiffness.
+    Nothing about a wall gives, so in a contact with a wall
+    the atom's own stiffness is all that counts.
+
+    The tables are kept in dtype, to match the per-atom arrays
+    they get combined with.
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = dtype
+        self.stiffness = np.zeros(0)
+        self.sliding_friction = np.zeros(0)
+        self.inelasticity = np.zeros(0)
+        self.ids = {}
+        self.count = 0
+        self.pair_stiffness = np.zeros((0, 0), dtype=dtype)
+        self.pair_sliding_friction = np.zeros((0, 0), dtype=dtype)
+        self.pair_inelasticity = np.zeros((0, 0), dtype=dtype)
+
+    def add(self, stiffness, sliding_friction, inelasticity):
+        """
+        Returns the id of the material with these coefficients,
+        creating it if it doesn't exist yet.
+        """
+        key = (float(stiffness), float(sliding_friction), float(inelasticity))
+        if key in self.ids:
+            return self.ids[key]
+
+        i_material = self.count
+        self.ids[key] = i_material
+        self.stiffness = np.append(self.stiffness, key[0])
+        self.sliding_friction = np.append(self.sliding_friction, key[1])
+        self.inelasticity = np.append(self.inelasticity, key[2])
+        self.count += 1
+
+        n = self.count
+        self.pair_stiffness = np.zeros((n, n), dtype=self.dtype)
+        self.pair_sliding_friction = np.zeros((n, n), dtype=self.dtype)
+        self.pair_inelasticity = np.zeros((n, n), dtype=self.dtype)
+        for i in range(n):
+            for j in range(n):
+                self.pair_stiffness[i, j] = combine_stiffness(
+                    self.stiffness[i], self.stiffness[j]
+                )
+                self.pair_sliding_friction[i, j] = (
+                    self.sliding_friction[i] + self.sliding_friction[j]
+                ) / 2
+                self.pair_inelasticity[i, j] = (
+                    self.inelasticity[i] + self.inelasticity[j]
+                ) / 2
+        return i_material
+
+
+def combine_stiffness(k_a, k_b):
+    """
+    The stiffness of two springs pushing against each other.
+    """
+    if np.isinf(k_a):
+        return k_b
+    if np.isinf(k_b):
+        return k_a
+    epsilon = 1e-12
+    return 1 / ((1 / (k_a + epsilon)) + (1 / (k_b + epsilon)))
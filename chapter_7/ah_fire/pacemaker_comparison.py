@@ -0,0 +1,43 @@
+"""
+Compare how closely the Pacemaker keeps to its beat when it relies on
+time.sleep() alone, and when it sleeps most of the way and then
+busy-waits the rest, at a few different clock frequencies.
+
+Lateness is how long after each beat was due that the loop woke up.
+CPU is the fraction of the time the process spent running
+rather than sleeping.
+"""
+import time
+from tools.pacemaker import Pacemaker
+
+run_duration = 2  # seconds
+clock_freqs = [100, 1000, 10000]
+
+
+def time_pacemaker(clock_freq, spin):
+    pacemaker = Pacemaker(clock_freq, spin=spin)
+    n_beats = int(run_duration * clock_freq)
+    wall_start = time.monotonic()
+    cpu_start = time.process_time()
+    for _ in range(n_beats):
+        pacemaker.beat()
+    cpu_fraction = (time.process_time() - cpu_start) / (
+        time.monotonic() - wall_start
+    )
+    return pacemaker.jitter_stats(), cpu_fraction, pacemaker.spin_margin
+
+
+for clock_freq in clock_freqs:
+    print()
+    print(f"{clock_freq} Hz")
+    print("               lateness (us)")
+    print("              median     p99     max     CPU")
+    for spin in [False, True]:
+        stats, cpu_fraction, margin = time_pacemaker(clock_freq, spin)
+        label = "sleep + spin" if spin else "sleep      "
+        print(
+            f"  {label}  {1e6 * stats['p50']:7.1f} "
+            + f"{1e6 * stats['p99']:7.1f} {1e6 * stats['max']:7.1f}"
+            + f"  {100 * cpu_fraction:5.1f}%"
+        )
+    print(f"  spin margin {1e6 * margin:.1f} us")
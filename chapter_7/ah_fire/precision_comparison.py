@@ -0,0 +1,183 @@
+"""
+Compare each of config.PRECISIONS against a float64 reference run.
+
+First the ship and the asteroid are sent careening around the arena,
+bouncing off the walls and each other, once at each precision.
+At a few points along the way, the distance between where each body
+is and where it is in the float64 run gets reported. Contacts make
+the motion chaotic, so small rounding differences grow over time.
+The report shows how quickly.
+
+Then a world crowded with touching asteroids is stepped at each
+precision, to see how long a step takes, how much of that goes to
+the contact forces between atoms, and how much memory the per-atom
+arrays take up.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from body import Body
+from sim import Simulation
+from walls import Walls
+from world import ATOM_FIELDS, World, contact_forces_numba
+
+# The points in simulated time, in seconds, where the runs get compared
+checkpoints = [0.5, 1.0, 2.0, 5.0, 10.0]
+n_atoms_crowd = 200_000
+n_reps = 20
+
+
+def trajectory(precision):
+    """
+    Returns the positions of the ship and the asteroid at each checkpoint.
+    """
+    sim = Simulation(overrides={"PRECISION": precision})
+    world = sim.world
+    world.sleep_steps = 0
+    i_ship = world.index[sim.ship_id]
+    i_asteroid = 1 - i_ship
+    world.v_x[i_ship] = 3.0
+    world.v_y[i_ship] = 2.0
+    world.v_rot[i_ship] = 4.0
+    world.v_x[i_asteroid] = -2.0
+    world.v_y[i_asteroid] = -1.5
+    world.v_rot[i_asteroid] = -1.0
+
+    positions = []
+    i_step = 0
+    for t_checkpoint in checkpoints:
+        while i_step < int(t_checkpoint * config.PHYSICS_FREQ):
+            world.step()
+            i_step += 1
+        positions.append(
+            np.array([world.x[:2], world.y[:2]]).transpose().copy()
+        )
+    return np.array(positions)
+
+
+def create_crowd(precision):
+    np.random.seed(0)
+    params = dict(config.A0_BODY)
+    params["id"] = "a0"
+    template = Body(params)
+    n_bodies = int(np.ceil(n_atoms_crowd / template.n_atoms))
+
+    # Pack the asteroids on a square lattice, close enough that
+    # every one of them is touching its neighbors.
+    spacing = 1.7 * template.radius
+    n_side = int(np.ceil(n_bodies**0.5))
+    width = (n_side + 1) * spacing
+
+    # The walls bound the arena, so make them infinitely thick.
+    walls = Walls(thickness=np.inf)
+    overhang = spacing
+    for x_left, y_left, x_right, y_right in [
+        (width, width + overhang, width, -overhang),
+        (0, -overhang, 0, width + overhang),
+        (width + overhang, 0, -overhang, 0),
+        (-overhang, width, width + overhang, width),
+    ]:
+        walls.add_wall(
+            {
+                "x_left": x_left,
+                "y_left": y_left,
+                "x_right": x_right,
+                "y_right": y_right,
+            }
+        )
+
+    world = World(
+        walls,
+        2 * template.radius,
+        width=width,
+        height=width,
+        precision=precision,
+    )
+    world.sleep_steps = n_reps + 1
+    for i_body in range(n_bodies):
+        params["id"] = f"a0_{i_body:06}"
+        params["x"] = (i_body % n_side + 1) * spacing
+        params["y"] = (i_body // n_side + 1) * spacing
+        params["v_x"] = 0.5 - np.random.sample()
+        params["v_y"] = 0.5 - np.random.sample()
+        params["v_rot"] = 0.5 - np.random.sample()
+        world.add_body(Body(params))
+
+    # Ensure jitted functions are pre-compiled
+    world.step()
+    return world
+
+
+def time_world(world):
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        world.step()
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+def time_contacts(world):
+    """
+    Time just the contact forces between the cached pairs of atoms.
+    This is short enough to be thrown off by whatever else the machine
+    is doing, so the fastest of the repetitions gets reported.
+    """
+    materials = world.materials
+    args = (
+        0,
+        world.n_contacts,
+        world.contacts,
+        world.alive,
+        world.active,
+        materials.pair_stiffness,
+        materials.pair_sliding_friction,
+        materials.pair_inelasticity,
+        world.material_atoms,
+        world.r_atoms,
+        world.x_atoms,
+        world.y_atoms,
+        world.v_x_atoms,
+        world.v_y_atoms,
+        world.f_x_atoms,
+        world.f_y_atoms,
+        world.is_contacting,
+    )
+    # Ensure it's compiled for this precision before timing it
+    contact_forces_numba(*args)
+    best_time = np.inf
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        contact_forces_numba(*args)
+        best_time = min(best_time, perf_counter() - start)
+    return best_time
+
+
+print("Distance from the float64 run, after simulating for t seconds")
+print("  precision  " + "".join(f"{t:8.1f} s" for t in checkpoints))
+reference = trajectory("float64")
+for precision in config.PRECISIONS:
+    positions = trajectory(precision)
+    # The worst of the two bodies at each checkpoint
+    distance = np.max(
+        np.sqrt(np.sum((positions - reference) ** 2, axis=2)), axis=1
+    )
+    print(f"  {precision:9}  " + "".join(f"{d:10.1e}" for d in distance))
+
+print()
+print(f"Stepping {n_atoms_crowd} atoms, all touching")
+print(
+    "  precision   time per step   contact forces   contacts"
+    + "   per-atom arrays"
+)
+for precision in config.PRECISIONS:
+    world = create_crowd(precision)
+    step_time = time_world(world)
+    contact_time = time_contacts(world)
+    n_bytes = sum(getattr(world, name).nbytes for name, _ in ATOM_FIELDS)
+    print(
+        f"  {precision:9}   {1000 * step_time:10.2f} ms"
+        + f"   {1000 * contact_time:11.2f} ms   {world.n_contacts:8d}"
+        + f"   {n_bytes / 2**20:12.2f} MB"
+    )
@@ -0,0 +1,193 @@
+"""
+Compare the time it takes to place the atoms of many spinning bodies
+
+  - the old way, working out the cosine and sine of the body's angle
+    again for every atom,
+  - working out the body's rotation once and sharing it with all
+    of its atoms, and
+  - turning the body's rotation from the last step by a small angle,
+    without calling any trig functions at all.
+
+The same total number of atoms is split up into bodies of different
+sizes, from many small bodies to a few big ones.
+"""
+import math
+from time import perf_counter
+import numpy as np
+from numba import njit
+
+from body import place_atoms_rotated_numba, turn_numba
+
+n_reps = 50
+n_atoms_total = 100_000
+atoms_per_body = [10, 100, 1000]
+d_angle = 0.01
+
+
+@njit
+def place_atoms_per_atom_trig(
+    x_atoms_local,
+    y_atoms_local,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    x,
+    y,
+    angle,
+    v_x,
+    v_y,
+    v_rot,
+):
+    """
+    The old way. The cosine and sine get called again for every atom.
+    """
+    for i_atom in range(x_atoms.size):
+        x_atom_rel = x_atoms_local[i_atom] * math.cos(angle) - y_atoms_local[
+            i_atom
+        ] * math.sin(angle)
+        y_atom_rel = y_atoms_local[i_atom] * math.cos(angle) + x_atoms_local[
+            i_atom
+        ] * math.sin(angle)
+        v_x_atom_rel = -v_rot * y_atom_rel
+        v_y_atom_rel = v_rot * x_atom_rel
+        x_atoms[i_atom] = x + x_atom_rel
+        y_atoms[i_atom] = y + y_atom_rel
+        v_x_atoms[i_atom] = v_x + v_x_atom_rel
+        v_y_atoms[i_atom] = v_y + v_y_atom_rel
+
+
+@njit
+def step_per_atom_trig(n_atoms, x_local, y_local, x, y, v, angle):
+    for i_body in range(angle.size):
+        angle[i_body] += d_angle
+        i_start = i_body * n_atoms
+        i_end = i_start + n_atoms
+        place_atoms_per_atom_trig(
+            x_local[i_start:i_end],
+            y_local[i_start:i_end],
+            x[i_start:i_end],
+            y[i_start:i_end],
+            v[i_start:i_end],
+            v[i_start:i_end],
+            0.0,
+            0.0,
+            angle[i_body],
+            0.0,
+            0.0,
+            1.0,
+        )
+
+
+@njit
+def step_per_body_trig(n_atoms, x_local, y_local, x, y, v, angle):
+    for i_body in range(angle.size):
+        angle[i_body] += d_angle
+        i_start = i_body * n_atoms
+        i_end = i_start + n_atoms
+        place_atoms_rotated_numba(
+            x_local[i_start:i_end],
+            y_local[i_start:i_end],
+            x[i_start:i_end],
+            y[i_start:i_end],
+            v[i_start:i_end],
+            v[i_start:i_end],
+            0.0,
+            0.0,
+            math.cos(angle[i_body]),
+            math.sin(angle[i_body]),
+            0.0,
+            0.0,
+            1.0,
+        )
+
+
+@njit
+def step_incremental(
+    n_atoms, x_local, y_local, x, y, v, angle, cos_angle, sin_angle
+):
+    for i_body in range(angle.size):
+        angle[i_body], cos_angle[i_body], sin_angle[i_body] = turn_numba(
+            angle[i_body], cos_angle[i_body], sin_angle[i_body], d_angle, True
+        )
+        i_start = i_body * n_atoms
+        i_end = i_start + n_atoms
+        place_atoms_rotated_numba(
+            x_local[i_start:i_end],
+            y_local[i_start:i_end],
+            x[i_start:i_end],
+            y[i_start:i_end],
+            v[i_start:i_end],
+            v[i_start:i_end],
+            0.0,
+            0.0,
+            cos_angle[i_body],
+            sin_angle[i_body],
+            0.0,
+            0.0,
+            1.0,
+        )
+
+
+def time_it(step, *args):
+    # Ensure it's compiled before timing it
+    step(*args)
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        step(*args)
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+print(f"Placing {n_atoms_total} atoms")
+print("  atoms per body   per-atom trig   per-body trig     incremental")
+for n_atoms in atoms_per_body:
+    n_bodies = n_atoms_total // n_atoms
+    x_local = np.random.sample(n_atoms_total) - 0.5
+    y_local = np.random.sample(n_atoms_total) - 0.5
+    x = np.zeros(n_atoms_total)
+    y = np.zeros(n_atoms_total)
+    v = np.zeros(n_atoms_total)
+    angle = np.zeros(n_bodies)
+    cos_angle = np.ones(n_bodies)
+    sin_angle = np.zeros(n_bodies)
+
+    per_atom_time = time_it(
+        step_per_atom_trig, n_atoms, x_local, y_local, x, y, v, angle
+    )
+    per_body_time = time_it(
+        step_per_body_trig, n_atoms, x_local, y_local, x, y, v, angle
+    )
+    incremental_time = time_it(
+        step_incremental,
+        n_atoms,
+        x_local,
+        y_local,
+        x,
+        y,
+        v,
+        angle,
+        cos_angle,
+        sin_angle,
+    )
+    print(
+        f"  {n_atoms:14d}   {1000 * per_atom_time:10.3f} ms"
+        + f"   {1000 * per_body_time:10.3f} ms"
+        + f"   {1000 * incremental_time:10.3f} ms"
+    )
+
+# How far the incremental rotation drifts from the exact one.
+n_turns = 1_000_000
+angle = 0.0
+cos_angle = 1.0
+sin_angle = 0.0
+for _ in range(n_turns):
+    angle, cos_angle, sin_angle = turn_numba(
+        angle, cos_angle, sin_angle, d_angle, True
+    )
+error = max(abs(cos_angle - math.cos(angle)), abs(sin_angle - math.sin(angle)))
+print(
+    f"After {n_turns} incremental turns of {d_angle} radians,"
+    + f" the rotation is off by {error:.2e}"
+)
@@ -3,71 +3,82 @@ import sys
 import config
 import dash
 import keys
+from tools.heartbeat import Heartbeats
 from tools.pacemaker import Pacemaker
 import sim
+from state_block import StateBlock
+from tools.shared_ring_buffer import SharedRingBuffer
+from tools.timing_stats import TimingStats
 import viz
 
 mp.set_start_method("fork")
 
 keys_sim_keys_q = mp.Queue()
-sim_dash_duration_q = mp.Queue()
-sim_viz_state_q = mp.Queue()
 
-run_dash_alive_q = mp.Queue()
-dash_run_alive_q = mp.Queue()
-run_keys_alive_q = mp.Queue()
-run_sim_alive_q = mp.Queue()
-sim_run_alive_q = mp.Queue()
-run_viz_alive_q = mp.Queue()
-viz_run_alive_q = mp.Queue()
+# The simulation reports how long each step took to the dashboard
+# through a ring buffer in shared memory.
+sim_dash_duration_ring = SharedRingBuffer(
+    config.DASH_DURATION_RING_SIZE, create=True
+)
+
+# The simulation shares the state of its bodies with the visualization
+# through a block of shared memory. The child processes inherit it
+# when they are forked.
+state_block = StateBlock(config.STATE_BLOCK_SLOTS, create=True)
+
+# Every process posts its heartbeat here, and checks on the others here.
+heartbeats = Heartbeats(["run", "dash", "sim", "viz"], create=True)
+
+# And every process's Pacemaker posts its timing stats here.
+timing_stats = TimingStats(
+    config.TIMING_STATS_NAME, ["run", "dash", "sim", "viz"], create=True
+)
 
 
 p_dash = mp.Process(
     target=dash.run,
     args=(
-        sim_dash_duration_q,
-        run_dash_alive_q,
-        dash_run_alive_q,
+        sim_dash_duration_ring,
+        heartbeats,
+        timing_stats,
     ),
 )
 p_keys = mp.Process(
     target=keys.run,
     args=(
         keys_sim_keys_q,
-        run_keys_alive_q,
+        heartbeats,
     ),
 )
 p_sim = mp.Process(
     target=sim.run,
     args=(
         keys_sim_keys_q,
-        sim_dash_duration_q,
-        sim_viz_state_q,
-        run_sim_alive_q,
-        sim_run_alive_q,
+        sim_dash_duration_ring,
+        state_block,
+        heartbeats,
+        timing_stats,
     ),
 )
 p_viz = mp.Process(
     target=viz.run,
     args=(
-        sim_viz_state_q,
-        run_viz_alive_q,
-        viz_run_alive_q,
+        state_block,
+        heartbeats,
+        timing_stats,
     ),
 )
 
-pacemaker = Pacemaker(config.CLOCK_FREQ_RUN)
+pacemaker = Pacemaker(
+    config.CLOCK_FREQ_RUN, timing_stats=timing_stats, process_name="run"
+)
 
 # Kick off the simulation process and give it a chance to get warmed up.
+# It sends its first heartbeat once it's ready.
 p_sim.start()
-sim_warmed_up = False
-while not sim_warmed_up:
+while heartbeats.count("sim") == 0:
     pacemaker.beat()
-    run_sim_alive_q.put(True)
-
-    sim_warmed_up = False
-    while not sim_run_alive_q.empty():
-        sim_warmed_up = sim_run_alive_q.get()
+    heartbeats.beat("run")
 
 p_dash.start()
 p_viz.start()
@@ -80,37 +91,33 @@ while True:
     i_alive_check += 1
 
     # Send a health signal to the child processes.
-    run_dash_alive_q.put(True)
-    run_keys_alive_q.put(True)
-    run_sim_alive_q.put(True)
-    run_viz_alive_q.put(True)
+    heartbeats.beat("run")
 
     if i_alive_check == n_alive_check:
         all_processes_healthy = True
 
-        dash_is_alive = False
-        while not dash_run_alive_q.empty():
-            dash_is_alive = dash_run_alive_q.get()
-        if not dash_is_alive:
-            print("Dashboard process has shut down.")
-            all_processes_healthy = False
-
-        sim_is_alive = False
-        while not sim_run_alive_q.empty():
-            sim_is_alive = sim_run_alive_q.get()
-        if not sim_is_alive:
-            print("Simulation process has shut down.")
-            all_processes_healthy = False
-
-        viz_is_alive = False
-        while not viz_run_alive_q.empty():
-            viz_is_alive = viz_run_alive_q.get()
-        if not viz_is_alive:
-            print("Visualization process has shut down.")
-            all_processes_healthy = False
+        # The keys process spends most of its time blocked, waiting
+        # for a keypress, so it can't be expected to keep up a heartbeat.
+        for process_name, label in [
+            ("dash", "Dashboard"),
+            ("sim", "Simulation"),
+            ("viz", "Visualization"),
+        ]:
+            timeout = config.HEARTBEAT_TIMEOUT
+            if not heartbeats.is_alive(process_name, timeout):
+                print(f"{label} process has shut down.")
+                all_processes_healthy = False
 
         if not all_processes_healthy:
             print("Shutting down all processes.")
+            state_block.close()
+            state_block.unlink()
+            sim_dash_duration_ring.close()
+            sim_dash_duration_ring.unlink()
+            heartbeats.close()
+            heartbeats.unlink()
+            timing_stats.close()
+            timing_stats.unlink()
             sys.exit()
         else:
             i_alive_check = 0
@@ -1,42 +1,68 @@
 import json
+import logging
 import tools.logging_setup as logging_setup
 import os
 import time
 import numpy as np
-from numba import njit
 
 import config
+import kernel_cache
 from body import Body
 from tools.pacemaker import Pacemaker
 from walls import Walls
+from world import World
 
 
 def run(
     keys_sim_keys_q,
-    sim_dash_duration_q,
-    sim_viz_info_q,
-    run_sim_alive_q,
-    sim_run_alive_q,
+    sim_dash_duration_ring,
+    state_block,
+    heartbeats,
+    timing_stats,
 ):
     logger = logging_setup.get_logger("sim", config.LOGGING_LEVEL_SIM)
     sim = Simulation()
 
     # Warm up the simulation and give everything a chance to be
-    # compiled and initialized. This can take a few seconds.
+    # compiled and initialized. The first time ever, or after editing
+    # a kernel, this can take around 18 seconds. After that the compiled
+    # kernels are loaded from the on-disk cache in __pycache__,
+    # which is much quicker.
     print("Warming up simulation")
     sim.warmup()
 
-    pacemaker = Pacemaker(config.CLOCK_FREQ_SIM)
+    pacemaker = Pacemaker(
+        config.CLOCK_FREQ_SIM,
+        spin=config.SPIN_SIM,
+        timing_stats=timing_stats,
+        process_name="sim",
+    )
     n_alive_check = int(config.CLOCK_FREQ_SIM / config.ALIVE_CHECK_FREQ)
     i_alive_check = 0
 
-    # Updating a Queue can slow down the simulation.
-    # Converting the terrain array to JSON is a slow process.
-    # Only update it approximately once per frame.
-    steps_per_viz_q_update = int(
+    # The state of the bodies is handed to the visualization through
+    # shared memory. Copying it is cheap, but there's no need to do it
+    # more often than approximately once per frame.
+    steps_per_viz_update = int(
         config.CLOCK_FREQ_SIM / (1 * config.CLOCK_FREQ_VIZ)
     )
-    steps_since_viz_q_update = 0
+    steps_since_viz_update = 0
+
+    # Keypresses come in at human speed. Checking for them a hundred
+    # times per second is plenty, and saves a trip to the Queue
+    # on most steps.
+    steps_per_key_check = max(
+        1, int(config.CLOCK_FREQ_SIM / config.KEY_CHECK_FREQ)
+    )
+    steps_since_key_check = 0
+
+    # Wall clock time that has passed, but hasn't been simulated yet.
+    # Each wakeup adds to it, and each physics step takes away from it.
+    physics_steps_per_beat = max(
+        1, int(round(config.PHYSICS_FREQ / config.CLOCK_FREQ_SIM))
+    )
+    time_owed = 0.0
+    last_beat = time.monotonic()
 
     while True:
         overtime = pacemaker.beat()
@@ -45,19 +71,41 @@ def run(
                 json.dumps({"ts": time.time(), "overtime": overtime})
             )
 
+        this_beat = time.monotonic()
+        if config.CATCH_UP:
+            time_owed += this_beat - last_beat
+            n_physics_steps = int(time_owed / config.PHYSICS_PERIOD)
+            if n_physics_steps > config.MAX_STEPS_PER_BEAT:
+                # Too far behind to catch up. Let go of the rest.
+                logger.warning(
+                    json.dumps(
+                        {
+                            "ts": time.time(),
+                            "time_dropped": (
+                                time_owed
+                                - config.MAX_STEPS_PER_BEAT
+                                * config.PHYSICS_PERIOD
+                            ),
+                        }
+                    )
+                )
+                n_physics_steps = config.MAX_STEPS_PER_BEAT
+                time_owed = n_physics_steps * config.PHYSICS_PERIOD
+            time_owed -= n_physics_steps * config.PHYSICS_PERIOD
+        else:
+            n_physics_steps = physics_steps_per_beat
+        last_beat = this_beat
+
         # Send a heartbeat from this process to the parent runner process,
         # reassuring it that everything here is okie dokie.
-        sim_run_alive_q.put(True)
+        heartbeats.beat("sim")
 
         # Watch for a heartbeat from the parent runner process.
         # If it is not found, then shut down this process too.
         i_alive_check += 1
 
         if i_alive_check == n_alive_check:
-            runner_is_alive = False
-            while not run_sim_alive_q.empty():
-                runner_is_alive = run_sim_alive_q.get()
-            if not runner_is_alive:
+            if not heartbeats.is_alive("run", config.HEARTBEAT_TIMEOUT):
                 print("Runner process has shut down.")
                 print("Shutting down simulation process.")
                 # sys.exit()
@@ -65,9 +113,19 @@ def run(
             else:
                 i_alive_check = 0
 
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    json.dumps(
+                        {"ts": time.time(), "jitter": pacemaker.jitter_stats()}
+                    )
+                )
+
         keys = []
-        while not keys_sim_keys_q.empty():
-            keys.append(keys_sim_keys_q.get())
+        steps_since_key_check += 1
+        if steps_since_key_check >= steps_per_key_check:
+            while not keys_sim_keys_q.empty():
+                keys.append(keys_sim_keys_q.get())
+            steps_since_key_check = 0
 
         # Handle keypresses
         for key in keys:
@@ -78,238 +136,235 @@ def run(
             else:
                 sim.command(key)
 
-        step_duration = sim.step()
+        step_duration = sim.step(n_physics_steps)
 
-        sim_dash_duration_q.put(step_duration)
+        # This is cheap enough to do on every step. It only writes
+        # into shared memory, without pickling or a trip through a pipe.
+        sim_dash_duration_ring.add(step_duration)
 
-        steps_since_viz_q_update += 1
-        if steps_since_viz_q_update >= steps_per_viz_q_update:
-            viz_info = sim.get_viz_info()
-            ts = time.time()
-            logger.debug(json.dumps({"ts": ts, "viz_info": viz_info}))
-            sim_viz_info_q.put((ts, viz_info))
-            steps_since_viz_q_update = 0
+        steps_since_viz_update += 1
+        if steps_since_viz_update >= steps_per_viz_update:
+            sim.write_state(state_block)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    json.dumps(
+                        {"ts": time.time(), "viz_info": sim.get_viz_info()}
+                    )
+                )
+            steps_since_viz_update = 0
 
 
 class Simulation:
-    def __init__(self):
-        self.bodies = {}
-        ship_params = config.SHIP_BODY
+    """
+    The ship, the asteroid, and the walls, packed into a World,
+    along with the commands that steer the ship.
+
+    By default everything is set up from config. To try out other
+    settings, pass in a dict of overrides, keyed by the name of the
+    config setting, like {"THRUST_MAGNITUDE": 3.0}. These are
+    the settings that can be overridden.
+    """
+
+    SETTINGS = [
+        "WALLS",
+        "SHIP_BODY",
+        "A0_BODY",
+        "TORPEDO_BODY",
+        "TORPEDO_POOL_SIZE",
+        "PARALLEL_CONTACTS",
+        "PRECISION",
+        "FORCE_SHAPE",
+        "THRUST_MAGNITUDE",
+        "TORQUE_MAGNITUDE",
+        "RECOIL_SHAPE",
+        "RECOIL_MAGNITUDE",
+    ]
+
+    def __init__(self, overrides=None):
+        # Before any kernel gets loaded from the on-disk cache,
+        # throw out the ones compiled against code that has since changed.
+        kernel_cache.clear_stale()
+
+        if overrides is None:
+            overrides = {}
+        for name in overrides:
+            if name not in self.SETTINGS:
+                raise ValueError(f"{name} is not a setting of Simulation")
+        settings = {
+            name: overrides.get(name, getattr(config, name))
+            for name in self.SETTINGS
+        }
+        self.force_shape = settings["FORCE_SHAPE"]
+        self.thrust_magnitude = settings["THRUST_MAGNITUDE"]
+        self.torque_magnitude = settings["TORQUE_MAGNITUDE"]
+        self.recoil_shape = settings["RECOIL_SHAPE"]
+        self.recoil_magnitude = settings["RECOIL_MAGNITUDE"]
+
+        self.walls = Walls()
+        for wall_init in settings["WALLS"]:
+            self.walls.add_wall(wall_init)
+
+        bodies = []
+        ship_params = settings["SHIP_BODY"]
         self.ship_id = ship_params["id"]
-        self.bodies[self.ship_id] = Body(ship_params)
+        bodies.append(Body(ship_params))
 
-        a0_params = config.A0_BODY
+        a0_params = settings["A0_BODY"]
         a0_id = a0_params["type"] + "_00"
         a0_params["id"] = a0_id
-        self.bodies[a0_id] = Body(a0_params)
+        bodies.append(Body(a0_params))
 
         self.i_torpedo = 0
+        self.n_bodies_warned = 0
+
+        # All the bodies are packed together into a World.
+        # It files them into a uniform grid so that the ones close
+        # enough to interact can be found without checking every pair.
+        # Size the cells to comfortably hold the largest body.
+        max_radius = np.max([body.radius for body in bodies])
+        self.world = World(
+            self.walls,
+            2 * max_radius,
+            parallel=settings["PARALLEL_CONTACTS"],
+            precision=settings["PRECISION"],
+        )
+        for body in bodies:
+            self.world.add_body(body)
+
+        torpedo_params = settings["TORPEDO_BODY"]
+        torpedo_params["id"] = "torpedo"
+        self.torpedo_radius = torpedo_params["r_atoms"][0]
+        self.world.create_pool(
+            Body(torpedo_params), settings["TORPEDO_POOL_SIZE"]
+        )
 
-        self.walls = Walls()
-        for wall_init in config.WALLS:
-            self.walls.add_wall(wall_init)
+    def command(self, key, world=None):
+        """
+        Steer the ship in response to a keypress. By default it's
+        the ship in this Simulation's World. To steer the ship in
+        one environment of a WorldBatch, pass in its EnvWorld.
+        """
+        if world is None:
+            world = self.world
+        i_ship = world.index[self.ship_id]
+        ship_angle = world.angle[i_ship]
 
-    def command(self, key):
         if key == "u":
-            self.bodies[self.ship_id].f_x_ext_buffer.add(
-                config.FORCE_SHAPE * config.THRUST_MAGNITUDE
-                * np.cos(self.bodies[self.ship_id].angle)
-            )
-            self.bodies[self.ship_id].f_y_ext_buffer.add(
-                config.FORCE_SHAPE * config.THRUST_MAGNITUDE
-                * np.sin(self.bodies[self.ship_id].angle)
+            world.add_force(
+                i_ship,
+                self.force_shape,
+                f_x=self.thrust_magnitude * np.cos(ship_angle),
+                f_y=self.thrust_magnitude * np.sin(ship_angle),
             )
 
         if key == "r":
-            self.bodies[self.ship_id].torque_ext_buffer.add(
-                config.FORCE_SHAPE * -1 * config.TORQUE_MAGNITUDE
+            world.add_force(
+                i_ship,
+                self.force_shape,
+                torque=-1 * self.torque_magnitude,
             )
 
         if key == "l":
-            self.bodies[self.ship_id].torque_ext_buffer.add(
-                config.FORCE_SHAPE * config.TORQUE_MAGNITUDE
+            world.add_force(
+                i_ship,
+                self.force_shape,
+                torque=self.torque_magnitude,
             )
 
         if key == " ":
-            self.bodies[self.ship_id].f_x_ext_buffer.add(
-                config.RECOIL_SHAPE * config.RECOIL_MAGNITUDE * -1
-                * np.cos(self.bodies[self.ship_id].angle)
-            )
-            self.bodies[self.ship_id].f_y_ext_buffer.add(
-                config.RECOIL_SHAPE * config.RECOIL_MAGNITUDE * -1
-                * np.sin(self.bodies[self.ship_id].angle)
+            world.add_force(
+                i_ship,
+                self.recoil_shape,
+                f_x=self.recoil_magnitude * -1 * np.cos(ship_angle),
+                f_y=self.recoil_magnitude * -1 * np.sin(ship_angle),
             )
 
-            torpedo_params = config.TORPEDO_BODY
             torpedo_id = f"torpedo_{self.i_torpedo:06}"
-            torpedo_params["id"] = torpedo_id
-            torpedo_params["x"] = self.bodies[self.ship_id].x + np.cos(
-                self.bodies[self.ship_id].angle
-            ) * (
-                self.bodies[self.ship_id].radius * 1.1
-                + torpedo_params["r_atoms"][0]
-            )
-            torpedo_params["y"] = self.bodies[self.ship_id].y + np.sin(
-                self.bodies[self.ship_id].angle
-            ) * (
-                self.bodies[self.ship_id].radius * 1.1
-                + torpedo_params["r_atoms"][0]
-            )
+            torpedo_offset = world.radius[i_ship] * 1.1 + self.torpedo_radius
             self.i_torpedo += 1
 
-            self.bodies[torpedo_id] = Body(torpedo_params)
-            self.bodies[torpedo_id].f_x_ext_buffer.add(
-                config.RECOIL_SHAPE * config.RECOIL_MAGNITUDE
-                * np.cos(self.bodies[self.ship_id].angle)
+            i_torpedo = world.spawn(
+                "torpedo",
+                torpedo_id,
+                world.x[i_ship] + np.cos(ship_angle) * torpedo_offset,
+                world.y[i_ship] + np.sin(ship_angle) * torpedo_offset,
             )
-            self.bodies[torpedo_id].f_y_ext_buffer.add(
-                config.RECOIL_SHAPE * config.RECOIL_MAGNITUDE
-                * np.sin(self.bodies[self.ship_id].angle)
+            # A WorldBatch can't grow its pools. Once they're all in flight
+            # there are no more torpedoes to fire.
+            if i_torpedo is None:
+                return
+            world.add_force(
+                i_torpedo,
+                self.recoil_shape,
+                f_x=self.recoil_magnitude * np.cos(ship_angle),
+                f_y=self.recoil_magnitude * np.sin(ship_angle),
             )
 
-    def step(self):
+    def step(self, n_physics_steps=1):
         # Time each pass through the computations of step().
         start = time.time()
 
-        # Express the bodies as a list each time through.
-        # This step is necessary because bodies can both come into and
-        # and out of existence at any time step, but it's useful to
-        # have a list of them for these next few steps.
-        body_list = list(self.bodies.values())
-        n_bodies = len(body_list)
-        self.bodies_x = np.zeros(n_bodies)
-        self.bodies_y = np.zeros(n_bodies)
-        self.bodies_r = np.zeros(n_bodies)
-        self.bodies_are_close = np.zeros((n_bodies, n_bodies))
-        for i_body, body in enumerate(body_list):
-            self.bodies_x[i_body] = body.x
-            self.bodies_y[i_body] = body.y
-            self.bodies_r[i_body] = body.radius
-
-        for body in body_list:
-            body.start_step()
-
-        # Find which bodies are close enough to merit calculating interactions.
-        self.calculate_proximity(body_list)
-
-        # Calculate and tally up all the forces that act on bodies.
-        bodies_to_remove = []
-        for i in range(len(body_list)):
-            for j in range(i + 1, len(body_list)):
-                if self.bodies_are_close[i, j]:
-                    is_contacting = body_list[i].calculate_interactions(
-                        body_list[j]
-                    )
-
-                    # Mark torpedos for destruction
-                    if is_contacting:
-                        if body_list[i].type == "torpedo":
-                            bodies_to_remove.append(body_list[i].name)
-                        if body_list[j].type == "torpedo":
-                            bodies_to_remove.append(body_list[j].name)
-
-        for body in body_list:
-            body.calculate_wall_forces(self.walls)
-
-        # Add in some gravity
-        if abs(config.GRAVITY) > 0:
-            for body in body_list:
-                body.f_y_atoms += config.GRAVITY * body.m_atoms
-
-        # Add the effects of thrust and attitude correction
-        # thrust = self.thrust_buffer.pop()
-        # if abs(thrust) > 0:
-        #     self.bodies[self.ship_id].f_x_ext += thrust * np.cos(
-        #         self.bodies[self.ship_id].angle
-        #     )
-        #     self.bodies[self.ship_id].f_y_ext += thrust * np.sin(
-        #         self.bodies[self.ship_id].angle
-        #     )
-
-        # twist = self.torque_buffer.pop()
-        # if abs(twist) > 0:
-        #     self.bodies[self.ship_id].torque_ext += twist
-
-        # recoil = self.firing_buffer.pop()
-        # if abs(recoil) > 0:
-        #     self.bodies[self.ship_id].f_x_ext -= recoil * np.cos(
-        #         self.bodies[self.ship_id].angle
-        #     )
-        #     self.bodies[self.ship_id].f_y_ext -= recoil * np.sin(
-        #         self.bodies[self.ship_id].angle
-        #     )
-
-        # Update atoms' positions based on the forces that act on them.
-        for body in body_list:
-            body.update_positions()
-
-        bodies_to_remove = list(set(bodies_to_remove))
-        for body_id in bodies_to_remove:
-            del self.bodies[body_id]
+        # Calculate and tally up all the forces that act on bodies
+        # and update their positions, all in one go.
+        # Torpedoes that hit something are destroyed along the way.
+        for _ in range(n_physics_steps):
+            self.world.step()
 
         elapsed = time.time() - start
         return elapsed
 
+    def torpedo_pool_occupancy(self):
+        """
+        Returns the number of torpedo slots in use and the total
+        number available.
+        """
+        return self.world.pool_occupancy("torpedo")
+
     def warmup(self):
         """
         Numba @njit functions are compiled "just in time", that is,
-        when they are first called. This function is a copy-paste
-        from step() that ensures that they are each called at least once
-        before the simulation kicks off in earnest. This helps
-        the simulation and animation not to pause awkwardly.
+        when they are first called. This function ensures that they
+        are each called at least once before the simulation kicks off
+        in earnest. This helps the simulation and animation
+        not to pause awkwardly.
+
+        All the kernels are compiled with cache=True, so after the
+        first run this only has to load them from disk. Compiling them
+        all from scratch takes around 18 seconds. Loading them takes
+        well under one.
+
+        Numba only notices changes to the file a cached function lives in.
+        The kernels in world.py call ones in body.py and grid.py,
+        and batch_step_numba() in world_batch.py calls into world.py.
+        Creating a Simulation runs kernel_cache.clear_stale(), which
+        deletes any cached kernels older than the latest edit to one
+        of the files they depend on, so they get compiled again.
+        """
+        self.world.step()
+
+    def write_state(self, state_block):
+        """
+        Copy the position, type, and status of every body slot
+        into the shared StateBlock for the visualization to pick up.
         """
-        body_list = list(self.bodies.values())
-        n_bodies = len(body_list)
-        self.bodies_x = np.zeros(n_bodies)
-        self.bodies_y = np.zeros(n_bodies)
-        self.bodies_r = np.zeros(n_bodies)
-        self.bodies_are_close = np.zeros((n_bodies, n_bodies))
-        for i_body, body in enumerate(body_list):
-            self.bodies_x[i_body] = body.x
-            self.bodies_y[i_body] = body.y
-            self.bodies_r[i_body] = body.radius
-
-        for body in body_list:
-            body.start_step()
-
-        self.calculate_proximity(body_list)
-
-        # Calculate and tally up all the forces that act on bodies.
-        for i in range(len(body_list)):
-            for j in range(i + 1, len(body_list)):
-                body_list[i].calculate_interactions(body_list[j])
-
-        for body in body_list:
-            body.calculate_wall_forces(self.walls)
-
-        for body in body_list:
-            body.update_positions()
-
-    def calculate_proximity(self, body_list):
-        for i_body, body in enumerate(body_list):
-            self.bodies_x[i_body] = body.x
-            self.bodies_y[i_body] = body.y
-
-        calculate_proximity_numba(
-            self.bodies_x, self.bodies_y, self.bodies_r, self.bodies_are_close
+        world = self.world
+        n = world.n_bodies
+        if n > state_block.n_slots:
+            # Only warn once each time the World grows past the block.
+            if n != self.n_bodies_warned:
+                self.n_bodies_warned = n
+                print(
+                    f"Only {state_block.n_slots} of {n} body slots"
+                    + " can be shown."
+                )
+        state_block.write(
+            n, world.x, world.y, world.angle, world.type_id, world.alive
         )
 
     def get_viz_info(self):
         viz_info = {}
-        for body in self.bodies.values():
-            viz_info[body.name] = body.get_state()
+        for i_body, name in enumerate(self.world.names):
+            state = self.world.get_state(i_body)
+            if state is not None:
+                viz_info[name] = state
         return viz_info
-
-
-@njit
-def calculate_proximity_numba(x, y, r, is_close):
-    n = x.size
-    for i_row in range(n):
-        for j_col in range(i_row + 1, n):
-            is_close[i_row, j_col] = 0
-            d_x = x[i_row] - x[j_col]
-            d_y = y[i_row] - y[j_col]
-            distance = (d_x**2 + d_y**2) ** 0.5
-            compression = r[i_row] + r[j_col] - distance
-            if compression > 0:
-                is_close[i_row, j_col] = 1
@@ -0,0 +1,87 @@
+"""
+Compare the time it takes to step a crowded world with
+different thicknesses of the skin around the cached contacts.
+
+A thin skin means few pairs of atoms to check each step, but the cache
+has to be refilled often. A thick skin means refilling it rarely,
+but checking a lot of pairs that aren't touching.
+
+The world is filled with asteroids packed tightly enough that each one
+is touching its neighbors, all of them moving. It runs long enough
+for the cache to be refilled many times over.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from body import Body
+from walls import Walls
+from world import World
+
+n_steps = 500
+n_atoms = 10_000
+skins = [0.0, 0.005, 0.01, 0.02, 0.04, 0.08]
+
+
+def create_world(skin):
+    np.random.seed(0)
+    params = dict(config.A0_BODY)
+    params["id"] = "a0"
+    template = Body(params)
+    n_bodies = int(np.ceil(n_atoms / template.n_atoms))
+
+    # Pack the asteroids on a square lattice, close enough that
+    # every one of them is touching its neighbors.
+    spacing = 1.7 * template.radius
+    n_side = int(np.ceil(n_bodies**0.5))
+    width = (n_side + 1) * spacing
+
+    # The walls bound the arena, so make them infinitely thick.
+    walls = Walls(thickness=np.inf)
+    overhang = spacing
+    for x_left, y_left, x_right, y_right in [
+        (width, width + overhang, width, -overhang),
+        (0, -overhang, 0, width + overhang),
+        (width + overhang, 0, -overhang, 0),
+        (-overhang, width, width + overhang, width),
+    ]:
+        walls.add_wall(
+            {
+                "x_left": x_left,
+                "y_left": y_left,
+                "x_right": x_right,
+                "y_right": y_right,
+            }
+        )
+
+    world = World(walls, 2 * template.radius, width=width, height=width)
+    world.contact_skin = skin
+    world.sleep_steps = 0
+    for i_body in range(n_bodies):
+        params["id"] = f"a0_{i_body:06}"
+        params["x"] = (i_body % n_side + 1) * spacing
+        params["y"] = (i_body // n_side + 1) * spacing
+        params["v_x"] = 0.5 - np.random.sample()
+        params["v_y"] = 0.5 - np.random.sample()
+        params["v_rot"] = 0.5 - np.random.sample()
+        world.add_body(Body(params))
+
+    # Ensure jitted functions are pre-compiled
+    world.step()
+    return world
+
+
+print(f"{n_atoms} atoms, all touching, for {n_steps} steps")
+print("      skin   cached pairs   time per step")
+for skin in skins:
+    world = create_world(skin)
+    n_cached = 0
+    start = perf_counter()
+    for _ in range(n_steps):
+        world.step()
+        n_cached += world.n_contacts
+    step_time = (perf_counter() - start) / n_steps
+    print(
+        f"  {skin:8.3f}   {n_cached / n_steps:12.0f}"
+        + f"   {1000 * step_time:10.3f} ms"
+    )
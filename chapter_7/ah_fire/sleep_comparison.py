@@ -0,0 +1,93 @@
+"""
+Compare the time it takes to step a world full of resting bodies
+when every body is simulated on every step, and when bodies that have
+come to rest are put to sleep.
+
+The bodies are laid out on a loose lattice in a large arena, and
+all but a handful of them start out sitting still. The rest are
+sent drifting through the crowd, waking bodies as they go.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from body import Body
+from walls import Walls
+from world import World
+
+n_reps = 200
+n_moving = 10
+arena_size = 60.0
+body_counts = [100, 400, 1600]
+
+
+def create_world(n_bodies, sleep_steps):
+    np.random.seed(0)
+    # The walls bound the arena, so make them infinitely thick.
+    walls = Walls(thickness=np.inf)
+    for x_left, y_left, x_right, y_right in [
+        (arena_size, arena_size, arena_size, 0.0),
+        (0.0, 0.0, 0.0, arena_size),
+        (arena_size, 0.0, 0.0, 0.0),
+        (0.0, arena_size, arena_size, arena_size),
+    ]:
+        walls.add_wall(
+            {
+                "x_left": x_left,
+                "y_left": y_left,
+                "x_right": x_right,
+                "y_right": y_right,
+            }
+        )
+
+    params = dict(config.A0_BODY)
+    params["id"] = "a0"
+    template = Body(params)
+    world = World(
+        walls, 2 * template.radius, width=arena_size, height=arena_size
+    )
+    world.sleep_steps = sleep_steps
+
+    n_side = int(np.ceil(n_bodies**0.5))
+    spacing = arena_size / (n_side + 1)
+    for i_body in range(n_bodies):
+        params["id"] = f"a0_{i_body:06}"
+        params["x"] = spacing * (1 + i_body % n_side)
+        params["y"] = spacing * (1 + i_body // n_side)
+        if i_body < n_moving:
+            params["v_x"] = 2 * (0.5 - np.random.sample())
+            params["v_y"] = 2 * (0.5 - np.random.sample())
+            params["v_rot"] = 0.5 - np.random.sample()
+        else:
+            params["v_x"] = 0.0
+            params["v_y"] = 0.0
+            params["v_rot"] = 0.0
+        world.add_body(Body(params))
+
+    # Ensure jitted functions are pre-compiled, and give the bodies
+    # that are sitting still time to fall asleep.
+    for _ in range(max(1, sleep_steps + 1)):
+        world.step()
+    return world
+
+
+def time_step(world):
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        world.step()
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+print(f"{n_moving} moving bodies in a {arena_size} x {arena_size} arena")
+print("  bodies   awake   all awake    with sleep")
+for n_bodies in body_counts:
+    awake_time = time_step(create_world(n_bodies, 0))
+    world = create_world(n_bodies, config.SLEEP_STEPS)
+    sleep_time = time_step(world)
+    n_awake = np.sum(world.alive & ~world.asleep)
+    print(
+        f"  {n_bodies:6d}  {n_awake:6d}"
+        + f"   {1000 * awake_time:6.3f} ms   {1000 * sleep_time:6.3f} ms"
+    )
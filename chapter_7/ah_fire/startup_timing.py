@@ -0,0 +1,46 @@
+"""
+Measure how long it takes the simulation to go from a cold start,
+a brand new Python process, to being ready to take its first step.
+
+The first run starts with no cached kernels, so everything has to be
+compiled from scratch. The runs after that can load the compiled
+kernels from Numba's on-disk cache.
+
+The last run comes after body.py has been marked as edited, by updating
+the time it was last modified. Every module whose kernels call into it
+has its cache thrown out by kernel_cache.clear_stale(), and gets
+compiled again.
+"""
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+import kernel_cache
+
+n_reps = 3
+here = os.path.dirname(os.path.abspath(__file__))
+
+startup_script = """
+import sim
+simulation = sim.Simulation()
+simulation.warmup()
+"""
+
+
+def time_startup():
+    start = perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", startup_script], cwd=here, check=True
+    )
+    return perf_counter() - start
+
+
+print()
+kernel_cache.clear()
+print(f"No cache         {time_startup():6.2f} s")
+for i_rep in range(n_reps):
+    print(f"Cached, run {i_rep + 1}    {time_startup():6.2f} s")
+os.utime(os.path.join(here, "body.py"))
+print(f"body.py edited   {time_startup():6.2f} s")
+print(f"Cached again     {time_startup():6.2f} s")
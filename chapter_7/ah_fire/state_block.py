@@ -0,0 +1,134 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# Positions of the values in the header
+I_LATEST = 0
+I_SEQ = 1  # One sequence number for each of the two buffers
+I_FRAME = 3  # One frame counter for each of the two buffers
+N_HEADER = 5
+
+# The number of bytes for each slot: x, y, angle, type id, and alive
+SLOT_BYTES = 8 + 8 + 8 + 8 + 1
+MAX_READ_TRIES = 100
+
+
+class StateBlock:
+    """
+    A block of shared memory for handing the state of every body slot
+    from the simulation to the visualization, with no pickling
+    and no Queue.
+
+    There are two buffers. The simulation always writes into the one
+    that isn't the latest, then marks it as the latest. Each buffer
+    has a sequence number that is odd while it's being written,
+    a seqlock, so that a reader can tell whether the buffer changed
+    out from under it. Every write also bumps a frame counter, so the
+    reader can tell when it has missed frames or seen the same one twice.
+
+    Create it in the parent process with StateBlock(n_slots, create=True)
+    and then either let forked child processes inherit it or attach
+    to it by name with StateBlock(n_slots, name=name).
+    """
+
+    def __init__(self, n_slots, name=None, create=False):
+        self.n_slots = n_slots
+        size = 8 * N_HEADER + 2 * n_slots * SLOT_BYTES
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=size
+        )
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self.header = np.ndarray(N_HEADER, dtype=np.int64, buffer=buf)
+        offset = self.header.nbytes
+
+        def new_array(dtype):
+            nonlocal offset
+            arr = np.ndarray(n_slots, dtype=dtype, buffer=buf, offset=offset)
+            offset += arr.nbytes
+            return arr
+
+        self.x = []
+        self.y = []
+        self.angle = []
+        self.type_id = []
+        self.alive = []
+        for i_buffer in range(2):
+            self.x.append(new_array(np.float64))
+            self.y.append(new_array(np.float64))
+            self.angle.append(new_array(np.float64))
+            self.type_id.append(new_array(np.int64))
+        for i_buffer in range(2):
+            self.alive.append(new_array(np.bool_))
+
+        if create:
+            self.header[:] = 0
+            for i_buffer in range(2):
+                self.alive[i_buffer][:] = False
+
+    def write(self, n, x, y, angle, type_id, alive):
+        """
+        Copy the first n slots of each array into the buffer
+        that isn't being read, and then make it the latest.
+        """
+        n = min(n, self.n_slots)
+        i_latest = self.header[I_LATEST]
+        i_buffer = 1 - i_latest
+
+        # An odd sequence number means a write is underway.
+        self.header[I_SEQ + i_buffer] += 1
+
+        self.x[i_buffer][:n] = x[:n]
+        self.y[i_buffer][:n] = y[:n]
+        self.angle[i_buffer][:n] = angle[:n]
+        self.type_id[i_buffer][:n] = type_id[:n]
+        self.alive[i_buffer][:n] = alive[:n]
+        self.alive[i_buffer][n:] = False
+        self.header[I_FRAME + i_buffer] = self.header[I_FRAME + i_latest] + 1
+
+        self.header[I_SEQ + i_buffer] += 1
+        self.header[I_LATEST] = i_buffer
+
+    def read(self):
+        """
+        Get the latest complete frame. The arrays returned are views
+        straight into shared memory, not copies.
+
+        Returns a tuple of (frame, x, y, angle, type_id, alive, token),
+        or None if no complete frame could be found. Pass the token to
+        is_intact() after using the arrays to check that they weren't
+        overwritten in the meantime.
+        """
+        for _ in range(MAX_READ_TRIES):
+            i_buffer = self.header[I_LATEST]
+            seq = self.header[I_SEQ + i_buffer]
+            if seq % 2 == 1:
+                continue
+            return (
+                self.header[I_FRAME + i_buffer],
+                self.x[i_buffer],
+                self.y[i_buffer],
+                self.angle[i_buffer],
+                self.type_id[i_buffer],
+                self.alive[i_buffer],
+                (i_buffer, seq),
+            )
+        return None
+
+    def is_intact(self, token):
+        i_buffer, seq = token
+        return self.header[I_SEQ + i_buffer] == seq
+
+    def close(self):
+        # The arrays are views into the shared memory, and it can't be
+        # closed while any of them are still around.
+        self.header = None
+        self.x = []
+        self.y = []
+        self.angle = []
+        self.type_id = []
+        self.alive = []
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
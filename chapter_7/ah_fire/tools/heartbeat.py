@@ -0,0 +1,68 @@
+from multiprocessing import shared_memory
+import time
+
+
+class Heartbeats:
+    """
+    A small block of shared memory where each of a set of processes
+    can post a heartbeat, and any of them can check on the others.
+
+    Each process has a slot holding the time of its most recent beat,
+    from time.monotonic(), and a count of how many beats it has sent.
+    Posting a beat is just two writes to memory. There are no
+    Queues to fill up and none to drain.
+
+    Initialize Heartbeats(process_names, create=True) in the parent
+    process and then either let forked child processes inherit it
+    or attach to it by name with Heartbeats(process_names, name=name).
+    Every process has to use the same list of names in the same order.
+    """
+
+    def __init__(self, process_names, name=None, create=False):
+        self.process_names = list(process_names)
+        self.i_process = {
+            process_name: i
+            for i, process_name in enumerate(self.process_names)
+        }
+        n_processes = len(self.process_names)
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=16 * n_processes
+        )
+        self.name = self.shm.name
+        self.beat_times = self.shm.buf[: 8 * n_processes].cast("d")
+        self.beat_counts = self.shm.buf[8 * n_processes :].cast("q")
+        if create:
+            for i in range(n_processes):
+                self.beat_times[i] = 0.0
+                self.beat_counts[i] = 0
+
+    def beat(self, process_name):
+        """
+        Let everyone know that this process is still running.
+        """
+        i = self.i_process[process_name]
+        self.beat_times[i] = time.monotonic()
+        self.beat_counts[i] += 1
+
+    def count(self, process_name):
+        return self.beat_counts[self.i_process[process_name]]
+
+    def is_alive(self, process_name, timeout):
+        """
+        A process is alive if it has sent a heartbeat within the last
+        timeout seconds. One that hasn't sent any yet is not.
+        """
+        i = self.i_process[process_name]
+        if self.beat_counts[i] == 0:
+            return False
+        return time.monotonic() - self.beat_times[i] < timeout
+
+    def close(self):
+        # The memoryviews have to be released before the shared memory
+        # can be closed.
+        self.beat_times.release()
+        self.beat_counts.release()
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
@@ -1,4 +1,6 @@
 import time
+import numpy as np
+from tools.histogram import LogHistogram
 
 
 class Pacemaker:
@@ -19,13 +21,61 @@ class Pacemaker:
     set of checks on the return value if it's important to keep the cycle
     time tightly controlled.
 
+    time.sleep() tends to overshoot by a fraction of a millisecond.
+    At high clock frequencies that's a big deal. Initialize with
+    Pacemaker(clock_freq, spin=True) to sleep only until shortly before
+    each beat is due, and then busy-wait the rest of the way.
+    How long before is the spin_margin. By default it's measured
+    at startup from how much time.sleep() overshoots on this machine.
+    A bigger margin buys more precision and burns more CPU.
+
+    Every beat is tallied in two histograms: how late it woke up,
+    compared to when it was due, and how much time the loop spent
+    working between beats. A beat where the work ran past the deadline
+    is counted as an overrun. jitter_stats() reports on the lateness
+    and summary() reports on all of it.
+
+    To share that with other processes, pass in a TimingStats block
+    and the name of this process. The summary is published to it
+    about once per second. Each beat is then also tallied in a second
+    pair of histograms that start over after every publish,
+    so that the summary shows how the last second went,
+    alongside how it has gone since the Pacemaker was created.
+
     For consistency, all the time units are in seconds.
 
     See brandonrohrer.com/httyr2 for a detailed development of the method.
     """
 
-    def __init__(self, clock_freq_Hz):
+    def __init__(
+        self,
+        clock_freq_Hz,
+        spin=False,
+        spin_margin=None,
+        timing_stats=None,
+        process_name=None,
+    ):
         self.clock_period = 1 / float(clock_freq_Hz)
+        self.spin = spin
+        if spin and spin_margin is None:
+            spin_margin = calibrate_spin_margin()
+        self.spin_margin = spin_margin
+
+        # Over the Pacemaker's whole life
+        self.lateness = LogHistogram()
+        self.work = LogHistogram()
+        self.n_beats = 0
+        self.n_overruns = 0
+        # Since the summary was last published
+        self.interval_lateness = LogHistogram()
+        self.interval_work = LogHistogram()
+        self.interval_n_beats = 0
+        self.interval_n_overruns = 0
+
+        self.timing_stats = timing_stats
+        self.process_name = process_name
+        self.beats_per_publish = max(1, int(clock_freq_Hz))
+
         self.last_run_completed = time.monotonic()
         self.start_time = time.monotonic()
         self.i_iter = -1
@@ -34,12 +84,102 @@ class Pacemaker:
         self.i_iter += 1
         end = self.start_time + (self.i_iter + 1) * self.clock_period
 
-        sleep_time = end - time.monotonic()
-        if sleep_time > 0:
-            time.sleep(sleep_time)
+        work_completed = time.monotonic()
+        work = work_completed - self.last_run_completed
+        self.work.add(work)
+        self.interval_work.add(work)
+        if work_completed > end:
+            self.n_overruns += 1
+            self.interval_n_overruns += 1
+
+        if self.spin:
+            sleep_time = end - self.spin_margin - time.monotonic()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            while time.monotonic() < end:
+                pass
+        else:
+            sleep_time = end - time.monotonic()
+            if sleep_time > 0:
+                time.sleep(sleep_time)
 
         this_run_completed = time.monotonic()
+        lateness = this_run_completed - end
+        self.lateness.add(lateness)
+        self.interval_lateness.add(lateness)
+        self.n_beats += 1
+        self.interval_n_beats += 1
+        if (
+            self.timing_stats is not None
+            and self.n_beats % self.beats_per_publish == 0
+        ):
+            self.timing_stats.publish(self.process_name, self.summary())
+            self.interval_lateness.reset()
+            self.interval_work.reset()
+            self.interval_n_beats = 0
+            self.interval_n_overruns = 0
+
         dt = this_run_completed - self.last_run_completed
         overtime = dt - self.clock_period
         self.last_run_completed = this_run_completed
         return overtime
+
+    def jitter_stats(self):
+        """
+        Summarize how late the beats have been, compared to when they
+        were due, over the Pacemaker's whole life. Returns a dict
+        of the median, 99th percentile, and maximum, in seconds,
+        and how many beats there have been.
+        """
+        return {
+            "n_beats": self.n_beats,
+            "p50": self.lateness.percentile(50),
+            "p99": self.lateness.percentile(99),
+            "max": self.lateness.max_value_seen,
+        }
+
+    def summary(self):
+        """
+        Percentiles of the lateness of each beat and of the work time
+        between beats, in seconds, along with counts of beats
+        and overruns. This is what gets published to TimingStats.
+
+        The plain fields cover the Pacemaker's whole life. The ones
+        starting with interval_ cover only the beats since the summary
+        was last published, about the last second.
+        """
+        summary = {"clock_period": self.clock_period}
+        for prefix, lateness, work, n_beats, n_overruns in [
+            ("", self.lateness, self.work, self.n_beats, self.n_overruns),
+            (
+                "interval_",
+                self.interval_lateness,
+                self.interval_work,
+                self.interval_n_beats,
+                self.interval_n_overruns,
+            ),
+        ]:
+            summary[prefix + "n_beats"] = n_beats
+            summary[prefix + "n_overruns"] = n_overruns
+            summary[prefix + "lateness_p50"] = lateness.percentile(50)
+            summary[prefix + "lateness_p99"] = lateness.percentile(99)
+            summary[prefix + "lateness_p999"] = lateness.percentile(99.9)
+            summary[prefix + "lateness_max"] = lateness.max_value_seen
+            summary[prefix + "work_p50"] = work.percentile(50)
+            summary[prefix + "work_p99"] = work.percentile(99)
+            summary[prefix + "work_p999"] = work.percentile(99.9)
+            summary[prefix + "work_max"] = work.max_value_seen
+        return summary
+
+
+def calibrate_spin_margin(n_samples=200, nominal=1e-4):
+    """
+    Measure how far past its target time.sleep() wakes up
+    and return a margin that covers nearly all of it.
+    """
+    overshoot = np.zeros(n_samples)
+    for i_sample in range(n_samples):
+        start = time.monotonic()
+        time.sleep(nominal)
+        overshoot[i_sample] = time.monotonic() - start - nominal
+    return np.percentile(overshoot, 99)
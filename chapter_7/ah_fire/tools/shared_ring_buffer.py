@@ -0,0 +1,101 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedRingBuffer:
+    """
+    A ring buffer of floats in shared memory, for passing a stream of
+    values from one process to exactly one other without a Queue.
+
+    Like RingBuffer, it holds n values in the array x and wraps around
+    when it reaches the end. The writer adds one value at a time
+    and the reader collects everything that's new in one go.
+
+    Rather than a position that wraps, the writer keeps a running
+    count of every value it has ever added, and it only updates that
+    count after the value is in place. The reader keeps its own count
+    of what it has already collected. Neither ever needs to wait
+    for the other. If the reader falls more than n values behind,
+    the oldest ones are lost and it is told how many.
+
+    Create it in the parent process with SharedRingBuffer(size, create=True)
+    and then either let forked child processes inherit it or attach
+    to it by name with SharedRingBuffer(size, name=name).
+    """
+
+    def __init__(self, size, name=None, create=False):
+        self.n = size
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=create, size=8 * (1 + self.n)
+        )
+        self.name = self.shm.name
+        self.count = np.ndarray(1, dtype=np.int64, buffer=self.shm.buf)
+        self.x = np.ndarray(
+            self.n, dtype=float, buffer=self.shm.buf, offset=8
+        )
+        if create:
+            self.count[0] = 0
+            self.x[:] = 0.0
+
+        # Plain typed memoryviews onto the same memory. Setting a single
+        # element through these is a few times quicker than through
+        # a numpy array, which matters for the writer.
+        self.count_view = self.shm.buf[:8].cast("q")
+        self.x_view = self.shm.buf[8:].cast("d")
+
+        # The reader's own tally of the values it has collected
+        self.n_read = 0
+
+    def add(self, val):
+        """
+        Only call this from the one process that writes.
+        """
+        i_write = self.count_view[0]
+        self.x_view[i_write % self.n] = val
+        self.count_view[0] = i_write + 1
+
+    def read_all(self):
+        """
+        Only call this from the one process that reads.
+
+        Returns an array of the values added since the last read,
+        oldest first, and the number of values that were lost
+        because they were overwritten before they could be read.
+        """
+        i_end = int(self.count[0])
+        i_start = max(self.n_read, i_end - self.n)
+        n_lost = i_start - self.n_read
+
+        i_first = i_start % self.n
+        i_last = i_end % self.n
+        if i_end - i_start == 0:
+            vals = np.zeros(0)
+        elif i_first < i_last:
+            vals = self.x[i_first:i_last].copy()
+        else:
+            vals = np.concatenate((self.x[i_first:], self.x[:i_last]))
+
+        # The writer may have lapped the oldest values while they
+        # were being copied. Drop any that might have been overwritten,
+        # including the one the writer could be partway through
+        # replacing, which isn't in the count yet.
+        i_overwritten = int(self.count[0]) + 1 - self.n
+        if i_overwritten > i_start:
+            n_drop = min(i_overwritten - i_start, vals.size)
+            vals = vals[n_drop:]
+            n_lost += n_drop
+
+        self.n_read = i_end
+        return vals, n_lost
+
+    def close(self):
+        # The arrays are views into the shared memory, and it can't be
+        # closed while any of them are still around.
+        self.count_view.release()
+        self.x_view.release()
+        self.count = None
+        self.x = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
@@ -0,0 +1,215 @@
+"""
+A block of shared memory where every process posts a summary of how
+well its Pacemaker is keeping time, so that any other process can see
+the timing health of all of them at once.
+
+To print a report from the command line, while the program is running,
+pass it the name of the block
+
+    python -m tools.timing_stats <block name>
+
+or add --watch to keep printing it once per second.
+"""
+from multiprocessing import resource_tracker, shared_memory
+import sys
+import time
+import numpy as np
+
+# What each process posts, from Pacemaker.summary(). All times
+# are in seconds. The fields without a prefix cover the whole life
+# of the process's Pacemaker. The interval_ fields cover only the beats
+# since the previous post, about the last second, so they show how
+# the process is doing right now.
+FIELDS = [
+    "seq",
+    "clock_period",
+    "n_beats",
+    "n_overruns",
+    "lateness_p50",
+    "lateness_p99",
+    "lateness_p999",
+    "lateness_max",
+    "work_p50",
+    "work_p99",
+    "work_p999",
+    "work_max",
+    "interval_n_beats",
+    "interval_n_overruns",
+    "interval_lateness_p50",
+    "interval_lateness_p99",
+    "interval_lateness_p999",
+    "interval_lateness_max",
+    "interval_work_p50",
+    "interval_work_p99",
+    "interval_work_p999",
+    "interval_work_max",
+]
+I_FIELD = {field: i for i, field in enumerate(FIELDS)}
+NAME_BYTES = 16
+MAX_READ_TRIES = 100
+
+
+class TimingStats:
+    """
+    One row of numbers per process, each guarded by its own sequence
+    number that is odd while the row is being written, so that a reader
+    never sees half of one update and half of another.
+
+    The process names are stored in the block too. Create it in the
+    parent process with TimingStats(name, process_names, create=True)
+    and then either let forked child processes inherit it or attach
+    to it with TimingStats(name).
+    """
+
+    def __init__(self, name, process_names=None, create=False):
+        if create:
+            n_processes = len(process_names)
+            size = 8 + n_processes * (NAME_BYTES + 8 * len(FIELDS))
+            try:
+                self.shm = shared_memory.SharedMemory(
+                    name=name, create=True, size=size
+                )
+            except FileExistsError:
+                # Left over from a run that didn't get to clean up.
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+                self.shm = shared_memory.SharedMemory(
+                    name=name, create=True, size=size
+                )
+            np.ndarray(1, dtype=np.int64, buffer=self.shm.buf)[0] = (
+                n_processes
+            )
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            # Only the process that created the block gets to remove it.
+            # Otherwise a reader, like the command line report, would
+            # take it away with it when it exits.
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+            n_processes = int(
+                np.ndarray(1, dtype=np.int64, buffer=self.shm.buf)[0]
+            )
+        self.name = name
+
+        names = np.ndarray(
+            n_processes,
+            dtype=f"S{NAME_BYTES}",
+            buffer=self.shm.buf,
+            offset=8,
+        )
+        if create:
+            names[:] = [
+                process_name.encode() for process_name in process_names
+            ]
+        self.process_names = [
+            process_name.decode() for process_name in names
+        ]
+        del names
+        self.i_process = {
+            process_name: i
+            for i, process_name in enumerate(self.process_names)
+        }
+
+        self.rows = np.ndarray(
+            (n_processes, len(FIELDS)),
+            dtype=np.float64,
+            buffer=self.shm.buf,
+            offset=8 + n_processes * NAME_BYTES,
+        )
+        if create:
+            self.rows[:] = 0.0
+
+    def publish(self, process_name, summary):
+        """
+        summary is a dict with a value for each of the FIELDS
+        other than seq.
+        """
+        row = self.rows[self.i_process[process_name]]
+        row[0] += 1
+        for field, value in summary.items():
+            row[I_FIELD[field]] = value
+        row[0] += 1
+
+    def read(self):
+        """
+        Returns a dict of the latest summary from each process,
+        keyed by process name. A process that hasn't published
+        anything yet has all zeros.
+
+        If a process's row was being written every time it was tried,
+        MAX_READ_TRIES times in a row, there's no consistent summary
+        to give. That process gets None instead.
+        """
+        stats = {}
+        for i_process, process_name in enumerate(self.process_names):
+            values = None
+            for _ in range(MAX_READ_TRIES):
+                seq = self.rows[i_process, 0]
+                if seq % 2 == 1:
+                    continue
+                row = self.rows[i_process].copy()
+                if self.rows[i_process, 0] == seq:
+                    values = row
+                    break
+            if values is None:
+                stats[process_name] = None
+                continue
+            stats[process_name] = {
+                field: values[i] for i, field in enumerate(FIELDS[1:], 1)
+            }
+        return stats
+
+    def report(self):
+        """
+        Format the latest stats as a table, times in milliseconds.
+        Each process gets a row for the last interval, about the last
+        second, and a row for its whole life.
+        """
+        lines = [
+            "                    "
+            + "lateness (ms)              work (ms)",
+            "process  over     "
+            + "  p50     p99   p99.9    "
+            + "  p50     p99   p99.9    beats  overruns",
+        ]
+        for process_name, summary in self.read().items():
+            if summary is None:
+                lines.append(f"{process_name:8s}  (stale, no consistent read)")
+                continue
+            for label, prefix in [("last 1s", "interval_"), ("all", "")]:
+                lines.append(
+                    f"{process_name:8s} {label:8s}"
+                    + f"{1e3 * summary[prefix + 'lateness_p50']:6.2f}"
+                    + f"{1e3 * summary[prefix + 'lateness_p99']:8.2f}"
+                    + f"{1e3 * summary[prefix + 'lateness_p999']:8.2f}    "
+                    + f"{1e3 * summary[prefix + 'work_p50']:6.2f}"
+                    + f"{1e3 * summary[prefix + 'work_p99']:8.2f}"
+                    + f"{1e3 * summary[prefix + 'work_p999']:8.2f}"
+                    + f"{int(summary[prefix + 'n_beats']):9d}"
+                    + f"{int(summary[prefix + 'n_overruns']):10d}"
+                )
+        return "\n".join(lines)
+
+    def close(self):
+        # The array is a view into the shared memory, and it can't be
+        # closed while it's still around.
+        self.rows = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python -m tools.timing_stats <block name> [--watch]")
+        sys.exit()
+    timing_stats = TimingStats(sys.argv[1])
+    watch = "--watch" in sys.argv[2:]
+    while True:
+        print(timing_stats.report())
+        if not watch:
+            break
+        print()
+        time.sleep(1)
+    timing_stats.close()
@@ -10,32 +10,30 @@ from tools.pacemaker import Pacemaker
 import config
 
 
-def run(sim_viz_info_q, run_viz_alive_q, viz_run_alive_q):
+def run(state_block, heartbeats, timing_stats):
     logger = logging_setup.get_logger("viz", config.LOGGING_LEVEL_VIZ)
     frame = Frame()
     clock_period = 1 / float(config.CLOCK_FREQ_VIZ)
-    pacemaker = Pacemaker(config.CLOCK_FREQ_VIZ)
+    pacemaker = Pacemaker(
+        config.CLOCK_FREQ_VIZ, timing_stats=timing_stats, process_name="viz"
+    )
     n_alive_check = int(config.CLOCK_FREQ_VIZ / config.ALIVE_CHECK_FREQ)
     i_alive_check = 0
-    ts = None
-    viz_info = None
+    last_frame = 0
 
     while True:
         overtime = pacemaker.beat()
 
         # Send a heartbeat from this process to the parent runner process,
         # reassuring it that everything here is okie dokie.
-        viz_run_alive_q.put(True)
+        heartbeats.beat("viz")
 
         # Watch for a heartbeat from the parent runner process.
         # If it is not found, then shut down this process too.
         i_alive_check += 1
 
         if i_alive_check == n_alive_check:
-            runner_is_alive = False
-            while not run_viz_alive_q.empty():
-                runner_is_alive = run_viz_alive_q.get()
-            if not runner_is_alive:
+            if not heartbeats.is_alive("run", config.HEARTBEAT_TIMEOUT):
                 print("Runner process has shut down.")
                 print("Shutting down visualization process.")
                 # sys.exit()
@@ -52,11 +50,34 @@ def run(sim_viz_info_q, run_viz_alive_q, viz_run_alive_q):
             # skip this frame to help catch up.
             continue
 
-        while not sim_viz_info_q.empty():
-            ts, viz_info = sim_viz_info_q.get()
+        # Pick up the latest snapshot of the bodies straight from
+        # shared memory.
+        snapshot = state_block.read()
+        if snapshot is None:
+            continue
+        i_frame, x, y, angle, type_id, alive, token = snapshot
+
+        # The simulation hasn't written a new frame since the last one.
+        if i_frame == last_frame:
+            continue
+        if i_frame > last_frame + 1:
+            logger.debug(
+                json.dumps(
+                    {
+                        "ts": time.time(),
+                        "dropped_frames": int(i_frame - last_frame - 1),
+                    }
+                )
+            )
+        last_frame = i_frame
+
+        frame.update(x, y, angle, type_id, alive)
 
-        logger.debug(json.dumps({"ts": ts, "viz_info": viz_info}))
-        frame.update(viz_info)
+        # If the simulation has lapped this buffer while it was being
+        # drawn, some of the bodies may be a frame ahead of the others.
+        # It will be put right on the next frame.
+        if not state_block.is_intact(token):
+            logger.debug(json.dumps({"ts": time.time(), "torn_frame": True}))
 
 
 class Frame:
@@ -80,35 +101,48 @@ class Frame:
         }
         self.skins = {}
 
-    def update(self, viz_info):
-        if viz_info is None:
-            return
-
-        for body_id in viz_info.keys():
-            body_update_info = viz_info[body_id]
-
-            if body_id not in self.skins:
-                SkinClass = self.skin_classes[body_update_info["type"]]
-                self.skins[body_id] = SkinClass(body_update_info, self.ax)
+    def update(self, x, y, angle, type_id, alive):
+        """
+        Skins are kept by body slot. A slot that is no longer alive
+        has its skin removed. A slot that comes back to life, like a
+        torpedo drawn from the pool, gets a new one.
+        """
+        # Work out every body's rotation at once, rather than
+        # once for each path of each skin.
+        i_alive = np.flatnonzero(alive)
+        cos_angle = np.cos(angle[i_alive])
+        sin_angle = np.sin(angle[i_alive])
+
+        for i_slot, cos_slot, sin_slot in zip(i_alive, cos_angle, sin_angle):
+            body_type = config.BODY_TYPES[type_id[i_slot]]
+            state = {
+                "x": x[i_slot],
+                "y": y[i_slot],
+                "angle": angle[i_slot],
+                "cos_angle": cos_slot,
+                "sin_angle": sin_slot,
+                "type": body_type,
+            }
+
+            skin = self.skins.get(i_slot)
+            if skin is not None and skin.body_type != body_type:
+                skin.remove()
+                skin = None
+
+            if skin is None:
+                SkinClass = self.skin_classes[body_type]
+                self.skins[i_slot] = SkinClass(state, self.ax)
             else:
-                self.skins[body_id].update(body_update_info)
+                skin.update(state)
 
         skins_to_remove = []
-        for skin_id in self.skins.keys():
-            if skin_id not in viz_info:
-                skins_to_remove.append(skin_id)
-
-        for skin in skins_to_remove:
-            try:
-                self.skins[skin_id].remove()
-            except KeyError:
-                # Already removed
-                pass
-            try:
-                del self.skins[skin_id]
-            except KeyError:
-                # Already removed
-                pass
+        for i_slot in self.skins.keys():
+            if not alive[i_slot]:
+                skins_to_remove.append(i_slot)
+
+        for i_slot in skins_to_remove:
+            self.skins[i_slot].remove()
+            del self.skins[i_slot]
 
         self.fig.canvas.flush_events()
 
@@ -131,13 +165,18 @@ class Skin:
 class ShipSkin:
     def __init__(self, state, ax):
         self.ax = ax
+        self.body_type = "ship"
         self.path = config.POLY_PATHS["ship"]
         self.facecolor = config.FACECOLOR["ship"]
         self.edgecolor = config.EDGECOLOR["ship"]
         self.linewidth = config.LINEWIDTH["ship"]
 
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
 
         self.patch = self.ax.add_patch(
@@ -152,7 +191,11 @@ class ShipSkin:
 
     def update(self, state):
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
         self.patch.set_xy(path)
 
@@ -163,13 +206,18 @@ class ShipSkin:
 class TorpedoSkin:
     def __init__(self, state, ax):
         self.ax = ax
+        self.body_type = "torpedo"
         self.path = config.POLY_PATHS["torpedo"]
         self.facecolor = config.FACECOLOR["torpedo"]
         self.edgecolor = config.EDGECOLOR["torpedo"]
         self.linewidth = config.LINEWIDTH["torpedo"]
 
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
 
         self.patch = self.ax.add_patch(
@@ -184,7 +232,11 @@ class TorpedoSkin:
 
     def update(self, state):
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
         self.patch.set_xy(path)
 
@@ -196,13 +248,18 @@ class AsteroidSkin:
     def __init__(self, state, ax):
         self.ax = ax
         asteroid_type = state["type"]
+        self.body_type = asteroid_type
         self.path = config.POLY_PATHS[asteroid_type]
         self.facecolor = config.FACECOLOR[asteroid_type]
         self.edgecolor = config.EDGECOLOR[asteroid_type]
         self.linewidth = config.LINEWIDTH[asteroid_type]
 
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
 
         self.patch = self.ax.add_patch(
@@ -217,7 +274,11 @@ class AsteroidSkin:
 
     def update(self, state):
         path = transform_path(
-            self.path, x=state["x"], y=state["y"], angle=state["angle"]
+            self.path,
+            x=state["x"],
+            y=state["y"],
+            cos_angle=state["cos_angle"],
+            sin_angle=state["sin_angle"],
         )
         self.patch.set_xy(path)
 
@@ -225,11 +286,20 @@ class AsteroidSkin:
         self.patch.remove()
 
 
-def transform_path(base_path, x=0, y=0, angle=0, scale=1):
+def transform_path(
+    base_path, x=0, y=0, angle=0, scale=1, cos_angle=None, sin_angle=None
+):
+    """
+    Rotate, scale, and move a path. If the cosine and sine of the angle
+    are already known, they can be passed in instead of the angle.
+    """
+    if cos_angle is None:
+        cos_angle = np.cos(angle)
+        sin_angle = np.sin(angle)
     rotation_matrix = np.array(
         [
-            [np.cos(angle), np.sin(angle)],
-            [-np.sin(angle), np.cos(angle)],
+            [cos_angle, sin_angle],
+            [-sin_angle, cos_angle],
         ]
     )
 
@@ -0,0 +1,274 @@
+"""
+Compare the time it takes to calculate wall forces
+
+  - the old way, with every atom of every body checked against every
+    wall, treating walls as infinite lines and doing all the math
+    whether an atom is touching or not, and
+  - the new way, with the walls filed into the grid, so that each body
+    is only checked against the walls in the cells it overlaps,
+
+as the number of wall segments around a large arena grows.
+Both get the same bodies, in the same places, and nothing else
+in the step is timed.
+
+The arena is a square whose sides are broken up into many short walls.
+"""
+from time import perf_counter
+import numpy as np
+from numba import njit
+
+import config
+from body import Body
+from walls import Walls
+from world import World, body_wall_forces_numba
+
+n_reps = 20
+n_bodies = 300
+arena_size = 40.0
+wall_counts = [4, 40, 400, 2000]
+
+
+@njit
+def old_wall_forces(
+    f_x,
+    f_y,
+    stiffness_atoms,
+    r_atoms,
+    x_wall,
+    x_n_wall,
+    x_atoms,
+    y_wall,
+    y_n_wall,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    sliding_friction,
+    inelasticity,
+):
+    """
+    The old wall_forces_numba, as it was before walls were given ends.
+    """
+    # i_wall is also i_row
+    for i_wall in range(x_wall.size):
+        # j_atom is also j_col
+        for j_atom in range(x_atoms.size):
+            d_x = x_atoms[j_atom] - x_wall[i_wall]
+            d_y = y_atoms[j_atom] - y_wall[i_wall]
+
+            dx_n = d_x * x_n_wall[i_wall]
+            dy_n = d_y * y_n_wall[i_wall]
+            # Negative distance indicates that the center of the disc
+            # is inside the wall.
+            distance = dx_n + dy_n
+            compression = r_atoms[j_atom] - distance
+            compression = max(compression, 0.0)
+
+            f_total = stiffness_atoms[j_atom] * compression
+
+            # Find the x- and y-components of the total force
+            # with calculated sin (y_n / 1)
+            # and cos (x_n / 1) terms.
+            f_x_wall_contact = f_total * x_n_wall[i_wall]
+            f_y_wall_contact = f_total * y_n_wall[i_wall]
+            f_x[j_atom] += f_x_wall_contact
+            f_y[j_atom] += f_y_wall_contact
+
+            # Friction
+            # Forces from energy dissipation due to lateral velocity
+            f_x_wall_sliding = (
+                -sliding_friction
+                * np.abs(f_y_wall_contact)
+                * np.sign(v_x_atoms[j_atom])
+            )
+            f_y_wall_sliding = (
+                -sliding_friction
+                * np.abs(f_x_wall_contact)
+                * np.sign(v_y_atoms[j_atom])
+            )
+            f_x[j_atom] += f_x_wall_sliding
+            f_y[j_atom] += f_y_wall_sliding
+
+            # Inelasticity
+            # Forces from energy dissipation due to normal velocity
+            f_x_wall_inelastic = (
+                -inelasticity
+                * f_x_wall_contact
+                * np.sign(v_x_atoms[j_atom])
+                * np.sign(x_n_wall[i_wall])
+            )
+            f_y_wall_inelastic = (
+                -inelasticity
+                * f_y_wall_contact
+                * np.sign(v_y_atoms[j_atom])
+                * np.sign(y_n_wall[i_wall])
+            )
+            f_x[j_atom] += f_x_wall_inelastic
+            f_y[j_atom] += f_y_wall_inelastic
+
+
+@njit
+def old_all_walls(
+    n_bodies,
+    alive,
+    atom_start,
+    atom_count,
+    stiffness_atoms,
+    sliding_friction_atoms,
+    inelasticity_atoms,
+    r_atoms,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    x_wall,
+    y_wall,
+    x_n_wall,
+    y_n_wall,
+    f_x,
+    f_y,
+):
+    """
+    The old way. Every body, against every wall.
+    """
+    for i_body in range(n_bodies):
+        if not alive[i_body]:
+            continue
+        i_start = atom_start[i_body]
+        i_end = i_start + atom_count[i_body]
+        old_wall_forces(
+            f_x[i_start:i_end],
+            f_y[i_start:i_end],
+            stiffness_atoms[i_start:i_end],
+            r_atoms[i_start:i_end],
+            x_wall,
+            x_n_wall,
+            x_atoms[i_start:i_end],
+            y_wall,
+            y_n_wall,
+            y_atoms[i_start:i_end],
+            v_x_atoms[i_start:i_end],
+            v_y_atoms[i_start:i_end],
+            sliding_friction_atoms[i_start],
+            inelasticity_atoms[i_start],
+        )
+
+
+def create_world(n_walls):
+    np.random.seed(0)
+    n_per_side = n_walls // 4
+    # The walls bound the arena, so make them infinitely thick.
+    walls = Walls(thickness=np.inf)
+    corners = [
+        (arena_size, arena_size, arena_size, 0.0),
+        (0.0, 0.0, 0.0, arena_size),
+        (arena_size, 0.0, 0.0, 0.0),
+        (0.0, arena_size, arena_size, arena_size),
+    ]
+    for x_left, y_left, x_right, y_right in corners:
+        # Overlap the pieces a little, so there are no gaps to slip through.
+        overlap = 0.5 / n_per_side
+        for i_piece in range(n_per_side):
+            start = max(0.0, i_piece / n_per_side - overlap)
+            end = min(1.0, (i_piece + 1) / n_per_side + overlap)
+            walls.add_wall(
+                {
+                    "x_left": x_left + start * (x_right - x_left),
+                    "y_left": y_left + start * (y_right - y_left),
+                    "x_right": x_left + end * (x_right - x_left),
+                    "y_right": y_left + end * (y_right - y_left),
+                }
+            )
+
+    params = dict(config.A0_BODY)
+    params["id"] = "a0"
+    template = Body(params)
+    world = World(
+        walls, 2 * template.radius, width=arena_size, height=arena_size
+    )
+    for i_body in range(n_bodies):
+        params["id"] = f"a0_{i_body:06}"
+        params["x"] = np.random.sample() * arena_size
+        params["y"] = np.random.sample() * arena_size
+        params["v_x"] = 2 * (0.5 - np.random.sample())
+        params["v_y"] = 2 * (0.5 - np.random.sample())
+        world.add_body(Body(params))
+
+    # Ensure jitted functions are pre-compiled
+    world.step()
+    return world
+
+
+def time_it(run):
+    # Ensure it's compiled before timing it
+    run()
+
+    total_time = 0
+    for i_rep in range(n_reps):
+        start = perf_counter()
+        run()
+        total_time += perf_counter() - start
+    return total_time / n_reps
+
+
+def time_old(world):
+    walls = world.walls
+    n = world.n_atoms
+    materials = world.materials
+    material_atoms = world.material_atoms[:n]
+    i_wall_material = world.wall_material
+    f_x = np.zeros(n)
+    f_y = np.zeros(n)
+    args = (
+        world.n_bodies,
+        world.alive,
+        world.atom_start,
+        world.atom_count,
+        materials.pair_stiffness[material_atoms, i_wall_material],
+        materials.pair_sliding_friction[material_atoms, i_wall_material],
+        materials.pair_inelasticity[material_atoms, i_wall_material],
+        world.r_atoms[:n],
+        world.x_atoms[:n],
+        world.y_atoms[:n],
+        world.v_x_atoms[:n],
+        world.v_y_atoms[:n],
+        walls.x,
+        walls.y,
+        walls.x_n,
+        walls.y_n,
+        f_x,
+        f_y,
+    )
+    return time_it(lambda: old_all_walls(*args))
+
+
+def time_grid(world):
+    walls = world.walls
+    materials = world.materials
+    args = (
+        world.n_bodies,
+        world.bodies,
+        world.atoms,
+        walls.arrays,
+        walls.seen,
+        walls.candidates,
+        world.wall_material,
+        world.grid.cell_size,
+        world.grid.n_cols,
+        world.grid.n_rows,
+        materials.pair_stiffness,
+        materials.pair_sliding_friction,
+        materials.pair_inelasticity,
+    )
+    return time_it(lambda: body_wall_forces_numba(*args))
+
+
+print(f"{n_bodies} bodies in a {arena_size} x {arena_size} arena")
+print("  walls   every wall   nearby walls in the grid")
+for n_walls in wall_counts:
+    world = create_world(n_walls)
+    old_time = time_old(world)
+    grid_time = time_grid(world)
+    print(
+        f"  {world.walls.count:5d}   {1000 * old_time:7.3f} ms"
+        + f"   {1000 * grid_time:7.3f} ms"
+    )
@@ -1,12 +1,59 @@
+from collections import namedtuple
 import numpy as np
 
+# The arrays that describe the walls and the grid they are filed into,
+# bundled up to hand to Numba in one piece
+WallArrays = namedtuple(
+    "WallArrays",
+    [
+        "x",
+        "y",
+        "x_n",
+        "y_n",
+        "x_t",
+        "y_t",
+        "length",
+        "thickness",
+        "cell_start",
+        "cell_walls",
+    ],
+)
+
 
 class Walls:
-    def __init__(self, sliding_friction=None, inelasticity=None):
+    """
+    Walls are straight segments with a front and a back.
+    A wall pushes on any atom that overlaps it from the front,
+    and on any atom that has sunk into it from the front,
+    up to the wall's thickness. Past either end, a wall pushes away
+    from its nearest end point, so its ends are rounded.
+
+    Walls default to being about as thick as a body is wide, so that
+    an atom can't be pushed right through to the back of one.
+    Walls that bound the world should be given an infinite thickness,
+    so that nothing can tunnel through them.
+
+    Rather than checking every atom against every wall, the walls
+    get filed into a uniform grid with build_grid(). Each cell keeps
+    a list of the walls that pass through it, or whose thickness
+    reaches into it. A body then only has to be checked against
+    the walls in the cells it overlaps.
+    """
+
+    def __init__(
+        self, sliding_friction=None, inelasticity=None, thickness=None
+    ):
+        # The left end of each wall
         self.x = np.zeros(0)
         self.y = np.zeros(0)
+        # A unit vector normal to the wall, pointing out from the front
         self.x_n = np.zeros(0)
         self.y_n = np.zeros(0)
+        # A unit vector along the wall, pointing from left to right
+        self.x_t = np.zeros(0)
+        self.y_t = np.zeros(0)
+        self.length = np.zeros(0)
+        self.thickness = np.zeros(0)
         self.count = 0
 
         # Default to a sliding friction coefficient if none is provided.
@@ -21,29 +68,55 @@ class Walls:
         else:
             self.inelasticity = 0.2
 
+        # Default to a thickness if none is provided.
+        if thickness is not None:
+            self.default_thickness = thickness
+        else:
+            self.default_thickness = 0.5
+
+        self.build_grid(1.0, 1, 1)
+
     def add_wall(self, wall_init):
         # def add_wall(self, x_left, y_left, x_right, y_right):
         """
-        Initialize with two points on the line.
-        Imagine you are looking at the wall.
-        One point will be on the left (x_left, y_left)
+        Initialize with the two end points of the wall.
+        Imagine you are looking at the front of the wall.
+        One end will be on the left (x_left, y_left)
         and the other will be on the right (x_right, y_right).
+
+        Optionally, include a "thickness". It defaults to
+        the default_thickness passed to Walls(). For walls that bound
+        the world, pass np.inf.
+
+        After adding walls, call build_grid() again before using them.
         """
         x_left = wall_init["x_left"]
         x_right = wall_init["x_right"]
         y_left = wall_init["y_left"]
         y_right = wall_init["y_right"]
+        try:
+            thickness = wall_init["thickness"]
+        except KeyError:
+            thickness = self.default_thickness
 
-        # A unit vector normal to the surface of the wall
-        # pointing away from the wall.
         x_normal, y_normal = self.calculate_wall_normal(
             x_left, y_left, x_right, y_right
         )
-        # An arbitrary point on the line
+        length = ((x_right - x_left) ** 2 + (y_right - y_left) ** 2) ** 0.5
         self.x = np.concatenate((self.x, np.array([x_left])))
         self.y = np.concatenate((self.y, np.array([y_left])))
         self.x_n = np.concatenate((self.x_n, np.array([x_normal])))
         self.y_n = np.concatenate((self.y_n, np.array([y_normal])))
+        self.x_t = np.concatenate(
+            (self.x_t, np.array([(x_right - x_left) / length]))
+        )
+        self.y_t = np.concatenate(
+            (self.y_t, np.array([(y_right - y_left) / length]))
+        )
+        self.length = np.concatenate((self.length, np.array([length])))
+        self.thickness = np.concatenate(
+            (self.thickness, np.array([thickness]))
+        )
         self.count += 1
         return
 
@@ -56,3 +129,128 @@ class Walls:
         x_normal = (y_right - y_left) / dist_lr
         y_normal = (x_left - x_right) / dist_lr
         return (x_normal, y_normal)
+
+    def build_grid(self, cell_size, n_cols, n_rows):
+        """
+        File each wall into every grid cell that it touches. The grid
+        matches the one the bodies are filed into. As with the bodies,
+        anything beyond the edges of the grid is treated as if it were
+        in the cells along the edge.
+
+        The result is in compressed form. The walls for cell i_cell are
+        cell_walls[cell_start[i_cell]:cell_start[i_cell + 1]].
+        """
+        self.cell_size = cell_size
+        self.n_cols = n_cols
+        self.n_rows = n_rows
+        width = n_cols * cell_size
+        height = n_rows * cell_size
+
+        cells = [[] for _ in range(n_cols * n_rows)]
+        for i_wall in range(self.count):
+            # An infinitely thick wall only needs to reach
+            # past the far side of the grid.
+            thickness = min(self.thickness[i_wall], 2 * (width + height))
+
+            # The four corners of the wall, including its thickness
+            x_left = self.x[i_wall]
+            y_left = self.y[i_wall]
+            x_right = x_left + self.length[i_wall] * self.x_t[i_wall]
+            y_right = y_left + self.length[i_wall] * self.y_t[i_wall]
+            x_back = -thickness * self.x_n[i_wall]
+            y_back = -thickness * self.y_n[i_wall]
+            x_corners = np.array(
+                [x_left, x_right, x_right + x_back, x_left + x_back]
+            )
+            y_corners = np.array(
+                [y_left, y_right, y_right + y_back, y_left + y_back]
+            )
+
+            # Pull everything onto the grid, the same way the bodies are.
+            x_corners = np.clip(x_corners, 0, width - 1e-9)
+            y_corners = np.clip(y_corners, 0, height - 1e-9)
+            col_lo = int(np.min(x_corners) / cell_size)
+            col_hi = int(np.max(x_corners) / cell_size)
+            row_lo = int(np.min(y_corners) / cell_size)
+            row_hi = int(np.max(y_corners) / cell_size)
+
+            for i_row in range(row_lo, row_hi + 1):
+                for i_col in range(col_lo, col_hi + 1):
+                    if self.touches_cell(
+                        i_wall, i_col, i_row, thickness, width, height
+                    ):
+                        cells[i_row * n_cols + i_col].append(i_wall)
+
+        self.cell_start = np.zeros(n_cols * n_rows + 1, dtype=np.int64)
+        self.cell_start[1:] = np.cumsum([len(cell) for cell in cells])
+        self.cell_walls = np.zeros(self.cell_start[-1], dtype=np.int64)
+        for i_cell, cell in enumerate(cells):
+            i_start = self.cell_start[i_cell]
+            i_end = self.cell_start[i_cell + 1]
+            self.cell_walls[i_start:i_end] = cell
+
+        # Scratch space for gathering up the walls near each body
+        self.seen = np.zeros(self.count, dtype=np.bool_)
+        self.candidates = np.zeros(self.count, dtype=np.int64)
+
+        self.arrays = WallArrays(
+            self.x,
+            self.y,
+            self.x_n,
+            self.y_n,
+            self.x_t,
+            self.y_t,
+            self.length,
+            self.thickness,
+            self.cell_start,
+            self.cell_walls,
+        )
+
+    def touches_cell(self, i_wall, i_col, i_row, thickness, width, height):
+        """
+        Check whether the wall, thickness and all, overlaps a cell.
+        Cells along the edges stretch out to infinity.
+        Both shapes are convex, so they overlap unless there is a gap
+        between them along one of their edges.
+        """
+        big = 2 * (width + height) + thickness
+        x_lo = i_col * self.cell_size
+        x_hi = x_lo + self.cell_size
+        y_lo = i_row * self.cell_size
+        y_hi = y_lo + self.cell_size
+        if i_col == 0:
+            x_lo -= big
+        if i_col == self.n_cols - 1:
+            x_hi += big
+        if i_row == 0:
+            y_lo -= big
+        if i_row == self.n_rows - 1:
+            y_hi += big
+
+        # Positions of the cell's corners, along the wall
+        # and out from the front of it
+        d_x = np.array([x_lo, x_hi, x_hi, x_lo]) - self.x[i_wall]
+        d_y = np.array([y_lo, y_lo, y_hi, y_hi]) - self.y[i_wall]
+        along = d_x * self.x_t[i_wall] + d_y * self.y_t[i_wall]
+        out = d_x * self.x_n[i_wall] + d_y * self.y_n[i_wall]
+        if np.max(along) < 0 or np.min(along) > self.length[i_wall]:
+            return False
+        if np.max(out) < -thickness or np.min(out) > 0:
+            return False
+
+        # And the wall's corners, against the cell's edges
+        x_right = self.x[i_wall] + self.length[i_wall] * self.x_t[i_wall]
+        y_right = self.y[i_wall] + self.length[i_wall] * self.y_t[i_wall]
+        x_corners = np.array([self.x[i_wall], x_right])
+        y_corners = np.array([self.y[i_wall], y_right])
+        x_corners = np.concatenate(
+            (x_corners, x_corners - thickness * self.x_n[i_wall])
+        )
+        y_corners = np.concatenate(
+            (y_corners, y_corners - thickness * self.y_n[i_wall])
+        )
+        if np.max(x_corners) < x_lo or np.min(x_corners) > x_hi:
+            return False
+        if np.max(y_corners) < y_lo or np.min(y_corners) > y_hi:
+            return False
+        return True
@@ -0,0 +1,1771 @@
+from collections import namedtuple
+import numpy as np
+from numba import get_num_threads, njit, prange
+
+import config
+from body import (
+    atom_interaction_numba,
+    body_acceleration_numba,
+    place_atoms_numba,
+    place_atoms_rotated_numba,
+    turn_numba,
+    update_positions_numba,
+    wall_forces_numba,
+)
+from grid import (
+    Grid,
+    cell_index_numba,
+    find_pairs_numba,
+    update_cells_numba,
+)
+from materials import Materials
+
+# The arrays that hold one value per body.
+BODY_FIELDS = [
+    ("x", np.float64),
+    ("y", np.float64),
+    ("angle", np.float64),
+    # The cosine and sine of the angle, worked out once per step
+    ("cos_angle", np.float64),
+    ("sin_angle", np.float64),
+    ("v_x", np.float64),
+    ("v_y", np.float64),
+    ("v_rot", np.float64),
+    ("m", np.float64),
+    ("rot_inertia", np.float64),
+    ("radius", np.float64),
+    ("free", np.bool_),
+    ("type_id", np.int64),
+    ("atom_start", np.int64),
+    ("atom_count", np.int64),
+    ("is_contacting", np.bool_),
+    ("destroy_on_contact", np.bool_),
+    ("alive", np.bool_),
+    # Whether the body was awake when the contacts were last cached
+    ("active_cached", np.bool_),
+    ("asleep", np.bool_),
+    ("still_steps", np.int64),
+    # The acceleration found the last time the forces were calculated
+    ("a_x", np.float64),
+    ("a_y", np.float64),
+    ("a_rot", np.float64),
+    # Scratch space for the external forces during a step
+    ("f_x_ext_step", np.float64),
+    ("f_y_ext_step", np.float64),
+    ("torque_ext_step", np.float64),
+    # Scratch space for marking which bodies are alive and awake
+    ("active", np.bool_),
+    # When a body is destroyed by the simulation, its slot number
+    # gets written here.
+    ("destroyed", np.int64),
+]
+# Each of config.INTEGRATORS is carried out in world_step_numba()
+# by one of these. "substep" is Euler, with the step broken up.
+EULER = 0
+VERLET = 1
+RK2 = 2
+INTEGRATOR_IDS = {
+    "euler": EULER,
+    "substep": EULER,
+    "verlet": VERLET,
+    "rk2": RK2,
+}
+
+# The arrays that hold a ring buffer of upcoming external forces per body.
+RING_FIELDS = ["f_x_ext", "f_y_ext", "torque_ext"]
+# The arrays that hold one value per atom.
+ATOM_FIELDS = [
+    ("x_atoms_local", np.float64),
+    ("y_atoms_local", np.float64),
+    ("x_atoms", np.float64),
+    ("y_atoms", np.float64),
+    ("v_x_atoms", np.float64),
+    ("v_y_atoms", np.float64),
+    ("f_x_atoms", np.float64),
+    ("f_y_atoms", np.float64),
+    ("r_atoms", np.float64),
+    ("m_atoms", np.float64),
+    # Which of the Materials each atom is made of
+    ("material_atoms", np.int64),
+    # Where each atom was when the contacts were last cached
+    ("x_atoms_cached", np.float64),
+    ("y_atoms_cached", np.float64),
+    # Whether the atom is in any of the cached contacts
+    ("in_contact", np.bool_),
+]
+# Under each of config.PRECISIONS, the dtype of the per-atom float
+# arrays, and the dtype of the ones that forces get added up in.
+PRECISION_DTYPES = {
+    "float64": (np.float64, np.float64),
+    "float32": (np.float32, np.float32),
+    "mixed": (np.float32, np.float64),
+}
+ACCUMULATOR_FIELDS = ["f_x_atoms", "f_y_atoms"]
+
+# Each set of arrays gets bundled into a namedtuple, to hand to
+# world_step_numba() in one piece. Numba takes namedtuples of arrays
+# as they are, and the fields are read inside just like attributes.
+BodyArrays = namedtuple("BodyArrays", [name for name, _ in BODY_FIELDS])
+RingArrays = namedtuple("RingArrays", RING_FIELDS)
+AtomArrays = namedtuple("AtomArrays", [name for name, _ in ATOM_FIELDS])
+
+
+class World:
+    """
+    All the bodies in the simulation, packed together into one set
+    of contiguous arrays. Body-level quantities, like position, velocity,
+    and mass, get one element per body. Atom-level quantities get one
+    element per atom, with the atoms of each body stored next to each other.
+    atom_start and atom_count tell where each body's atoms live.
+
+    This lets a whole time step, collisions, walls, and all, be
+    computed by a single call to world_step_numba(), so that the
+    cost of crossing from Python into Numba doesn't grow
+    with the number of bodies.
+
+    Each body lives in a slot. When a body is removed its slot is
+    marked as no longer alive and set aside in a pool for its type.
+    Bodies that come and go often, like torpedoes, can have a pool
+    of slots created for them up front with create_pool(). Then spawn()
+    brings one back to life without allocating any new arrays.
+
+    Bodies that come to rest are put to sleep. A sleeping body doesn't
+    move and isn't checked against walls or against other sleeping
+    bodies, so the cost of a step grows with the number of bodies
+    that are awake, rather than with all of them. A sleeping body
+    wakes up when an awake, moving body comes near it, or when
+    an external force is applied to it.
+
+    Bodies are moved according to the forces on them using one
+    of config.INTEGRATORS. See config.py for what each of them offers.
+
+    Contact forces can optionally be calculated in parallel across
+    all the available cores. Each thread gets its own set of force
+    accumulators, one chunk per thread, so that they don't collide.
+
+    From one step to the next, which atoms are touching barely
+    changes. Rather than checking every atom of a pair of bodies against
+    every atom of the other, the pairs of atoms that are close to touching
+    are cached, with contact_skin of room to spare. Only those get
+    checked, until some atom moves far enough to make the cache stale.
+
+    The per-atom arrays can be kept in single precision, which cuts
+    their memory by almost half. It doesn't make a step measurably
+    faster. See config.PRECISIONS.
+
+    Initialize with a Walls object and a Grid cell size.
+    """
+
+    def __init__(
+        self,
+        walls,
+        cell_size,
+        parallel=False,
+        width=config.WORLD_WIDTH,
+        height=config.WORLD_HEIGHT,
+        integrator=config.INTEGRATOR,
+        precision=config.PRECISION,
+    ):
+        if integrator not in config.INTEGRATORS:
+            raise ValueError(
+                f"integrator needs to be one of {config.INTEGRATORS}"
+            )
+        if precision not in config.PRECISIONS:
+            raise ValueError(
+                f"precision needs to be one of {config.PRECISIONS}"
+            )
+        self.integrator = integrator
+        self.precision = precision
+        self.storage_dtype, self.accumulator_dtype = PRECISION_DTYPES[
+            precision
+        ]
+        self.incremental_rotation = config.INCREMENTAL_ROTATION
+        self.walls = walls
+        self.materials = Materials(dtype=self.storage_dtype)
+        self.wall_material = self.materials.add(
+            np.inf, walls.sliding_friction, walls.inelasticity
+        )
+        self.grid = Grid(cell_size, width=width, height=height)
+        # The walls get filed into the same grid cells as the bodies.
+        self.walls.build_grid(
+            self.grid.cell_size, self.grid.n_cols, self.grid.n_rows
+        )
+
+        self.parallel = parallel
+        if parallel:
+            self.n_chunks = get_num_threads()
+        else:
+            self.n_chunks = 1
+        self.n_bodies = 0
+        self.n_atoms = 0
+        self.names = []
+        self.types = []
+        self.index = {}
+
+        # For each type of body, the slots that are free to be reused,
+        # a body to use as a template when creating more,
+        # and the total number of slots.
+        self.free_slots = {}
+        self.pool_templates = {}
+        self.pool_sizes = {}
+
+        # The cached pairs of atoms close enough to touch.
+        # Each row holds the two bodies, then the two atoms.
+        # It grows if it ever runs out of room. A count of -1
+        # means the cache needs to be filled before it's used.
+        self.contact_skin = config.CONTACT_SKIN
+        self.contacts = np.zeros((16, 4), dtype=np.int64)
+        self.n_contacts = -1
+
+        # How still a body has to be, and for how long, before it sleeps
+        self.sleep_speed = config.SLEEP_SPEED
+        self.sleep_spin = config.SLEEP_SPIN
+        self.sleep_steps = config.SLEEP_STEPS
+
+        # External forces are queued up in ring buffers, one row per body,
+        # all advancing together through a shared index.
+        # Each holds one second's worth of physics steps.
+        self.n_ring = config.PHYSICS_FREQ
+        self.i_ring = 0
+
+        self.body_capacity = 0
+        self.atom_capacity = 0
+        for name, dtype in BODY_FIELDS:
+            setattr(self, name, np.zeros(0, dtype=dtype))
+        for name in RING_FIELDS:
+            setattr(self, name, np.zeros((0, self.n_ring)))
+        for name, dtype in ATOM_FIELDS:
+            setattr(
+                self, name, np.zeros(0, dtype=self._atom_dtype(name, dtype))
+            )
+        self._grow_bodies(8)
+        self._grow_atoms(64)
+
+        # When new slots are added, the grid needs to be rebuilt.
+        self.changed = True
+
+    def _grow_bodies(self, capacity):
+        n_new = capacity - self.body_capacity
+        for name, dtype in BODY_FIELDS:
+            setattr(
+                self,
+                name,
+                np.concatenate(
+                    (getattr(self, name), np.zeros(n_new, dtype=dtype))
+                ),
+            )
+        for name in RING_FIELDS:
+            setattr(
+                self,
+                name,
+                np.concatenate(
+                    (getattr(self, name), np.zeros((n_new, self.n_ring)))
+                ),
+            )
+        self.is_contacting_chunks = np.zeros(
+            (self.n_chunks, capacity), dtype=np.bool_
+        )
+        self.bodies = BodyArrays(
+            *[getattr(self, name) for name, _ in BODY_FIELDS]
+        )
+        self.rings = RingArrays(*[getattr(self, name) for name in RING_FIELDS])
+        self.body_capacity = capacity
+
+    def _grow_atoms(self, capacity):
+        n_new = capacity - self.atom_capacity
+        for name, dtype in ATOM_FIELDS:
+            setattr(
+                self,
+                name,
+                np.concatenate(
+                    (
+                        getattr(self, name),
+                        np.zeros(n_new, dtype=self._atom_dtype(name, dtype)),
+                    )
+                ),
+            )
+        self.f_x_chunks = np.zeros(
+            (self.n_chunks, capacity), dtype=self.accumulator_dtype
+        )
+        self.f_y_chunks = np.zeros(
+            (self.n_chunks, capacity), dtype=self.accumulator_dtype
+        )
+        self.atoms = AtomArrays(
+            *[getattr(self, name) for name, _ in ATOM_FIELDS]
+        )
+        self.atom_capacity = capacity
+
+    def _atom_dtype(self, name, dtype):
+        """
+        The dtype a per-atom array gets under this World's precision.
+        """
+        if dtype is not np.float64:
+            return dtype
+        if name in ACCUMULATOR_FIELDS:
+            return self.accumulator_dtype
+        return self.storage_dtype
+
+    def add_body(self, body):
+        """
+        Copy a Body into a brand new slot in the world.
+        Returns the index of the slot.
+        """
+        if self.n_bodies == self.body_capacity:
+            self._grow_bodies(2 * self.body_capacity)
+        while self.n_atoms + body.n_atoms > self.atom_capacity:
+            self._grow_atoms(2 * self.atom_capacity)
+
+        i_body = self.n_bodies
+        self.x[i_body] = body.x
+        self.y[i_body] = body.y
+        self.angle[i_body] = body.angle
+        self.cos_angle[i_body] = np.cos(body.angle)
+        self.sin_angle[i_body] = np.sin(body.angle)
+        self.v_x[i_body] = body.v_x
+        self.v_y[i_body] = body.v_y
+        self.v_rot[i_body] = body.v_rot
+        self.m[i_body] = body.m
+        self.rot_inertia[i_body] = body.rot_inertia
+        self.radius[i_body] = body.radius
+        self.free[i_body] = body.free
+        self.type_id[i_body] = config.BODY_TYPES.index(body.type)
+        self.atom_start[i_body] = self.n_atoms
+        self.atom_count[i_body] = body.n_atoms
+        self.is_contacting[i_body] = False
+        self.destroy_on_contact[i_body] = body.destroy_on_contact
+        self.alive[i_body] = True
+        self.asleep[i_body] = False
+        self.still_steps[i_body] = 0
+        self.a_x[i_body] = 0.0
+        self.a_y[i_body] = 0.0
+        self.a_rot[i_body] = 0.0
+        self.f_x_ext[i_body, :] = 0.0
+        self.f_y_ext[i_body, :] = 0.0
+        self.torque_ext[i_body, :] = 0.0
+
+        i_start = self.n_atoms
+        i_end = self.n_atoms + body.n_atoms
+        self.x_atoms_local[i_start:i_end] = body.x_atoms_local
+        self.y_atoms_local[i_start:i_end] = body.y_atoms_local
+        self.x_atoms[i_start:i_end] = body.x_atoms
+        self.y_atoms[i_start:i_end] = body.y_atoms
+        self.v_x_atoms[i_start:i_end] = body.v_x_atoms
+        self.v_y_atoms[i_start:i_end] = body.v_y_atoms
+        self.f_x_atoms[i_start:i_end] = 0.0
+        self.f_y_atoms[i_start:i_end] = 0.0
+        self.r_atoms[i_start:i_end] = body.r_atoms
+        self.m_atoms[i_start:i_end] = body.m_atoms
+        # Each distinct stiffness among the body's atoms
+        # makes for a different material.
+        stiffnesses, i_stiffness = np.unique(
+            body.stiffness_atoms, return_inverse=True
+        )
+        material_ids = np.array(
+            [
+                self.materials.add(
+                    stiffness, body.sliding_friction, body.inelasticity
+                )
+                for stiffness in stiffnesses
+            ],
+            dtype=np.int64,
+        )
+        self.material_atoms[i_start:i_end] = material_ids[i_stiffness]
+
+        self.names.append(body.name)
+        self.types.append(body.type)
+        self.index[body.name] = i_body
+        self.free_slots.setdefault(body.type, [])
+        self.pool_sizes[body.type] = self.pool_sizes.get(body.type, 0) + 1
+        self.n_bodies += 1
+        self.n_atoms = i_end
+        self.changed = True
+        return i_body
+
+    def create_pool(self, body, n_slots):
+        """
+        Set aside n_slots slots shaped like body, ready to be spawn()-ed.
+        """
+        self.pool_templates[body.type] = body
+        for _ in range(n_slots):
+            i_body = self.add_body(body)
+            self.remove_bodies([i_body])
+
+    def spawn(self, body_type, name, x, y):
+        """
+        Bring a body to life in a free slot from the pool for its type,
+        at position (x, y), with the orientation and velocities
+        of the pool's template. Returns the index of the slot.
+        """
+        if len(self.free_slots[body_type]) == 0:
+            # Double the pool if it has run dry.
+            self.create_pool(
+                self.pool_templates[body_type], self.pool_sizes[body_type]
+            )
+
+        template = self.pool_templates[body_type]
+        i_body = self.free_slots[body_type].pop()
+        self.x[i_body] = x
+        self.y[i_body] = y
+        self.angle[i_body] = template.angle
+        self.cos_angle[i_body] = np.cos(template.angle)
+        self.sin_angle[i_body] = np.sin(template.angle)
+        self.v_x[i_body] = template.v_x
+        self.v_y[i_body] = template.v_y
+        self.v_rot[i_body] = template.v_rot
+        self.is_contacting[i_body] = False
+        self.alive[i_body] = True
+        self.asleep[i_body] = False
+        self.still_steps[i_body] = 0
+        self.a_x[i_body] = 0.0
+        self.a_y[i_body] = 0.0
+        self.a_rot[i_body] = 0.0
+        self.f_x_ext[i_body, :] = 0.0
+        self.f_y_ext[i_body, :] = 0.0
+        self.torque_ext[i_body, :] = 0.0
+
+        i_start = self.atom_start[i_body]
+        i_end = i_start + self.atom_count[i_body]
+        place_atoms_numba(
+            self.x_atoms_local[i_start:i_end],
+            self.y_atoms_local[i_start:i_end],
+            self.x_atoms[i_start:i_end],
+            self.y_atoms[i_start:i_end],
+            self.v_x_atoms[i_start:i_end],
+            self.v_y_atoms[i_start:i_end],
+            self.x[i_body],
+            self.y[i_body],
+            self.angle[i_body],
+            self.v_x[i_body],
+            self.v_y[i_body],
+            self.v_rot[i_body],
+        )
+
+        self.names[i_body] = name
+        self.index[name] = i_body
+        return i_body
+
+    def remove_bodies(self, i_bodies):
+        """
+        Take the bodies at the indices in i_bodies out of the simulation,
+        freeing up their slots to be reused by bodies of the same type.
+        """
+        for i_body in i_bodies:
+            self.alive[i_body] = False
+            self.free_slots[self.types[i_body]].append(i_body)
+            self.index.pop(self.names[i_body], None)
+
+    def pool_occupancy(self, body_type):
+        """
+        Returns the number of slots in use and the total number
+        of slots in the pool for body_type.
+        """
+        n_slots = self.pool_sizes.get(body_type, 0)
+        n_free = len(self.free_slots.get(body_type, []))
+        return n_slots - n_free, n_slots
+
+    def add_force(self, i_body, shape, f_x=0.0, f_y=0.0, torque=0.0):
+        """
+        Queue up external forces on a body. shape is an array
+        of values, one for each of the upcoming time steps.
+        It gets scaled by each of f_x, f_y, and torque.
+        A body that gets pushed wakes up.
+        """
+        self.asleep[i_body] = False
+        self.still_steps[i_body] = 0
+        add_to_ring_numba(self.f_x_ext[i_body], self.i_ring, shape, f_x)
+        add_to_ring_numba(self.f_y_ext[i_body], self.i_ring, shape, f_y)
+        add_to_ring_numba(
+            self.torque_ext[i_body], self.i_ring, shape, torque
+        )
+
+    def stable_dt(self):
+        """
+        Estimate the longest time step that semi-implicit Euler
+        can take without the stiffest contact blowing up.
+
+        An atom pressed against a wall acts like a mass on a spring.
+        It oscillates at omega = sqrt(k / m), where m is the mass
+        the atom carries along with it, its whole body's mass and
+        rotational inertia, as felt from where the atom sits.
+        Semi-implicit Euler is stable as long as dt < 2 / omega.
+        """
+        epsilon = 1e-10
+        omega_squared = 0.0
+        for i_body in range(self.n_bodies):
+            if not self.free[i_body]:
+                continue
+            i_start = self.atom_start[i_body]
+            i_end = i_start + self.atom_count[i_body]
+            r_squared = (
+                self.x_atoms_local[i_start:i_end] ** 2
+                + self.y_atoms_local[i_start:i_end] ** 2
+            )
+            omega_squared = max(
+                omega_squared,
+                np.max(
+                    self.materials.stiffness[
+                        self.material_atoms[i_start:i_end]
+                    ]
+                    * (
+                        1 / self.m[i_body]
+                        + r_squared / (self.rot_inertia[i_body] + epsilon)
+                    )
+                ),
+            )
+        if omega_squared == 0.0:
+            return np.inf
+        return 2 / np.sqrt(omega_squared)
+
+    def step(self, dt=config.PHYSICS_PERIOD):
+        n = self.n_bodies
+        if self.changed:
+            self.grid.rebuild(self.x[:n], self.y[:n], self.alive[:n])
+            self._stable_dt = self.stable_dt()
+            self.n_contacts = -1
+            self.changed = False
+
+        (
+            self.grid.pairs,
+            self.contacts,
+            self.n_contacts,
+            self.i_ring,
+            n_destroyed,
+        ) = world_step_numba(
+            n,
+            self.n_atoms,
+            self.bodies,
+            self.rings,
+            self.i_ring,
+            self.atoms,
+            self.materials.pair_stiffness,
+            self.materials.pair_sliding_friction,
+            self.materials.pair_inelasticity,
+            self.grid.cell_size,
+            self.grid.n_cols,
+            self.grid.n_rows,
+            self.grid.cell_head,
+            self.grid.body_cell,
+            self.grid.body_next,
+            self.grid.body_prev,
+            self.grid.pairs,
+            self.contacts,
+            self.n_contacts,
+            self.contact_skin,
+            self.walls.arrays,
+            self.walls.seen,
+            self.walls.candidates,
+            self.wall_material,
+            self.parallel,
+            self.f_x_chunks,
+            self.f_y_chunks,
+            self.is_contacting_chunks,
+            config.GRAVITY,
+            self.sleep_speed,
+            self.sleep_spin,
+            self.sleep_steps,
+            INTEGRATOR_IDS[self.integrator],
+            count_substeps(self.integrator, dt, self._stable_dt),
+            self.incremental_rotation,
+            dt,
+        )
+
+        # Free up the slots of bodies that were destroyed.
+        if n_destroyed > 0:
+            self.remove_bodies(self.destroyed[:n_destroyed])
+
+    def get_state(self, i_body):
+        """
+        Returns a dict describing the body in slot i_body,
+        or None if it isn't alive.
+        """
+        if not self.alive[i_body]:
+            return None
+        viz_info = {
+            "x": self.x[i_body],
+            "y": self.y[i_body],
+            "angle": self.angle[i_body],
+            "type": self.types[i_body],
+        }
+        return viz_info
+
+
+def count_substeps(integrator, dt, stable_dt):
+    """
+    The number of pieces to break a step of dt into.
+    Only the "substep" integrator breaks it up, into pieces
+    comfortably shorter than stable_dt.
+    """
+    if integrator != "substep":
+        return 1
+    return max(1, int(np.ceil(dt / (config.SUBSTEP_SAFETY * stable_dt))))
+
+
+@njit(cache=True)
+def add_to_ring_numba(ring, i_ring, shape, scale):
+    """
+    Add shape * scale into ring, starting at position i_ring
+    and wrapping around the end if need be.
+    """
+    if scale == 0.0:
+        return
+    n = ring.size
+    if shape.size > n:
+        raise IndexError("Trying to add an array larger than the ring buffer")
+    for i in range(shape.size):
+        i_wrapped = i_ring + i
+        if i_wrapped >= n:
+            i_wrapped -= n
+        ring[i_wrapped] += shape[i] * scale
+
+
+@njit(cache=True)
+def world_step_numba(
+    n_bodies,
+    n_atoms,
+    bodies,
+    rings,
+    i_ring,
+    atoms,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_cell,
+    body_next,
+    body_prev,
+    pairs,
+    contacts,
+    n_contacts,
+    contact_skin,
+    walls,
+    wall_seen,
+    wall_candidates,
+    wall_material,
+    parallel,
+    f_x_chunks,
+    f_y_chunks,
+    is_contacting_chunks,
+    gravity,
+    sleep_speed,
+    sleep_spin,
+    sleep_steps,
+    integrator,
+    n_substeps,
+    incremental_rotation,
+    dt,
+):
+    """
+    Advance every body in the world by one time step.
+
+    bodies, rings, and atoms are a BodyArrays, a RingArrays,
+    and an AtomArrays. walls is a WallArrays.
+
+    Bodies that aren't alive are skipped over. Bodies that are
+    destroyed on contact and touched something are no longer alive
+    at the end of the step, and their indices are written into destroyed.
+    Bodies that are asleep are left where they are.
+
+    The step is taken with the integrator given by one of EULER,
+    VERLET, or RK2, and split into n_substeps equal pieces.
+    a_x, a_y, and a_rot hold each body's most recent acceleration.
+    cos_angle and sin_angle hold its rotation. With incremental_rotation
+    they are turned a little each step, rather than worked out
+    from scratch.
+
+    The pairs of atoms close enough to touch are cached in contacts.
+    See world_forces_numba().
+
+    Returns the array of candidate pairs and the array of contacts,
+    each replaced with a larger one if it ran out of room,
+    the number of contacts, the updated ring index,
+    and the number of bodies destroyed.
+    """
+    x = bodies.x
+    y = bodies.y
+    angle = bodies.angle
+    cos_angle = bodies.cos_angle
+    sin_angle = bodies.sin_angle
+    v_x = bodies.v_x
+    v_y = bodies.v_y
+    v_rot = bodies.v_rot
+    m = bodies.m
+    rot_inertia = bodies.rot_inertia
+    free = bodies.free
+    atom_start = bodies.atom_start
+    atom_count = bodies.atom_count
+    is_contacting = bodies.is_contacting
+    destroy_on_contact = bodies.destroy_on_contact
+    alive = bodies.alive
+    asleep = bodies.asleep
+    still_steps = bodies.still_steps
+    destroyed = bodies.destroyed
+    a_x = bodies.a_x
+    a_y = bodies.a_y
+    a_rot = bodies.a_rot
+    f_x_ext_step = bodies.f_x_ext_step
+    f_y_ext_step = bodies.f_y_ext_step
+    torque_ext_step = bodies.torque_ext_step
+    x_atoms_local = atoms.x_atoms_local
+    y_atoms_local = atoms.y_atoms_local
+    x_atoms = atoms.x_atoms
+    y_atoms = atoms.y_atoms
+    v_x_atoms = atoms.v_x_atoms
+    v_y_atoms = atoms.v_y_atoms
+    f_x_atoms = atoms.f_x_atoms
+    f_y_atoms = atoms.f_y_atoms
+
+    for i_body in range(n_bodies):
+        is_contacting[i_body] = False
+
+    # Take this step's external forces off the ring buffers.
+    # A push from outside wakes a body up.
+    for i_body in range(n_bodies):
+        if not alive[i_body]:
+            continue
+        f_x_ext_step[i_body] = rings.f_x_ext[i_body, i_ring]
+        f_y_ext_step[i_body] = rings.f_y_ext[i_body, i_ring]
+        torque_ext_step[i_body] = rings.torque_ext[i_body, i_ring]
+        rings.f_x_ext[i_body, i_ring] = 0.0
+        rings.f_y_ext[i_body, i_ring] = 0.0
+        rings.torque_ext[i_body, i_ring] = 0.0
+        if asleep[i_body] and (
+            f_x_ext_step[i_body] != 0
+            or f_y_ext_step[i_body] != 0
+            or torque_ext_step[i_body] != 0
+        ):
+            asleep[i_body] = False
+            still_steps[i_body] = 0
+        f_y_ext_step[i_body] += gravity * m[i_body]
+
+    # RK2 finds the forces twice per step, once at the start
+    # and once at the end of a trial step. The others find them once.
+    if integrator == RK2:
+        n_passes = 2
+    else:
+        n_passes = 1
+
+    h = dt / n_substeps
+    for i_substep in range(n_substeps):
+        if integrator == VERLET:
+            # Velocity Verlet first moves each body using its velocity
+            # and its acceleration from the end of the last step.
+            for i_body in range(n_bodies):
+                if not alive[i_body] or asleep[i_body] or not free[i_body]:
+                    continue
+                x[i_body] += h * v_x[i_body] + 0.5 * h**2 * a_x[i_body]
+                y[i_body] += h * v_y[i_body] + 0.5 * h**2 * a_y[i_body]
+                angle[i_body], cos_angle[i_body], sin_angle[i_body] = (
+                    turn_numba(
+                        angle[i_body],
+                        cos_angle[i_body],
+                        sin_angle[i_body],
+                        h * v_rot[i_body] + 0.5 * h**2 * a_rot[i_body],
+                        incremental_rotation,
+                    )
+                )
+                # The velocity-dependent forces, friction and inelasticity,
+                # use a prediction of the velocity at the new position.
+                i_start = atom_start[i_body]
+                i_end = i_start + atom_count[i_body]
+                place_atoms_rotated_numba(
+                    x_atoms_local[i_start:i_end],
+                    y_atoms_local[i_start:i_end],
+                    x_atoms[i_start:i_end],
+                    y_atoms[i_start:i_end],
+                    v_x_atoms[i_start:i_end],
+                    v_y_atoms[i_start:i_end],
+                    x[i_body],
+                    y[i_body],
+                    cos_angle[i_body],
+                    sin_angle[i_body],
+                    v_x[i_body] + h * a_x[i_body],
+                    v_y[i_body] + h * a_y[i_body],
+                    v_rot[i_body] + h * a_rot[i_body],
+                )
+
+        for i_pass in range(n_passes):
+            pairs, contacts, n_contacts = world_forces_numba(
+                n_bodies,
+                n_atoms,
+                bodies,
+                atoms,
+                pair_stiffness,
+                pair_sliding_friction,
+                pair_inelasticity,
+                cell_size,
+                n_cols,
+                n_rows,
+                cell_head,
+                body_cell,
+                body_next,
+                body_prev,
+                pairs,
+                contacts,
+                n_contacts,
+                contact_skin,
+                walls,
+                wall_seen,
+                wall_candidates,
+                wall_material,
+                parallel,
+                f_x_chunks,
+                f_y_chunks,
+                is_contacting_chunks,
+                gravity,
+                sleep_speed,
+                sleep_spin,
+            )
+
+            # Update atoms' positions based on the forces that act on them.
+            for i_body in range(n_bodies):
+                if not alive[i_body] or asleep[i_body] or not free[i_body]:
+                    continue
+                i_start = atom_start[i_body]
+                i_end = i_start + atom_count[i_body]
+
+                if integrator == EULER:
+                    (
+                        x[i_body],
+                        y[i_body],
+                        angle[i_body],
+                        cos_angle[i_body],
+                        sin_angle[i_body],
+                        v_x[i_body],
+                        v_y[i_body],
+                        v_rot[i_body],
+                    ) = update_positions_numba(
+                        x_atoms_local[i_start:i_end],
+                        y_atoms_local[i_start:i_end],
+                        x_atoms[i_start:i_end],
+                        y_atoms[i_start:i_end],
+                        v_x_atoms[i_start:i_end],
+                        v_y_atoms[i_start:i_end],
+                        f_x_atoms[i_start:i_end],
+                        f_y_atoms[i_start:i_end],
+                        x[i_body],
+                        y[i_body],
+                        angle[i_body],
+                        cos_angle[i_body],
+                        sin_angle[i_body],
+                        v_x[i_body],
+                        v_y[i_body],
+                        v_rot[i_body],
+                        m[i_body],
+                        rot_inertia[i_body],
+                        f_x_ext_step[i_body],
+                        f_y_ext_step[i_body],
+                        torque_ext_step[i_body],
+                        h,
+                        incremental_rotation,
+                    )
+                    continue
+
+                a_x_new, a_y_new, a_rot_new = body_acceleration_numba(
+                    x_atoms[i_start:i_end],
+                    y_atoms[i_start:i_end],
+                    f_x_atoms[i_start:i_end],
+                    f_y_atoms[i_start:i_end],
+                    x[i_body],
+                    y[i_body],
+                    m[i_body],
+                    rot_inertia[i_body],
+                    f_x_ext_step[i_body],
+                    f_y_ext_step[i_body],
+                    torque_ext_step[i_body],
+                )
+                if integrator == VERLET:
+                    # Then finishes updating the velocity with the average
+                    # of the old and new accelerations.
+                    v_x[i_body] += 0.5 * h * (a_x[i_body] + a_x_new)
+                    v_y[i_body] += 0.5 * h * (a_y[i_body] + a_y_new)
+                    v_rot[i_body] += 0.5 * h * (a_rot[i_body] + a_rot_new)
+                elif i_pass == 0:
+                    # RK2, Heun's method, takes a trial Euler step here.
+                    # After finding the forces at the end of it, the step
+                    # is corrected, on the second pass, to use the average
+                    # of the velocities and accelerations at its start
+                    # and end.
+                    x[i_body] += h * v_x[i_body]
+                    y[i_body] += h * v_y[i_body]
+                    angle[i_body], cos_angle[i_body], sin_angle[i_body] = (
+                        turn_numba(
+                            angle[i_body],
+                            cos_angle[i_body],
+                            sin_angle[i_body],
+                            h * v_rot[i_body],
+                            incremental_rotation,
+                        )
+                    )
+                    v_x[i_body] += h * a_x_new
+                    v_y[i_body] += h * a_y_new
+                    v_rot[i_body] += h * a_rot_new
+                else:
+                    # The trial step moved the body by h * v_start,
+                    # and changed its velocity by h * a_start, so the
+                    # corrections to get the average of the start and end
+                    # of the step are these.
+                    x[i_body] += 0.5 * h**2 * a_x[i_body]
+                    y[i_body] += 0.5 * h**2 * a_y[i_body]
+                    angle[i_body], cos_angle[i_body], sin_angle[i_body] = (
+                        turn_numba(
+                            angle[i_body],
+                            cos_angle[i_body],
+                            sin_angle[i_body],
+                            0.5 * h**2 * a_rot[i_body],
+                            incremental_rotation,
+                        )
+                    )
+                    v_x[i_body] += 0.5 * h * (a_x_new - a_x[i_body])
+                    v_y[i_body] += 0.5 * h * (a_y_new - a_y[i_body])
+                    v_rot[i_body] += 0.5 * h * (a_rot_new - a_rot[i_body])
+                a_x[i_body] = a_x_new
+                a_y[i_body] = a_y_new
+                a_rot[i_body] = a_rot_new
+                place_atoms_rotated_numba(
+                    x_atoms_local[i_start:i_end],
+                    y_atoms_local[i_start:i_end],
+                    x_atoms[i_start:i_end],
+                    y_atoms[i_start:i_end],
+                    v_x_atoms[i_start:i_end],
+                    v_y_atoms[i_start:i_end],
+                    x[i_body],
+                    y[i_body],
+                    cos_angle[i_body],
+                    sin_angle[i_body],
+                    v_x[i_body],
+                    v_y[i_body],
+                    v_rot[i_body],
+                )
+
+    # Put bodies to sleep if they have been still for long enough.
+    # Bodies that aren't free never move, so they can always sleep.
+    sleep_speed_squared = sleep_speed**2
+    for i_body in range(n_bodies):
+        if not alive[i_body] or asleep[i_body] or sleep_steps <= 0:
+            continue
+        if free[i_body] and (
+            v_x[i_body] ** 2 + v_y[i_body] ** 2 > sleep_speed_squared
+            or abs(v_rot[i_body]) > sleep_spin
+        ):
+            still_steps[i_body] = 0
+            continue
+        still_steps[i_body] += 1
+        if still_steps[i_body] >= sleep_steps:
+            asleep[i_body] = True
+            v_x[i_body] = 0.0
+            v_y[i_body] = 0.0
+            v_rot[i_body] = 0.0
+            a_x[i_body] = 0.0
+            a_y[i_body] = 0.0
+            a_rot[i_body] = 0.0
+            i_start = atom_start[i_body]
+            i_end = i_start + atom_count[i_body]
+            for i_atom in range(i_start, i_end):
+                v_x_atoms[i_atom] = 0.0
+                v_y_atoms[i_atom] = 0.0
+
+    # Destroy bodies, like torpedoes, that have hit something.
+    n_destroyed = 0
+    for i_body in range(n_bodies):
+        if alive[i_body] and is_contacting[i_body]:
+            if destroy_on_contact[i_body]:
+                alive[i_body] = False
+                destroyed[n_destroyed] = i_body
+                n_destroyed += 1
+
+    i_ring += 1
+    if i_ring >= rings.f_x_ext.shape[1]:
+        i_ring = 0
+
+    return pairs, contacts, n_contacts, i_ring, n_destroyed
+
+
+@njit(cache=True)
+def world_forces_numba(
+    n_bodies,
+    n_atoms,
+    bodies,
+    atoms,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_cell,
+    body_next,
+    body_prev,
+    pairs,
+    contacts,
+    n_contacts,
+    contact_skin,
+    walls,
+    wall_seen,
+    wall_candidates,
+    wall_material,
+    parallel,
+    f_x_chunks,
+    f_y_chunks,
+    is_contacting_chunks,
+    gravity,
+    sleep_speed,
+    sleep_spin,
+):
+    """
+    Find the forces on every atom, where the bodies are right now.
+    Contacts between bodies, contacts with walls, and gravity
+    are all tallied up in f_x_atoms and f_y_atoms.
+    Bodies that touched anything are marked in is_contacting.
+
+    Contacts between bodies are only checked between the pairs
+    of atoms cached in contacts. The first n_contacts of them are
+    good to use, unless it's -1, or the atoms have moved too far
+    since they were cached. Then they are found again.
+
+    Returns the array of candidate pairs and the array of contacts,
+    each replaced with a larger one if it ran out of room,
+    and the number of contacts.
+    """
+    x = bodies.x
+    y = bodies.y
+    v_x = bodies.v_x
+    v_y = bodies.v_y
+    v_rot = bodies.v_rot
+    radius = bodies.radius
+    atom_start = bodies.atom_start
+    atom_count = bodies.atom_count
+    is_contacting = bodies.is_contacting
+    alive = bodies.alive
+    active_cached = bodies.active_cached
+    asleep = bodies.asleep
+    still_steps = bodies.still_steps
+    active = bodies.active
+    x_atoms = atoms.x_atoms
+    y_atoms = atoms.y_atoms
+    v_x_atoms = atoms.v_x_atoms
+    v_y_atoms = atoms.v_y_atoms
+    f_x_atoms = atoms.f_x_atoms
+    f_y_atoms = atoms.f_y_atoms
+    r_atoms = atoms.r_atoms
+    m_atoms = atoms.m_atoms
+    material_atoms = atoms.material_atoms
+    x_atoms_cached = atoms.x_atoms_cached
+    y_atoms_cached = atoms.y_atoms_cached
+    in_contact = atoms.in_contact
+
+    for i_atom in range(n_atoms):
+        f_x_atoms[i_atom] = 0.0
+        f_y_atoms[i_atom] = 0.0
+
+    # Find which bodies are close enough to merit calculating interactions.
+    update_cells_numba(
+        x[:n_bodies],
+        y[:n_bodies],
+        alive[:n_bodies],
+        cell_size,
+        n_cols,
+        n_rows,
+        cell_head,
+        body_cell,
+        body_next,
+        body_prev,
+    )
+    r_max = 0.0
+    for i_body in range(n_bodies):
+        active[i_body] = alive[i_body] and not asleep[i_body]
+        if alive[i_body]:
+            r_max = max(r_max, radius[i_body])
+
+    pairs, n_pairs = find_active_pairs_numba(
+        x[:n_bodies],
+        y[:n_bodies],
+        radius[:n_bodies],
+        active[:n_bodies],
+        r_max,
+        cell_size,
+        n_cols,
+        n_rows,
+        cell_head,
+        body_next,
+        pairs,
+    )
+
+    # Wake up any sleeping body that a moving body has come close to.
+    # Then look again, to catch the pairs between the newly woken bodies
+    # and the bodies still asleep around them.
+    sleep_speed_squared = sleep_speed**2
+    n_woken = 0
+    for i_pair in range(n_pairs):
+        i_a = pairs[i_pair, 0]
+        i_b = pairs[i_pair, 1]
+        if asleep[i_a] and active[i_b]:
+            i_sleeper = i_a
+            i_mover = i_b
+        elif asleep[i_b] and active[i_a]:
+            i_sleeper = i_b
+            i_mover = i_a
+        else:
+            continue
+        if (
+            v_x[i_mover] ** 2 + v_y[i_mover] ** 2 > sleep_speed_squared
+            or abs(v_rot[i_mover]) > sleep_spin
+        ):
+            asleep[i_sleeper] = False
+            still_steps[i_sleeper] = 0
+            n_woken += 1
+    if n_woken > 0:
+        for i_body in range(n_bodies):
+            active[i_body] = alive[i_body] and not asleep[i_body]
+        pairs, n_pairs = find_active_pairs_numba(
+            x[:n_bodies],
+            y[:n_bodies],
+            radius[:n_bodies],
+            active[:n_bodies],
+            r_max,
+            cell_size,
+            n_cols,
+            n_rows,
+            cell_head,
+            body_next,
+            pairs,
+        )
+
+    # Find the pairs of atoms close enough to touch,
+    # unless the ones from before are still good.
+    if n_contacts < 0 or contacts_stale_numba(
+        n_bodies,
+        active,
+        active_cached,
+        atom_start,
+        atom_count,
+        x_atoms,
+        y_atoms,
+        x_atoms_cached,
+        y_atoms_cached,
+        contact_skin,
+    ):
+        pairs, contacts, n_contacts = cache_contacts_numba(
+            n_bodies,
+            x,
+            y,
+            radius,
+            active,
+            active_cached,
+            atom_start,
+            atom_count,
+            x_atoms,
+            y_atoms,
+            x_atoms_cached,
+            y_atoms_cached,
+            in_contact,
+            r_atoms,
+            contact_skin,
+            r_max,
+            cell_size,
+            n_cols,
+            n_rows,
+            cell_head,
+            body_next,
+            pairs,
+            contacts,
+        )
+
+    # Calculate and tally up all the forces that act on bodies.
+    if parallel:
+        contact_forces_parallel_numba(
+            n_contacts,
+            n_bodies,
+            n_atoms,
+            contacts,
+            alive,
+            active,
+            pair_stiffness,
+            pair_sliding_friction,
+            pair_inelasticity,
+            material_atoms,
+            r_atoms,
+            x_atoms,
+            y_atoms,
+            v_x_atoms,
+            v_y_atoms,
+            f_x_atoms,
+            f_y_atoms,
+            is_contacting,
+            in_contact,
+            f_x_chunks,
+            f_y_chunks,
+            is_contacting_chunks,
+        )
+    else:
+        contact_forces_numba(
+            0,
+            n_contacts,
+            contacts,
+            alive,
+            active,
+            pair_stiffness,
+            pair_sliding_friction,
+            pair_inelasticity,
+            material_atoms,
+            r_atoms,
+            x_atoms,
+            y_atoms,
+            v_x_atoms,
+            v_y_atoms,
+            f_x_atoms,
+            f_y_atoms,
+            is_contacting,
+        )
+
+    body_wall_forces_numba(
+        n_bodies,
+        bodies,
+        atoms,
+        walls,
+        wall_seen,
+        wall_candidates,
+        wall_material,
+        cell_size,
+        n_cols,
+        n_rows,
+        pair_stiffness,
+        pair_sliding_friction,
+        pair_inelasticity,
+    )
+
+    # Add in some gravity
+    if abs(gravity) > 0:
+        for i_atom in range(n_atoms):
+            f_y_atoms[i_atom] += gravity * m_atoms[i_atom]
+
+    return pairs, contacts, n_contacts
+
+
+@njit(cache=True)
+def find_active_pairs_numba(
+    x,
+    y,
+    radius,
+    active,
+    r_max,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_next,
+    pairs,
+):
+    """
+    Find the pairs of bodies, at least one of them active, that are
+    close enough to touch. Returns the array of pairs, which is replaced
+    with a larger one if it ran out of room, and the number of pairs.
+    """
+    n_pairs = find_pairs_numba(
+        x,
+        y,
+        radius,
+        active,
+        r_max,
+        cell_size,
+        n_cols,
+        n_rows,
+        cell_head,
+        body_next,
+        pairs,
+    )
+    if n_pairs > pairs.shape[0]:
+        pairs = np.zeros((2 * n_pairs, 2), dtype=np.int64)
+        find_pairs_numba(
+            x,
+            y,
+            radius,
+            active,
+            r_max,
+            cell_size,
+            n_cols,
+            n_rows,
+            cell_head,
+            body_next,
+            pairs,
+        )
+    return pairs, n_pairs
+
+
+@njit(cache=True)
+def body_wall_forces_numba(
+    n_bodies,
+    bodies,
+    atoms,
+    walls,
+    wall_seen,
+    wall_candidates,
+    wall_material,
+    cell_size,
+    n_cols,
+    n_rows,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+):
+    """
+    Add the forces from the walls onto the atoms of every active body.
+    Each body is only checked against the walls filed in the cells
+    it overlaps, and only the ones it comes close enough to touch.
+    """
+    x = bodies.x
+    y = bodies.y
+    radius = bodies.radius
+    atom_start = bodies.atom_start
+    atom_count = bodies.atom_count
+    alive = bodies.alive
+    asleep = bodies.asleep
+    x_atoms = atoms.x_atoms
+    y_atoms = atoms.y_atoms
+    v_x_atoms = atoms.v_x_atoms
+    v_y_atoms = atoms.v_y_atoms
+    f_x_atoms = atoms.f_x_atoms
+    f_y_atoms = atoms.f_y_atoms
+    r_atoms = atoms.r_atoms
+    material_atoms = atoms.material_atoms
+
+    for i_body in range(n_bodies):
+        if not alive[i_body] or asleep[i_body]:
+            continue
+        n_candidates = find_nearby_walls_numba(
+            x[i_body],
+            y[i_body],
+            radius[i_body],
+            cell_size,
+            n_cols,
+            n_rows,
+            walls.cell_start,
+            walls.cell_walls,
+            wall_seen,
+            wall_candidates,
+        )
+
+        i_start = atom_start[i_body]
+        i_end = i_start + atom_count[i_body]
+        for i_candidate in range(n_candidates):
+            i_wall = wall_candidates[i_candidate]
+
+            # Skip the wall if the whole body is clear of it.
+            d_x = x[i_body] - walls.x[i_wall]
+            d_y = y[i_body] - walls.y[i_wall]
+            distance = d_x * walls.x_n[i_wall] + d_y * walls.y_n[i_wall]
+            if distance > radius[i_body]:
+                continue
+            if distance < -walls.thickness[i_wall] - radius[i_body]:
+                continue
+            along = d_x * walls.x_t[i_wall] + d_y * walls.y_t[i_wall]
+            if along < -radius[i_body]:
+                continue
+            if along > walls.length[i_wall] + radius[i_body]:
+                continue
+
+            wall_forces_numba(
+                f_x_atoms[i_start:i_end],
+                f_y_atoms[i_start:i_end],
+                material_atoms[i_start:i_end],
+                wall_material,
+                r_atoms[i_start:i_end],
+                walls.x[i_wall],
+                walls.y[i_wall],
+                walls.x_n[i_wall],
+                walls.y_n[i_wall],
+                walls.x_t[i_wall],
+                walls.y_t[i_wall],
+                walls.length[i_wall],
+                walls.thickness[i_wall],
+                x_atoms[i_start:i_end],
+                y_atoms[i_start:i_end],
+                v_x_atoms[i_start:i_end],
+                v_y_atoms[i_start:i_end],
+                pair_stiffness,
+                pair_sliding_friction,
+                pair_inelasticity,
+            )
+
+
+@njit(cache=True)
+def find_nearby_walls_numba(
+    x,
+    y,
+    radius,
+    cell_size,
+    n_cols,
+    n_rows,
+    wall_cell_start,
+    wall_cell_walls,
+    wall_seen,
+    wall_candidates,
+):
+    """
+    Gather up every wall filed in the cells that a body overlaps.
+    They are written into wall_candidates, each one only once,
+    in order, and the number of them is returned.
+    """
+    col_lo = cell_index_numba(x - radius, cell_size, n_cols)
+    col_hi = cell_index_numba(x + radius, cell_size, n_cols)
+    row_lo = cell_index_numba(y - radius, cell_size, n_rows)
+    row_hi = cell_index_numba(y + radius, cell_size, n_rows)
+
+    n_candidates = 0
+    for i_row in range(row_lo, row_hi + 1):
+        for i_col in range(col_lo, col_hi + 1):
+            i_cell = i_row * n_cols + i_col
+            for i_entry in range(
+                wall_cell_start[i_cell], wall_cell_start[i_cell + 1]
+            ):
+                i_wall = wall_cell_walls[i_entry]
+                if not wall_seen[i_wall]:
+                    wall_seen[i_wall] = True
+                    wall_candidates[n_candidates] = i_wall
+                    n_candidates += 1
+
+    # Clear the marks for next time, and put the walls in order
+    # so that their forces always get added up in the same order.
+    for i_candidate in range(n_candidates):
+        wall_seen[wall_candidates[i_candidate]] = False
+    for i_candidate in range(1, n_candidates):
+        i_wall = wall_candidates[i_candidate]
+        j_candidate = i_candidate - 1
+        while j_candidate >= 0 and wall_candidates[j_candidate] > i_wall:
+            wall_candidates[j_candidate + 1] = wall_candidates[j_candidate]
+            j_candidate -= 1
+        wall_candidates[j_candidate + 1] = i_wall
+
+    return n_candidates
+
+
+@njit(cache=True)
+def contacts_stale_numba(
+    n_bodies,
+    active,
+    active_cached,
+    atom_start,
+    atom_count,
+    x_atoms,
+    y_atoms,
+    x_atoms_cached,
+    y_atoms_cached,
+    skin,
+):
+    """
+    Returns True if the cached contacts can no longer be trusted.
+
+    Each candidate pair of atoms was found with a skin of extra room
+    around them. As long as no atom has moved more than half the skin
+    since then, no two atoms can have closed that gap, and any atoms
+    touching now are among the candidates.
+
+    Only pairs with at least one awake body in them get cached,
+    so once a body wakes up, or comes back to life, its pairs
+    with sleeping bodies have to be found. Sleeping bodies don't move,
+    so they don't need checking.
+    """
+    max_move_squared = (0.5 * skin) ** 2
+    for i_body in range(n_bodies):
+        if not active[i_body]:
+            continue
+        if not active_cached[i_body]:
+            return True
+        i_start = atom_start[i_body]
+        i_end = i_start + atom_count[i_body]
+        for i_atom in range(i_start, i_end):
+            d_x = x_atoms[i_atom] - x_atoms_cached[i_atom]
+            d_y = y_atoms[i_atom] - y_atoms_cached[i_atom]
+            if d_x**2 + d_y**2 > max_move_squared:
+                return True
+    return False
+
+
+@njit(cache=True)
+def find_contacts_numba(
+    pairs,
+    n_pairs,
+    atom_start,
+    atom_count,
+    x_atoms,
+    y_atoms,
+    r_atoms,
+    skin,
+    contacts,
+):
+    """
+    For each pair of bodies, write down every pair of their atoms
+    that are within skin of touching. Each row of contacts gets
+    the two bodies and then the two atoms.
+
+    Returns the number of contacts found. If that is more than
+    will fit in contacts, only the first ones are written and the caller
+    needs to try again with a bigger array.
+    """
+    n_contacts = 0
+    capacity = contacts.shape[0]
+    for i_pair in range(n_pairs):
+        i_a = pairs[i_pair, 0]
+        i_b = pairs[i_pair, 1]
+        a_start = atom_start[i_a]
+        a_end = a_start + atom_count[i_a]
+        b_start = atom_start[i_b]
+        b_end = b_start + atom_count[i_b]
+        for i_atom in range(a_start, a_end):
+            for j_atom in range(b_start, b_end):
+                d_x = x_atoms[i_atom] - x_atoms[j_atom]
+                d_y = y_atoms[i_atom] - y_atoms[j_atom]
+                reach = r_atoms[i_atom] + r_atoms[j_atom] + skin
+                if d_x**2 + d_y**2 < reach**2:
+                    if n_contacts < capacity:
+                        contacts[n_contacts, 0] = i_a
+                        contacts[n_contacts, 1] = i_b
+                        contacts[n_contacts, 2] = i_atom
+                        contacts[n_contacts, 3] = j_atom
+                    n_contacts += 1
+    return n_contacts
+
+
+@njit(cache=True)
+def cache_contacts_numba(
+    n_bodies,
+    x,
+    y,
+    radius,
+    active,
+    active_cached,
+    atom_start,
+    atom_count,
+    x_atoms,
+    y_atoms,
+    x_atoms_cached,
+    y_atoms_cached,
+    in_contact,
+    r_atoms,
+    skin,
+    r_max,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_next,
+    pairs,
+    contacts,
+):
+    """
+    Find every pair of atoms, in different bodies, that is within
+    skin of touching, and remember where everything was when they
+    were found. Just like the candidate pairs of bodies, pairs of
+    bodies that are both asleep are left out. Every atom in one of
+    the pairs gets marked in in_contact.
+
+    Returns the array of candidate pairs of bodies, and the array
+    of contacts, each replaced with a larger one if it ran out of room,
+    and the number of contacts.
+    """
+    # Any two bodies whose atoms are within skin of touching
+    # will overlap if each of them is fattened up by half the skin.
+    pairs, n_pairs = find_active_pairs_numba(
+        x[:n_bodies],
+        y[:n_bodies],
+        radius[:n_bodies] + 0.5 * skin,
+        active[:n_bodies],
+        r_max + 0.5 * skin,
+        cell_size,
+        n_cols,
+        n_rows,
+        cell_head,
+        body_next,
+        pairs,
+    )
+    n_contacts = find_contacts_numba(
+        pairs,
+        n_pairs,
+        atom_start,
+        atom_count,
+        x_atoms,
+        y_atoms,
+        r_atoms,
+        skin,
+        contacts,
+    )
+    if n_contacts > contacts.shape[0]:
+        contacts = np.zeros((2 * n_contacts, 4), dtype=np.int64)
+        find_contacts_numba(
+            pairs,
+            n_pairs,
+            atom_start,
+            atom_count,
+            x_atoms,
+            y_atoms,
+            r_atoms,
+            skin,
+            contacts,
+        )
+
+    in_contact[:] = False
+    for i_contact in range(n_contacts):
+        in_contact[contacts[i_contact, 2]] = True
+        in_contact[contacts[i_contact, 3]] = True
+
+    for i_body in range(n_bodies):
+        active_cached[i_body] = active[i_body]
+        if not active[i_body]:
+            continue
+        i_start = atom_start[i_body]
+        i_end = i_start + atom_count[i_body]
+        for i_atom in range(i_start, i_end):
+            x_atoms_cached[i_atom] = x_atoms[i_atom]
+            y_atoms_cached[i_atom] = y_atoms[i_atom]
+    return pairs, contacts, n_contacts
+
+
+@njit(cache=True)
+def contact_forces_numba(
+    i_contact_start,
+    i_contact_end,
+    contacts,
+    alive,
+    active,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+    material_atoms,
+    r_atoms,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    f_x_atoms,
+    f_y_atoms,
+    is_contacting,
+):
+    """
+    Add up the contact forces between the cached pairs of atoms
+    from contacts[i_contact_start] up to, but not including,
+    contacts[i_contact_end].
+
+    Pairs are skipped if either body isn't alive, or if both
+    are asleep, just as they are when finding candidate pairs of bodies.
+    """
+    for i_contact in range(i_contact_start, i_contact_end):
+        i_a = contacts[i_contact, 0]
+        i_b = contacts[i_contact, 1]
+        if not (alive[i_a] and alive[i_b]):
+            continue
+        if not (active[i_a] or active[i_b]):
+            continue
+        i_atom = contacts[i_contact, 2]
+        j_atom = contacts[i_contact, 3]
+        i_material = material_atoms[i_atom]
+        j_material = material_atoms[j_atom]
+        f_x_ab, f_y_ab, contact = atom_interaction_numba(
+            x_atoms[i_atom],
+            y_atoms[i_atom],
+            v_x_atoms[i_atom],
+            v_y_atoms[i_atom],
+            r_atoms[i_atom],
+            x_atoms[j_atom],
+            y_atoms[j_atom],
+            v_x_atoms[j_atom],
+            v_y_atoms[j_atom],
+            r_atoms[j_atom],
+            pair_stiffness[i_material, j_material],
+            pair_sliding_friction[i_material, j_material],
+            pair_inelasticity[i_material, j_material],
+            x_atoms.dtype.type,
+        )
+        if contact:
+            # Aggregate to sum the forces of all other atoms
+            # on each one individualy.
+            f_x_atoms[i_atom] += f_x_ab
+            f_x_atoms[j_atom] -= f_x_ab
+            f_y_atoms[i_atom] += f_y_ab
+            f_y_atoms[j_atom] -= f_y_ab
+            is_contacting[i_a] = True
+            is_contacting[i_b] = True
+
+
+@njit(parallel=True, cache=True)
+def contact_forces_parallel_numba(
+    n_contacts,
+    n_bodies,
+    n_atoms,
+    contacts,
+    alive,
+    active,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+    material_atoms,
+    r_atoms,
+    x_atoms,
+    y_atoms,
+    v_x_atoms,
+    v_y_atoms,
+    f_x_atoms,
+    f_y_atoms,
+    is_contacting,
+    in_contact,
+    f_x_chunks,
+    f_y_chunks,
+    is_contacting_chunks,
+):
+    """
+    The same as contact_forces_numba(), but split across threads.
+
+    The contacts are dealt out in contiguous chunks, one chunk per row
+    of f_x_chunks, f_y_chunks, and is_contacting_chunks. Each chunk
+    tallies its forces into its own row, so no two threads ever
+    write to the same place. Then the rows are summed
+    into the atom forces, again split up by atom across threads.
+
+    The rows are all zeros between calls. Only the atoms marked
+    in in_contact can pick up a force, so only their places
+    get summed and then wiped clean again, rather than clearing
+    every row from end to end each time.
+    """
+    n_chunks = f_x_chunks.shape[0]
+    chunk_size = (n_contacts + n_chunks - 1) // n_chunks
+    for i_chunk in prange(n_chunks):
+        contact_forces_numba(
+            min(n_contacts, i_chunk * chunk_size),
+            min(n_contacts, (i_chunk + 1) * chunk_size),
+            contacts,
+            alive,
+            active,
+            pair_stiffness,
+            pair_sliding_friction,
+            pair_inelasticity,
+            material_atoms,
+            r_atoms,
+            x_atoms,
+            y_atoms,
+            v_x_atoms,
+            v_y_atoms,
+            f_x_chunks[i_chunk],
+            f_y_chunks[i_chunk],
+            is_contacting_chunks[i_chunk],
+        )
+
+    for i_atom in prange(n_atoms):
+        if not in_contact[i_atom]:
+            continue
+        for i_chunk in range(n_chunks):
+            f_x = f_x_chunks[i_chunk, i_atom]
+            f_y = f_y_chunks[i_chunk, i_atom]
+            if f_x == 0.0 and f_y == 0.0:
+                continue
+            f_x_atoms[i_atom] += f_x
+            f_y_atoms[i_atom] += f_y
+            f_x_chunks[i_chunk, i_atom] = 0.0
+            f_y_chunks[i_chunk, i_atom] = 0.0
+
+    for i_body in prange(n_bodies):
+        for i_chunk in range(n_chunks):
+            if is_contacting_chunks[i_chunk, i_body]:
+                is_contacting[i_body] = True
+                is_contacting_chunks[i_chunk, i_body] = False
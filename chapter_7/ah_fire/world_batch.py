@@ -0,0 +1,416 @@
+import numpy as np
+from numba import njit, prange
+from numba.typed import List
+
+import config
+from body import place_atoms_numba
+from world import (
+    ATOM_FIELDS,
+    BODY_FIELDS,
+    INTEGRATOR_IDS,
+    RING_FIELDS,
+    AtomArrays,
+    BodyArrays,
+    RingArrays,
+    add_to_ring_numba,
+    count_substeps,
+    world_step_numba,
+)
+
+
+class WorldBatch:
+    """
+    Many independent copies of a World, stepped together.
+
+    Every array in the World gets a leading environment axis. Row i_env
+    of x holds the x positions of all the bodies in environment i_env,
+    row i_env of x_atoms holds the x positions of all its atoms,
+    and so on. Each environment also gets its own grid and its own
+    scratch space. The walls are shared.
+
+    One call to step() advances every environment by one time step,
+    running world_step_numba() on each of them, in parallel across
+    all the available cores. This way the cost of crossing from Python
+    into Numba is paid once per step, rather than once per environment
+    per step.
+
+    Initialize with a World to use as a template, and the number of
+    copies to make. Each environment starts out in the same state
+    as the template, with the same set of body slots. The slots are
+    fixed from then on, so the body pools can't grow the way they
+    do in a World. spawn() comes back empty-handed when a pool runs dry.
+
+    To work with one environment at a time, say to command the ship
+    in it, use envs[i_env]. It acts like a World for adding forces
+    and spawning bodies.
+    """
+
+    def __init__(self, world, n_envs):
+        self.n_envs = n_envs
+        self.n_bodies = world.n_bodies
+        self.n_atoms = world.n_atoms
+        self.names = list(world.names)
+        self.types = list(world.types)
+        self.index = dict(world.index)
+        self.free_slots = world.free_slots
+        self.pool_templates = world.pool_templates
+        self.walls = world.walls
+        # The material tables never change, so every environment
+        # shares the same ones.
+        self.materials = world.materials
+        self.wall_material = world.wall_material
+        self.grid = world.grid
+        self.sleep_speed = world.sleep_speed
+        self.sleep_spin = world.sleep_spin
+        self.sleep_steps = world.sleep_steps
+        self.integrator = world.integrator
+        self.incremental_rotation = world.incremental_rotation
+        self.contact_skin = world.contact_skin
+        self.stable_dt = world.stable_dt()
+
+        n = self.n_bodies
+        for name, dtype in BODY_FIELDS:
+            setattr(
+                self, name, np.tile(getattr(world, name)[:n], (n_envs, 1))
+            )
+        for name in RING_FIELDS:
+            setattr(
+                self, name, np.tile(getattr(world, name)[:n], (n_envs, 1, 1))
+            )
+        for name, dtype in ATOM_FIELDS:
+            setattr(
+                self,
+                name,
+                np.tile(getattr(world, name)[: self.n_atoms], (n_envs, 1)),
+            )
+        self.n_ring = world.n_ring
+        self.i_ring = world.i_ring
+
+        # Each environment's rows get bundled up the same way a World's
+        # arrays are. Numba picks one environment's bundle out of these
+        # typed lists by index, without copying anything.
+        self.env_bodies = List(
+            [
+                BodyArrays(
+                    *[getattr(self, name)[i_env] for name, _ in BODY_FIELDS]
+                )
+                for i_env in range(n_envs)
+            ]
+        )
+        self.env_rings = List(
+            [
+                RingArrays(
+                    *[getattr(self, name)[i_env] for name in RING_FIELDS]
+                )
+                for i_env in range(n_envs)
+            ]
+        )
+        self.env_atoms = List(
+            [
+                AtomArrays(
+                    *[getattr(self, name)[i_env] for name, _ in ATOM_FIELDS]
+                )
+                for i_env in range(n_envs)
+            ]
+        )
+
+        # Every environment gets its own grid. They all start out empty,
+        # and the bodies get filed into them on the first step.
+        n_cells = self.grid.n_cols * self.grid.n_rows
+        self.cell_head = -np.ones((n_envs, n_cells), dtype=np.int64)
+        self.body_cell = -np.ones((n_envs, n), dtype=np.int64)
+        self.body_next = np.zeros((n_envs, n), dtype=np.int64)
+        self.body_prev = np.zeros((n_envs, n), dtype=np.int64)
+        self.pairs = np.zeros((n_envs, 16, 2), dtype=np.int64)
+        # If an environment runs out of room for pairs, it makes do with
+        # a bigger array of its own for that step, and reports its size
+        # here, so that there is room for everyone on the next step.
+        self.pairs_needed = np.zeros(n_envs, dtype=np.int64)
+        # Each environment caches its own contacts. The same goes for
+        # running out of room, but then the cache is lost, and has to be
+        # filled again on the next step.
+        self.contacts = np.zeros((n_envs, 16, 4), dtype=np.int64)
+        self.n_contacts = -np.ones(n_envs, dtype=np.int64)
+        self.contacts_needed = np.zeros(n_envs, dtype=np.int64)
+
+        n_walls = self.walls.count
+        self.wall_seen = np.zeros((n_envs, n_walls), dtype=np.bool_)
+        self.wall_candidates = np.zeros((n_envs, n_walls), dtype=np.int64)
+
+        self.n_destroyed = np.zeros(n_envs, dtype=np.int64)
+
+        # Contacts within an environment are always calculated serially.
+        # The parallelism comes from running the environments side by side.
+        self.f_x_chunks = np.zeros(
+            (n_envs, 1, 1), dtype=world.accumulator_dtype
+        )
+        self.f_y_chunks = np.zeros(
+            (n_envs, 1, 1), dtype=world.accumulator_dtype
+        )
+        self.is_contacting_chunks = np.zeros((n_envs, 1, 1), dtype=np.bool_)
+
+        self.envs = [EnvWorld(self, i_env) for i_env in range(n_envs)]
+
+    def step(self, dt=config.PHYSICS_PERIOD):
+        """
+        Advance every environment by one time step.
+        """
+        batch_step_numba(
+            self.n_envs,
+            self.n_bodies,
+            self.n_atoms,
+            self.env_bodies,
+            self.env_rings,
+            self.i_ring,
+            self.env_atoms,
+            self.materials.pair_stiffness,
+            self.materials.pair_sliding_friction,
+            self.materials.pair_inelasticity,
+            self.grid.cell_size,
+            self.grid.n_cols,
+            self.grid.n_rows,
+            self.cell_head,
+            self.body_cell,
+            self.body_next,
+            self.body_prev,
+            self.pairs,
+            self.pairs_needed,
+            self.contacts,
+            self.n_contacts,
+            self.contacts_needed,
+            self.contact_skin,
+            self.walls.arrays,
+            self.wall_seen,
+            self.wall_candidates,
+            self.wall_material,
+            self.f_x_chunks,
+            self.f_y_chunks,
+            self.is_contacting_chunks,
+            config.GRAVITY,
+            self.sleep_speed,
+            self.sleep_spin,
+            self.sleep_steps,
+            INTEGRATOR_IDS[self.integrator],
+            count_substeps(self.integrator, dt, self.stable_dt),
+            self.incremental_rotation,
+            dt,
+            self.n_destroyed,
+        )
+        self.i_ring += 1
+        if self.i_ring >= self.n_ring:
+            self.i_ring = 0
+
+        n_pairs_max = np.max(self.pairs_needed)
+        if n_pairs_max > self.pairs.shape[1]:
+            self.pairs = np.zeros(
+                (self.n_envs, n_pairs_max, 2), dtype=np.int64
+            )
+        n_contacts_max = np.max(self.contacts_needed)
+        if n_contacts_max > self.contacts.shape[1]:
+            self.contacts = np.zeros(
+                (self.n_envs, n_contacts_max, 4), dtype=np.int64
+            )
+            self.n_contacts[:] = -1
+
+        # Free up the slots of bodies that were destroyed.
+        for i_env in np.flatnonzero(self.n_destroyed):
+            self.envs[i_env].remove_bodies(
+                self.destroyed[i_env, : self.n_destroyed[i_env]]
+            )
+
+
+class EnvWorld:
+    """
+    A window onto one environment of a WorldBatch, with enough
+    of the World interface to steer the bodies in it.
+    The arrays are views into the rows of the batch's arrays.
+    """
+
+    def __init__(self, batch, i_env):
+        self.batch = batch
+        self.i_env = i_env
+        self.names = list(batch.names)
+        self.index = dict(batch.index)
+        self.free_slots = {
+            body_type: list(slots)
+            for body_type, slots in batch.free_slots.items()
+        }
+        self.x = batch.x[i_env]
+        self.y = batch.y[i_env]
+        self.angle = batch.angle[i_env]
+        self.radius = batch.radius[i_env]
+        self.alive = batch.alive[i_env]
+
+    def add_force(self, i_body, shape, f_x=0.0, f_y=0.0, torque=0.0):
+        batch = self.batch
+        i_env = self.i_env
+        batch.asleep[i_env, i_body] = False
+        batch.still_steps[i_env, i_body] = 0
+        add_to_ring_numba(
+            batch.f_x_ext[i_env, i_body], batch.i_ring, shape, f_x
+        )
+        add_to_ring_numba(
+            batch.f_y_ext[i_env, i_body], batch.i_ring, shape, f_y
+        )
+        add_to_ring_numba(
+            batch.torque_ext[i_env, i_body], batch.i_ring, shape, torque
+        )
+
+    def spawn(self, body_type, name, x, y):
+        """
+        Bring a body to life in a free slot, just like World.spawn().
+        If there are no free slots left, returns None.
+        """
+        if len(self.free_slots[body_type]) == 0:
+            return None
+
+        batch = self.batch
+        i_env = self.i_env
+        template = batch.pool_templates[body_type]
+        i_body = self.free_slots[body_type].pop()
+        batch.x[i_env, i_body] = x
+        batch.y[i_env, i_body] = y
+        batch.angle[i_env, i_body] = template.angle
+        batch.cos_angle[i_env, i_body] = np.cos(template.angle)
+        batch.sin_angle[i_env, i_body] = np.sin(template.angle)
+        batch.v_x[i_env, i_body] = template.v_x
+        batch.v_y[i_env, i_body] = template.v_y
+        batch.v_rot[i_env, i_body] = template.v_rot
+        batch.is_contacting[i_env, i_body] = False
+        batch.alive[i_env, i_body] = True
+        batch.asleep[i_env, i_body] = False
+        batch.still_steps[i_env, i_body] = 0
+        batch.a_x[i_env, i_body] = 0.0
+        batch.a_y[i_env, i_body] = 0.0
+        batch.a_rot[i_env, i_body] = 0.0
+        batch.f_x_ext[i_env, i_body, :] = 0.0
+        batch.f_y_ext[i_env, i_body, :] = 0.0
+        batch.torque_ext[i_env, i_body, :] = 0.0
+
+        i_start = batch.atom_start[i_env, i_body]
+        i_end = i_start + batch.atom_count[i_env, i_body]
+        place_atoms_numba(
+            batch.x_atoms_local[i_env, i_start:i_end],
+            batch.y_atoms_local[i_env, i_start:i_end],
+            batch.x_atoms[i_env, i_start:i_end],
+            batch.y_atoms[i_env, i_start:i_end],
+            batch.v_x_atoms[i_env, i_start:i_end],
+            batch.v_y_atoms[i_env, i_start:i_end],
+            batch.x[i_env, i_body],
+            batch.y[i_env, i_body],
+            batch.angle[i_env, i_body],
+            batch.v_x[i_env, i_body],
+            batch.v_y[i_env, i_body],
+            batch.v_rot[i_env, i_body],
+        )
+        self.names[i_body] = name
+        self.index[name] = i_body
+        return i_body
+
+    def remove_bodies(self, i_bodies):
+        for i_body in i_bodies:
+            self.batch.alive[self.i_env, i_body] = False
+            self.free_slots[self.batch.types[i_body]].append(i_body)
+            self.index.pop(self.names[i_body], None)
+
+
+@njit(parallel=True, cache=True)
+def batch_step_numba(
+    n_envs,
+    n_bodies,
+    n_atoms,
+    bodies,
+    rings,
+    i_ring,
+    atoms,
+    pair_stiffness,
+    pair_sliding_friction,
+    pair_inelasticity,
+    cell_size,
+    n_cols,
+    n_rows,
+    cell_head,
+    body_cell,
+    body_next,
+    body_prev,
+    pairs,
+    pairs_needed,
+    contacts,
+    n_contacts,
+    contacts_needed,
+    contact_skin,
+    walls,
+    wall_seen,
+    wall_candidates,
+    wall_material,
+    f_x_chunks,
+    f_y_chunks,
+    is_contacting_chunks,
+    gravity,
+    sleep_speed,
+    sleep_spin,
+    sleep_steps,
+    integrator,
+    n_substeps,
+    incremental_rotation,
+    dt,
+    n_destroyed,
+):
+    """
+    Run world_step_numba() on each environment, one environment
+    per thread at a time. No two environments share anything
+    they write to, so they can't collide.
+
+    bodies, rings, and atoms are typed lists holding each
+    environment's BodyArrays, RingArrays, and AtomArrays.
+    """
+    for i_env in prange(n_envs):
+        # prange counts with unsigned integers, which typed lists
+        # warn about being indexed with.
+        i_list = np.int64(i_env)
+        (
+            env_pairs,
+            env_contacts,
+            n_contacts[i_env],
+            _,
+            n_destroyed[i_env],
+        ) = world_step_numba(
+            n_bodies,
+            n_atoms,
+            bodies[i_list],
+            rings[i_list],
+            i_ring,
+            atoms[i_list],
+            pair_stiffness,
+            pair_sliding_friction,
+            pair_inelasticity,
+            cell_size,
+            n_cols,
+            n_rows,
+            cell_head[i_env],
+            body_cell[i_env],
+            body_next[i_env],
+            body_prev[i_env],
+            pairs[i_env],
+            contacts[i_env],
+            n_contacts[i_env],
+            contact_skin,
+            walls,
+            wall_seen[i_env],
+            wall_candidates[i_env],
+            wall_material,
+            False,
+            f_x_chunks[i_env],
+            f_y_chunks[i_env],
+            is_contacting_chunks[i_env],
+            gravity,
+            sleep_speed,
+            sleep_spin,
+            sleep_steps,
+            integrator,
+            n_substeps,
+            incremental_rotation,
+            dt,
+        )
+        pairs_needed[i_env] = env_pairs.shape[0]
+        contacts_needed[i_env] = env_contacts.shape[0]
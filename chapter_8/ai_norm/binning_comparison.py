@@ -0,0 +1,102 @@
+"""
+Compare how many frames per second can be converted from a window
+of audio to log-spaced frequency bins
+
+  - the old way, working out the window and the bin edges again for
+    every frame, and then looping over the bins, checking every
+    frequency against each one, and
+  - with a SpectralBinner, which works out the window and which bin
+    each frequency falls into once, and then bins each frame with
+    a single call to np.bincount().
+
+Longer windows have more frequencies to sort into the same bins.
+"""
+from time import perf_counter
+import numpy as np
+from numpy.fft import fft
+
+import config
+from multifft import SpectralBinner
+
+n_reps = 200
+window_durations = [0.01, 0.05, 0.2, 1.0]
+
+
+def time_to_freq_loop(
+    timeseries,
+    window_duration,
+    bins_per_octave=config.BINS_PER_OCTAVE,
+    low_cutoff=config.LOW_CUTOFF,
+):
+    """
+    The old way.
+    """
+    big_val = 1e6
+    eps = 1e-3
+    n_samples = timeseries.size
+    duration = n_samples / float(config.SAMPLING_RATE)
+
+    log_freqs = np.log10(eps + np.arange(n_samples) / window_duration)
+    bin_edges = np.arange(
+        np.log10(low_cutoff),
+        np.log10(config.SAMPLING_RATE / 2),
+        np.log10(2) / bins_per_octave,
+    )
+    bin_centers = np.zeros(bin_edges.size - 1)
+    bin_decibels = big_val * np.ones(bin_edges.size - 1)
+
+    window = np.blackman(n_samples)
+    energies = np.abs(fft(window * timeseries)) / duration
+    decibels = 10 * np.log10(energies + 1e-6)
+
+    for i_bin in range(bin_edges.size - 1):
+        i_freqs = np.where(
+            np.logical_and(
+                log_freqs >= bin_edges[i_bin],
+                log_freqs < bin_edges[i_bin + 1],
+            )
+        )[0]
+        if i_freqs.size > 0:
+            bin_decibels[i_bin] = np.mean(decibels[i_freqs])
+        bin_centers[i_bin] = (bin_edges[i_bin] + bin_edges[i_bin + 1]) / 2
+
+    i_keep = np.where(bin_decibels < big_val)
+    return bin_centers[i_keep], bin_decibels[i_keep]
+
+
+def frames_per_second(convert, frames):
+    # Run it once first, so that one-time setup isn't counted.
+    convert(frames[0])
+    start = perf_counter()
+    for frame in frames:
+        convert(frame)
+    return len(frames) / (perf_counter() - start)
+
+
+print("Converting audio frames to frequency bins")
+print("  window     samples      loop fps    binner fps   max difference")
+for window_duration in window_durations:
+    np.random.seed(0)
+    n_samples = int(window_duration * config.SAMPLING_RATE)
+    frames = list(np.random.normal(size=(n_reps, n_samples)))
+    # Padding would change which frequencies get binned,
+    # so leave it out to compare like with like.
+    binner = SpectralBinner(
+        n_samples, window_duration, pad_to_fast_length=False
+    )
+
+    loop_fps = frames_per_second(
+        lambda frame: time_to_freq_loop(frame, window_duration), frames
+    )
+    binner_fps = frames_per_second(binner.time_to_freq, frames)
+
+    loop_centers, loop_decibels = time_to_freq_loop(frames[0], window_duration)
+    binner_centers, binner_decibels = binner.time_to_freq(frames[0])
+    assert np.array_equal(loop_centers, binner_centers)
+    difference = np.max(np.abs(loop_decibels - binner_decibels))
+
+    print(
+        f"  {window_duration:5.2f} s   {n_samples:8d}"
+        + f"   {loop_fps:10.0f}    {binner_fps:10.0f}"
+        + f"   {difference:14.2e}"
+    )
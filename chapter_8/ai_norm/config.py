@@ -14,6 +14,11 @@ FIGURE_NAME_MULTISPEC = "Spectrogram"
 CLOCK_FREQ_SPEC = 20.0  # Hz
 CLOCK_PERIOD_SPEC = 1.0 / CLOCK_FREQ_SPEC
 
+# The Pacemaker posts how well it's keeping time to this block
+# of shared memory. To watch it from the command line, run
+#     python -m tools.timing_stats ai_norm_timing --watch
+TIMING_STATS_NAME = "ai_norm_timing"
+
 # Choose the audio block duration to be a multiple
 # of the raw audio time series visualization.
 AUDIO_BLOCK_DURATION = 1 / (10.0 * CLOCK_FREQ_SPEC)
@@ -40,9 +45,34 @@ MULTIFFT_WINDOW_DURATION = FFT_WINDOW_DURATION_SHORT
 # How much to offset each FFT sample window from the last, in seconds.
 FFT_STRIDE_DURATION = MULTIFFT_WINDOW_DURATION  / 5.0
 
+# How much audio the multi-FFT keeps around beyond one full window,
+# in seconds. It needs to be at least one audio block. Anything more
+# gives it room to fall behind and catch up again without dropping frames.
+MULTIFFT_BACKLOG_DURATION = 0.5
+
+# When the multi-FFT falls behind, it can catch up on all the waiting
+# frames at once, in a single batch, and send them along as one block.
+# Otherwise they get done and sent one at a time.
+MULTIFFT_BATCH = True
+
 BINS_PER_OCTAVE = 24
 LOW_CUTOFF = 10
 
+# Instead of one window length for all frequencies, give the low
+# frequencies long windows, to tell them apart, and the high ones short
+# windows, to respond quickly. It all gets done with one FFT per stride.
+MULTIFFT_MULTIRESOLUTION = True
+MULTIRES_WINDOW_DURATION_SHORTEST = FFT_WINDOW_DURATION_XSHORT
+MULTIRES_WINDOW_DURATION_LONGEST = FFT_WINDOW_DURATION_LONG
+# Leave out the parts of each bin's kernel that are smaller than
+# this fraction of its peak. Lower is more accurate, but slower.
+MULTIRES_KERNEL_THRESHOLD = 0.005
+
+# Pad each FFT window with zeros out to the next length that the FFT
+# can handle quickly, an even number with no prime factors larger than 5.
+# A 0.05 second window is 2205 samples. It gets padded out to 2250.
+FFT_PAD_TO_FAST_LENGTH = True
+
 
 #############################################
 # Configure the normalizer
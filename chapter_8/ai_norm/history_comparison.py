@@ -0,0 +1,71 @@
+"""
+Compare the time it takes to keep the history of the audio stream
+and cut frames out of it
+
+  - the old way, concatenating each new block of audio onto the end of
+    the history and copying all but the oldest stride of it after
+    every frame, and
+  - with a SampleHistory, writing each block into a fixed-size ring
+    and reading each frame out as a view.
+
+Only the bookkeeping gets timed, not the FFTs.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from tools.ring_buffer import SampleHistory
+
+n_blocks = 20_000
+block_size = int(config.AUDIO_BLOCK_DURATION * config.SAMPLING_RATE)
+stride = int(config.FFT_STRIDE_DURATION * config.SAMPLING_RATE)
+window_durations = [0.02, 0.05, 0.2, 1.0]
+
+
+def concatenate_and_copy(blocks, n_samples):
+    history = np.zeros(0)
+    total = 0.0
+    for audio_block in blocks:
+        history = np.concatenate((history, audio_block))
+        while history.size >= n_samples:
+            frame = history[:n_samples]
+            total += frame[-1]
+            history = np.copy(history[stride:])
+    return total
+
+
+def sample_history(blocks, n_samples):
+    n_backlog = int(config.MULTIFFT_BACKLOG_DURATION * config.SAMPLING_RATE)
+    history = SampleHistory(n_samples + n_backlog)
+    i_frame = 0
+    total = 0.0
+    for audio_block in blocks:
+        history.append(audio_block)
+        while i_frame + n_samples <= history.n_appended:
+            frame = history.window(i_frame, n_samples)
+            total += frame[-1]
+            i_frame += stride
+    return total
+
+
+np.random.seed(0)
+blocks = list(np.random.normal(size=(n_blocks, block_size)))
+n_frames = (n_blocks * block_size) // stride
+print(
+    f"Cutting about {n_frames} frames from {n_blocks} blocks"
+    + f" of {block_size} samples"
+)
+print("  window    concatenate and copy      sample history")
+for window_duration in window_durations:
+    n_samples = int(window_duration * config.SAMPLING_RATE)
+    start = perf_counter()
+    copy_total = concatenate_and_copy(blocks, n_samples)
+    copy_time = perf_counter() - start
+    start = perf_counter()
+    history_total = sample_history(blocks, n_samples)
+    history_time = perf_counter() - start
+    assert np.isclose(copy_total, history_total)
+    print(
+        f"  {window_duration:4.2f} s   {1e6 * copy_time / n_frames:12.1f}"
+        + f" us/frame   {1e6 * history_time / n_frames:8.1f} us/frame"
+    )
@@ -1,32 +1,85 @@
-import json
-import time
+from functools import lru_cache
 import numpy as np
-from numpy.fft import fft
 import config
+from tools.ring_buffer import SampleHistory
+
+# np.fft.rfft() only takes an out= array from NumPy 2.0 on.
+rfft_takes_out = int(np.__version__.split(".")[0]) >= 2
 
 
 def run(listen_fft_q, fft_norm_q):
-    # How many milliseconds of data should be included in creating each frame?
-    # A longer window means that the curve will be less jumpy, but also that
-    # It will respond to sounds more slowly.
-    window_duration = config.MULTIFFT_WINDOW_DURATION
+    if config.MULTIFFT_MULTIRESOLUTION:
+        binner = MultiResolutionBinner()
+    else:
+        # How many milliseconds of data should be included in creating
+        # each frame? A longer window means that the curve will be less
+        # jumpy, but also that It will respond to sounds more slowly.
+        window_duration = config.MULTIFFT_WINDOW_DURATION
+        binner = get_binner(
+            int(window_duration * config.SAMPLING_RATE),
+            window_duration,
+            config.BINS_PER_OCTAVE,
+            config.LOW_CUTOFF,
+        )
 
-    n_samples = int(window_duration * config.SAMPLING_RATE)
+    n_samples = binner.n_samples
     stride = int(config.FFT_STRIDE_DURATION * config.SAMPLING_RATE)
-    history = np.zeros(1)
+    n_backlog = int(config.MULTIFFT_BACKLOG_DURATION * config.SAMPLING_RATE)
+    history = SampleHistory(n_samples + n_backlog)
+    # The position in the audio stream where the next frame starts
+    i_frame = 0
 
     while True:
         while not listen_fft_q.empty():
-            audio_block = listen_fft_q.get()
-            history = np.concatenate((history, audio_block.ravel()))
+            audio_block = listen_fft_q.get().ravel()
+
+            # Before appending a block would write over samples
+            # that haven't been turned into frequencies yet, catch up.
+            if history.n_appended + audio_block.size - history.n > i_frame:
+                i_frame = stft(history, binner, i_frame, stride, fft_norm_q)
+            history.append(audio_block)
+
+            # If frames have fallen so far behind that their samples
+            # are no longer in the history, skip ahead to the oldest
+            # one that still is.
+            if i_frame < history.oldest():
+                n_skipped = -((i_frame - history.oldest()) // stride)
+                i_frame += n_skipped * stride
+
+            if not config.MULTIFFT_BATCH:
+                i_frame = stft(history, binner, i_frame, stride, fft_norm_q)
 
-        while history.size > n_samples:
-            freqs, mags = time_to_freq(history[:n_samples], window_duration)
+        i_frame = stft(history, binner, i_frame, stride, fft_norm_q)
+
+
+def stft(history, binner, i_frame, stride, fft_norm_q):
+    """
+    Turn every frame that has all its samples in the history into
+    frequencies, starting from the one at position i_frame in the stream,
+    and send them along. Returns the position of the next frame.
+
+    With config.MULTIFFT_BATCH, they all get done in one batch and sent
+    as a single 2D array, one row per frame. Otherwise they get done and
+    sent one at a time.
+    """
+    n_samples = binner.n_samples
+    n_frames = (history.n_appended - n_samples - i_frame) // stride + 1
+    if n_frames <= 0:
+        return i_frame
+
+    if config.MULTIFFT_BATCH:
+        freqs, mags = binner.time_to_freq_batch(
+            history.windows(i_frame, n_samples, stride, n_frames)
+        )
+        fft_norm_q.put((freqs, mags))
+    else:
+        for i_start in range(i_frame, i_frame + n_frames * stride, stride):
+            freqs, mags = binner.time_to_freq(
+                history.window(i_start, n_samples)
+            )
             fft_norm_q.put((freqs, mags))
 
-            # Advance the history by one stride
-            if history.size > stride:
-                history = np.copy(history[stride:])
+    return i_frame + n_frames * stride
 
 
 def time_to_freq(
@@ -48,50 +101,357 @@ def time_to_freq(
     Including frquencies that are too low leads to some very jumpy
     lines. You can counter this by increasing the window length.
     """
-    big_val = 1e6
-    eps = 1e-3
-    n_samples = timeseries.size
-    duration = n_samples / float(config.SAMPLING_RATE)
-
-    # Transform the frequencies to a log scale
-    log_freqs = np.log10(eps + np.arange(n_samples) / window_duration)
-    # Define the edges of the frequency bins.
-    # These are evenly spaced on a log scale.
-    # Bins at the higher end will include a lot of different frequencies.
-    # Bins at the lower end will have few, some one, and some none.
-    bin_edges = np.arange(
-        np.log10(low_cutoff),
-        np.log10(config.SAMPLING_RATE / 2),
-        np.log10(2) / bins_per_octave,
+    binner = get_binner(
+        timeseries.size, window_duration, bins_per_octave, low_cutoff
     )
+    return binner.time_to_freq(timeseries)
 
-    # Apply a Blackman window to keep the representation of pure tones sharp.
-    windowed_timeseries = np.blackman(n_samples) * timeseries
-    # Convert the time series to frequencies using the fast Fourier transform.
-    # Divide by duration to normalize for different window sizes.
-    energies = np.abs(fft(windowed_timeseries)) / duration
-    # Convert energies at each frequency to decibels
-    decibels = 10 * np.log10(energies + 1e-6)
-    bin_centers = np.zeros(bin_edges.size - 1)
-    # Initialize decibels to an easy-to-identify default
-    bin_decibels = np.ones(bin_edges.size - 1) * big_val
-    # Step through each frequency bin and aggregate responses
-    for i_bin in range(int(bin_edges.size - 1)):
-        bin_centers[i_bin] = (bin_edges[i_bin] + bin_edges[i_bin + 1]) / 2
-        # Find all the frequencies that fall within the bin
-        i_bin_freqs = np.where(
-            np.logical_and(
-                log_freqs >= bin_edges[i_bin],
-                log_freqs < bin_edges[i_bin + 1],
-            )
+
+@lru_cache
+def get_binner(n_samples, window_duration, bins_per_octave, low_cutoff):
+    """
+    SpectralBinners are only built the first time they're asked for.
+    After that, the same one gets handed back.
+    """
+    return SpectralBinner(
+        n_samples, window_duration, bins_per_octave, low_cutoff
+    )
+
+
+class SpectralBinner:
+    """
+    Everything about converting a window of audio to frequency bins
+    that doesn't depend on the audio itself: the Blackman window, which
+    bin each frequency of the FFT falls into, and which bins don't
+    get any frequencies at all. These get worked out once, when
+    the SpectralBinner is created. After that, each window of audio
+    only takes a real FFT and a single pass of np.bincount() to bin.
+    """
+
+    def __init__(
+        self,
+        n_samples,
+        window_duration,
+        bins_per_octave=config.BINS_PER_OCTAVE,
+        low_cutoff=config.LOW_CUTOFF,
+        pad_to_fast_length=config.FFT_PAD_TO_FAST_LENGTH,
+    ):
+        eps = 1e-3
+        self.n_samples = n_samples
+        self.duration = n_samples / float(config.SAMPLING_RATE)
+
+        # Some lengths of FFT are a lot faster than others. Padding
+        # the window out with zeros to one of the fast ones also slices
+        # the frequencies a little more finely.
+        if pad_to_fast_length:
+            self.n_fft = next_fast_length(n_samples)
+        else:
+            self.n_fft = n_samples
+        # The FFT of a real-valued time series is symmetric. The upper
+        # half of its frequencies are a mirror image of the lower half,
+        # all above the Nyquist frequency. Only the lower half gets
+        # calculated.
+        n_freqs = self.n_fft // 2 + 1
+
+        # Transform the frequencies to a log scale. Padding the window
+        # shrinks the spacing between frequencies.
+        freqs = np.arange(n_freqs) * (n_samples / self.n_fft) / window_duration
+        log_freqs = np.log10(eps + freqs)
+        # Define the edges of the frequency bins.
+        # These are evenly spaced on a log scale.
+        # Bins at the higher end will include a lot of different frequencies.
+        # Bins at the lower end will have few, some one, and some none.
+        bin_edges = np.arange(
+            np.log10(low_cutoff),
+            np.log10(config.SAMPLING_RATE / 2),
+            np.log10(2) / bins_per_octave,
+        )
+        self.n_bins = bin_edges.size - 1
+
+        # Find the bin that each frequency falls into. Frequencies
+        # that fall outside all of them are assigned to one extra bin
+        # on the end, which gets ignored.
+        self.i_bin = np.searchsorted(bin_edges, log_freqs, side="right") - 1
+        self.i_bin[
+            np.logical_or(self.i_bin < 0, self.i_bin >= self.n_bins)
+        ] = self.n_bins
+
+        # Find the bins that don't collect any frequencies,
+        # so that they can be removed.
+        counts = np.bincount(self.i_bin, minlength=self.n_bins + 1)
+        self.i_keep = np.where(counts[: self.n_bins] > 0)[0]
+        self.counts = counts[self.i_keep]
+        bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+        self.bin_centers = bin_centers[self.i_keep]
+
+        # The frequencies increase steadily, so each bin's frequencies
+        # all sit next to each other, and the bins follow one another
+        # in order. The kept bins can be summed up as a series of
+        # back-to-back slices, starting at the first frequency that
+        # falls in any bin.
+        i_first = np.where(self.i_bin < self.n_bins)[0][0]
+        self.i_bin_starts = i_first + np.cumsum(self.counts) - self.counts
+        self.i_bins_end = i_first + np.sum(self.counts)
+
+        # Apply a Blackman window to keep the representation
+        # of pure tones sharp.
+        self.window = np.blackman(n_samples)
+
+        # Buffers to work in, so that nothing needs to be allocated
+        # for each window of audio. The padding at the end of
+        # windowed_timeseries stays zero.
+        self.windowed_timeseries = np.zeros(self.n_fft)
+        self.spectrum = np.zeros(n_freqs, dtype=np.complex128)
+        self.decibels = np.zeros(n_freqs)
+        # The same, for a whole batch of windows at once, one per row.
+        # These get made bigger as bigger batches come along.
+        self.n_freqs = n_freqs
+        self.windowed_batch = np.zeros((0, self.n_fft))
+        self.spectrum_batch = np.zeros((0, n_freqs), dtype=np.complex128)
+        self.decibels_batch = np.zeros((0, n_freqs))
+
+    def time_to_freq(self, timeseries):
+        """
+        Returns the centers of the frequency bins, on a log scale,
+        and the average decibels of the frequencies in each.
+        """
+        np.multiply(
+            self.window,
+            timeseries,
+            out=self.windowed_timeseries[: self.n_samples],
         )
+        # Convert the time series to frequencies using the fast Fourier
+        # transform. Divide by duration to normalize for different
+        # window sizes.
+        rfft(self.windowed_timeseries, self.spectrum)
+        energies = np.abs(self.spectrum, out=self.decibels)
+        energies /= self.duration
+        # Convert energies at each frequency to decibels
+        energies += 1e-6
+        decibels = np.log10(energies, out=self.decibels)
+        decibels *= 10
         # Find the average decibels of all the bin's frequencies
-        if i_bin_freqs[0].size > 0:
-            bin_decibels[i_bin] = np.mean(decibels[i_bin_freqs])
+        bin_totals = np.bincount(
+            self.i_bin, weights=decibels, minlength=self.n_bins + 1
+        )
+        bin_decibels = bin_totals[self.i_keep] / self.counts
+        return self.bin_centers, bin_decibels
 
-    # Find the bins that didn't collect any frequencies and remove them.
-    i_keep = np.where(bin_decibels != big_val)
-    bin_centers = bin_centers[i_keep]
-    bin_decibels = bin_decibels[i_keep]
+    def time_to_freq_batch(self, timeseries_batch):
+        """
+        Does the same as time_to_freq() for a 2D array of windows,
+        one per row. All of them get transformed in a single call to
+        the FFT, and binned in a single call to np.add.reduceat().
 
-    return bin_centers, bin_decibels
+        Returns the centers of the frequency bins and a 2D array
+        of decibels, with one row per window and one column per bin.
+        """
+        n_windows = timeseries_batch.shape[0]
+        if n_windows > self.windowed_batch.shape[0]:
+            self.windowed_batch = np.zeros((n_windows, self.n_fft))
+            self.spectrum_batch = np.zeros(
+                (n_windows, self.n_freqs), dtype=np.complex128
+            )
+            self.decibels_batch = np.zeros((n_windows, self.n_freqs))
+
+        np.multiply(
+            self.window,
+            timeseries_batch,
+            out=self.windowed_batch[:n_windows, : self.n_samples],
+        )
+        spectrum = rfft(
+            self.windowed_batch[:n_windows],
+            self.spectrum_batch[:n_windows],
+            axis=1,
+        )
+        energies = np.abs(spectrum, out=self.decibels_batch[:n_windows])
+        energies /= self.duration
+        energies += 1e-6
+        decibels = np.log10(energies, out=energies)
+        decibels *= 10
+
+        bin_totals = np.add.reduceat(
+            decibels[:, : self.i_bins_end], self.i_bin_starts, axis=1
+        )
+        bin_decibels = bin_totals / self.counts
+        return self.bin_centers, bin_decibels
+
+
+class MultiResolutionBinner:
+    """
+    A single window length is a compromise. A long one is needed to
+    tell low frequencies apart, but it's slow to respond to changes.
+    A short one responds quickly but smears the low frequencies together.
+    A MultiResolutionBinner gives each frequency bin its own window,
+    about bins_per_octave / log(2) cycles of the bin's center frequency
+    long, but no shorter than shortest_duration and no longer than
+    longest_duration. Low bins get long windows and high bins get short
+    ones. All the windows end at the most recent sample.
+
+    All of this comes from just one FFT, of the longest window.
+    Windowing a stretch of audio and finding the strength of one
+    frequency in it is the same as multiplying it by a kernel, a windowed
+    wave at that frequency. Because of Parseval's theorem, that can be done
+    just as well in the frequency domain, multiplying the FFT of the audio
+    by the FFT of the kernel. The FFT of each kernel is almost all zeros,
+    except close to the bin's frequency. Only the parts bigger than
+    kernel_threshold, as a fraction of their peak, get kept, so each bin
+    takes only a handful of multiplications. (Brown and Puckette, 1992,
+    An efficient algorithm for the calculation of a constant Q transform)
+
+    Every bin's decibels are scaled to match those that time_to_freq()
+    would give for a window of the same length, so they can be swapped
+    in for each other.
+    """
+
+    def __init__(
+        self,
+        bins_per_octave=config.BINS_PER_OCTAVE,
+        low_cutoff=config.LOW_CUTOFF,
+        shortest_duration=config.MULTIRES_WINDOW_DURATION_SHORTEST,
+        longest_duration=config.MULTIRES_WINDOW_DURATION_LONGEST,
+        kernel_threshold=config.MULTIRES_KERNEL_THRESHOLD,
+    ):
+        self.n_samples = int(longest_duration * config.SAMPLING_RATE)
+        self.n_fft = next_fast_length(self.n_samples)
+        self.n_freqs = self.n_fft // 2 + 1
+        n_shortest = int(shortest_duration * config.SAMPLING_RATE)
+
+        # The same bins that SpectralBinner uses. Here, none are empty.
+        bin_edges = np.arange(
+            np.log10(low_cutoff),
+            np.log10(config.SAMPLING_RATE / 2),
+            np.log10(2) / bins_per_octave,
+        )
+        self.bin_centers = (bin_edges[:-1] + bin_edges[1:]) / 2
+        self.n_bins = self.bin_centers.size
+
+        # The number of cycles that fit in each window, so that it's just
+        # long enough to tell a bin's center frequency apart from its
+        # neighbors'. In signal processing speak, this is Q.
+        n_cycles = 1 / (2 ** (1 / bins_per_octave) - 1)
+        bin_freqs = 10**self.bin_centers
+        self.window_lengths = np.clip(
+            (n_cycles * config.SAMPLING_RATE / bin_freqs).astype(int),
+            n_shortest,
+            self.n_samples,
+        )
+
+        # Keep only the biggest parts of the FFT of each bin's kernel,
+        # all of them in one long array. The kernel of bin i_bin
+        # is i_kernel_freqs[i_bin_starts[i_bin]:i_bin_starts[i_bin + 1]]
+        # and the same slice of kernels.
+        i_kernel_freqs = []
+        kernels = []
+        self.i_bin_starts = np.zeros(self.n_bins, dtype=np.int64)
+        for i_bin in range(self.n_bins):
+            n_window = self.window_lengths[i_bin]
+            duration = n_window / float(config.SAMPLING_RATE)
+            # Divide by duration to match the decibels from
+            # time_to_freq() for a window this long.
+            wave = np.exp(
+                2j * np.pi * bin_freqs[i_bin] * np.arange(n_window)
+                / config.SAMPLING_RATE
+            )
+            kernel = np.zeros(self.n_fft, dtype=np.complex128)
+            kernel[self.n_samples - n_window : self.n_samples] = (
+                np.blackman(n_window) * wave / duration
+            )
+            # Parseval's theorem brings in the factor of 1 / n_fft.
+            # Only the positive frequencies get used. The rest of
+            # each kernel is close enough to zero to leave out.
+            kernel_freqs = np.conj(np.fft.fft(kernel)[: self.n_freqs])
+            kernel_freqs /= self.n_fft
+            magnitudes = np.abs(kernel_freqs)
+            i_keep = np.where(
+                magnitudes >= kernel_threshold * np.max(magnitudes)
+            )[0]
+            self.i_bin_starts[i_bin] = sum(k.size for k in kernels)
+            i_kernel_freqs.append(i_keep)
+            kernels.append(kernel_freqs[i_keep])
+        self.i_kernel_freqs = np.concatenate(i_kernel_freqs)
+        self.kernels = np.concatenate(kernels)
+
+        # Buffers to work in. These get made bigger
+        # as bigger batches come along.
+        self.windowed_batch = np.zeros((0, self.n_fft))
+        self.spectrum_batch = np.zeros((0, self.n_freqs), dtype=np.complex128)
+        self.products_batch = np.zeros(
+            (0, self.kernels.size), dtype=np.complex128
+        )
+
+    def time_to_freq(self, timeseries):
+        """
+        Returns the centers of the frequency bins, on a log scale,
+        and the decibels in each.
+        """
+        bin_centers, bin_decibels = self.time_to_freq_batch(
+            timeseries[np.newaxis, :]
+        )
+        return bin_centers, bin_decibels[0, :]
+
+    def time_to_freq_batch(self, timeseries_batch):
+        """
+        Does the same as time_to_freq() for a 2D array of windows,
+        one per row. Returns a 2D array of decibels,
+        with one row per window and one column per bin.
+        """
+        n_windows = timeseries_batch.shape[0]
+        if n_windows > self.windowed_batch.shape[0]:
+            self.windowed_batch = np.zeros((n_windows, self.n_fft))
+            self.spectrum_batch = np.zeros(
+                (n_windows, self.n_freqs), dtype=np.complex128
+            )
+            self.products_batch = np.zeros(
+                (n_windows, self.kernels.size), dtype=np.complex128
+            )
+
+        # The windowing is already built into the kernels.
+        self.windowed_batch[:n_windows, : self.n_samples] = timeseries_batch
+        spectrum = rfft(
+            self.windowed_batch[:n_windows],
+            self.spectrum_batch[:n_windows],
+            axis=1,
+        )
+        products = np.take(
+            spectrum,
+            self.i_kernel_freqs,
+            axis=1,
+            out=self.products_batch[:n_windows],
+        )
+        products *= self.kernels
+        energies = np.abs(
+            np.add.reduceat(products, self.i_bin_starts, axis=1)
+        )
+        # Convert energies in each bin to decibels
+        bin_decibels = 10 * np.log10(energies + 1e-6)
+        return self.bin_centers, bin_decibels
+
+
+def next_fast_length(n_samples):
+    """
+    The shortest length, at least n_samples long, that the real FFT
+    handles quickly: an even number with no prime factors other than
+    2, 3, and 5.
+    """
+    length = n_samples + n_samples % 2
+    while True:
+        remainder = length
+        for factor in (2, 3, 5):
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return length
+        length += 2
+
+
+def rfft(timeseries, out, axis=-1):
+    """
+    Take the real FFT of timeseries along axis, writing it into out,
+    and return out. Before NumPy 2.0, np.fft.rfft() can't write into
+    an array that already exists, so the result gets copied in instead.
+    """
+    if rfft_takes_out:
+        return np.fft.rfft(timeseries, axis=axis, out=out)
+    out[...] = np.fft.rfft(timeseries, axis=axis)
+    return out
@@ -0,0 +1,95 @@
+"""
+Compare the time it takes to get both a quick-responding and a
+finely-sliced look at the frequencies, each stride,
+
+  - the old way, with two separate FFTs, one of a short window and
+    one of a long window, each binned by its own SpectralBinner, and
+  - with a MultiResolutionBinner, which takes one FFT of the long
+    window and gives each bin a window of its own length.
+
+It also checks how closely the MultiResolutionBinner's shortcut through
+the frequency domain matches working out each bin's windowed sum
+directly, one sample at a time, for a few different kernel thresholds.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from multifft import MultiResolutionBinner, SpectralBinner
+
+n_reps = 200
+kernel_thresholds = [0.0005, 0.005, 0.05]
+
+short_duration = config.MULTIFFT_WINDOW_DURATION
+long_duration = config.MULTIRES_WINDOW_DURATION_LONGEST
+n_short = int(short_duration * config.SAMPLING_RATE)
+n_long = int(long_duration * config.SAMPLING_RATE)
+
+
+def time_it(convert, frames):
+    # Run it once first, so that one-time setup isn't counted.
+    convert(frames[0])
+    start = perf_counter()
+    for frame in frames:
+        convert(frame)
+    return (perf_counter() - start) / len(frames)
+
+
+def direct(binner, timeseries):
+    """
+    Each bin's windowed sum, worked out one sample at a time.
+    """
+    bin_decibels = np.zeros(binner.n_bins)
+    for i_bin in range(binner.n_bins):
+        n_window = binner.window_lengths[i_bin]
+        duration = n_window / float(config.SAMPLING_RATE)
+        wave = np.exp(
+            -2j * np.pi * 10 ** binner.bin_centers[i_bin]
+            * np.arange(n_window) / config.SAMPLING_RATE
+        )
+        energy = np.abs(
+            np.sum(timeseries[-n_window:] * np.blackman(n_window) * wave)
+        ) / duration
+        bin_decibels[i_bin] = 10 * np.log10(energy + 1e-6)
+    return bin_decibels
+
+
+np.random.seed(0)
+frames = list(np.random.normal(size=(n_reps, n_long)))
+
+short_binner = SpectralBinner(n_short, short_duration)
+long_binner = SpectralBinner(n_long, long_duration)
+multires_binner = MultiResolutionBinner()
+
+
+def two_ffts(frame):
+    short_binner.time_to_freq(frame[-n_short:])
+    long_binner.time_to_freq(frame)
+
+
+two_time = time_it(two_ffts, frames)
+multires_time = time_it(multires_binner.time_to_freq, frames)
+print("Time per stride")
+print(
+    f"  two FFTs, {short_duration} s and {long_duration} s"
+    + f"   {1000 * two_time:8.3f} ms"
+    + f"   {short_binner.counts.size + long_binner.counts.size} bins"
+)
+print(
+    f"  one FFT, multi-resolution      {1000 * multires_time:8.3f} ms"
+    + f"   {multires_binner.n_bins} bins"
+)
+
+print()
+print("Multi-resolution kernels, compared to a direct calculation")
+print("  threshold   kernel size   max difference   time per stride")
+reference = direct(multires_binner, frames[0])
+for kernel_threshold in kernel_thresholds:
+    binner = MultiResolutionBinner(kernel_threshold=kernel_threshold)
+    freqs, bin_decibels = binner.time_to_freq(frames[0])
+    difference = np.max(np.abs(bin_decibels - reference))
+    stride_time = time_it(binner.time_to_freq, frames)
+    print(
+        f"  {kernel_threshold:9.4f}   {binner.kernels.size:11d}"
+        + f"   {difference:11.3f} dB   {1000 * stride_time:12.3f} ms"
+    )
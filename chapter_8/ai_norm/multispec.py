@@ -9,13 +9,17 @@ import tools.logging_setup as logging_setup
 from tools.pacemaker import Pacemaker
 
 
-def run(norm_spec_q):
+def run(norm_spec_q, timing_stats):
     logger = logging_setup.get_logger(
         config.LOGGER_NAME_MULTISPEC, config.LOGGING_LEVEL_MULTISPEC
     )
 
     frame = Frame()
-    pacemaker = Pacemaker(config.CLOCK_FREQ_SPEC)
+    pacemaker = Pacemaker(
+        config.CLOCK_FREQ_SPEC,
+        timing_stats=timing_stats,
+        process_name="multispec",
+    )
 
     while True:
         overtime = pacemaker.beat()
@@ -145,13 +149,17 @@ class Frame:
         plt.show()
 
     def update(self, frequencies, magnitudes):
+        """
+        magnitudes is a block of frames, one per row.
+        """
         try:
-            self.img_data = np.roll(self.img_data, -1, axis=1)
+            n_frames = min(magnitudes.shape[0], self.img_data.shape[1])
         except AttributeError:
             self._initialize_frame(frequencies, magnitudes)
-            self.img_data = np.roll(self.img_data, -1, axis=1)
+            n_frames = min(magnitudes.shape[0], self.img_data.shape[1])
 
-        self.img_data[:, -1] = magnitudes[::-1]
+        self.img_data = np.roll(self.img_data, -n_frames, axis=1)
+        self.img_data[:, -n_frames:] = magnitudes[-n_frames:, ::-1].T
 
     def update_viz(self):
         try:
@@ -8,7 +8,14 @@ def run(fft_norm_q, norm_spec_q):
     while True:
         while not fft_norm_q.empty():
             freqs, mags = fft_norm_q.get()
-            normed_mags = normalizer.normalize(mags)
+            # mags can be a single frame, or a block of them,
+            # one per row. Either way, send along a block.
+            mags = np.atleast_2d(mags)
+            normed_mags = np.zeros(mags.shape)
+            for i_frame in range(mags.shape[0]):
+                normed_mags[i_frame, :] = normalizer.normalize(
+                    mags[i_frame, :]
+                )
             norm_spec_q.put((freqs, normed_mags))
 
 
@@ -1,8 +1,10 @@
 import multiprocessing as mp
+import config
 import listen
 import multifft
 import multispec
 import norm
+from tools.timing_stats import TimingStats
 
 mp.set_start_method("fork")
 
@@ -11,6 +13,11 @@ listen_multifft_q = mp.Queue()
 multifft_norm_q = mp.Queue()
 norm_spec_q = mp.Queue()
 
+# The Pacemaker posts its timing stats here.
+timing_stats = TimingStats(
+    config.TIMING_STATS_NAME, ["multispec"], create=True
+)
+
 p_listen = mp.Process(
     target=listen.run,
     args=(listen_multifft_q,),
@@ -25,10 +32,22 @@ p_norm = mp.Process(
 )
 p_multispec = mp.Process(
     target=multispec.run,
-    args=(norm_spec_q,),
+    args=(norm_spec_q, timing_stats),
 )
 
 p_listen.start()
 p_multifft.start()
 p_norm.start()
 p_multispec.start()
+
+# Wait for the child processes to finish. Whether they end on their own
+# or get stopped with Ctrl-C, the shared memory block gets cleaned up
+# on the way out, so that it doesn't outlive the run.
+try:
+    p_listen.join()
+    p_multifft.join()
+    p_norm.join()
+    p_multispec.join()
+finally:
+    timing_stats.close()
+    timing_stats.unlink()
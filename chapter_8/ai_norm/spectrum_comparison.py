@@ -0,0 +1,81 @@
+"""
+Compare the time it takes to get the decibels at each frequency
+of a window of audio
+
+  - the old way, with a complex FFT, finding the decibels of all
+    n frequencies, even the upper half, which are all above
+    the Nyquist frequency and get thrown away,
+  - with a real FFT, finding only the lower n / 2 + 1, and
+  - with a real FFT, after padding the window with zeros to
+    the next length that the FFT handles quickly.
+
+The last two are done the way SpectralBinner does them,
+in buffers that get reused for every window.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from multifft import next_fast_length, rfft
+
+n_reps = 2000
+window_durations = [0.01, 0.02, 0.05, 0.1, 0.5]
+
+
+def full_spectrum(timeseries, window, duration):
+    energies = np.abs(np.fft.fft(window * timeseries)) / duration
+    return 10 * np.log10(energies + 1e-6)
+
+
+def make_half_spectrum(n_samples, n_fft):
+    windowed_timeseries = np.zeros(n_fft)
+    spectrum = np.zeros(n_fft // 2 + 1, dtype=np.complex128)
+    decibels = np.zeros(n_fft // 2 + 1)
+
+    def half_spectrum(timeseries, window, duration):
+        np.multiply(window, timeseries, out=windowed_timeseries[:n_samples])
+        rfft(windowed_timeseries, spectrum)
+        energies = np.abs(spectrum, out=decibels)
+        energies /= duration
+        energies += 1e-6
+        window_decibels = np.log10(energies, out=decibels)
+        window_decibels *= 10
+        return window_decibels
+
+    return half_spectrum
+
+
+def time_it(spectrum, frames, window, duration):
+    # Run it once first, so that one-time setup isn't counted.
+    spectrum(frames[0], window, duration)
+    start = perf_counter()
+    for frame in frames:
+        spectrum(frame, window, duration)
+    return (perf_counter() - start) / len(frames)
+
+
+print("Time to get the decibels of each frequency in one window")
+print(
+    "  window   samples   padded"
+    + "     full FFT     real FFT   real FFT, padded"
+)
+for window_duration in window_durations:
+    np.random.seed(0)
+    n_samples = int(window_duration * config.SAMPLING_RATE)
+    n_fft = next_fast_length(n_samples)
+    duration = n_samples / float(config.SAMPLING_RATE)
+    window = np.blackman(n_samples)
+    frames = list(np.random.normal(size=(n_reps, n_samples)))
+
+    full_time = time_it(full_spectrum, frames, window, duration)
+    half_time = time_it(
+        make_half_spectrum(n_samples, n_samples), frames, window, duration
+    )
+    padded_time = time_it(
+        make_half_spectrum(n_samples, n_fft), frames, window, duration
+    )
+    print(
+        f"  {window_duration:4.2f} s  {n_samples:8d}  {n_fft:7d}"
+        + f"   {1e6 * full_time:7.1f} us   {1e6 * half_time:7.1f} us"
+        + f"         {1e6 * padded_time:7.1f} us"
+    )
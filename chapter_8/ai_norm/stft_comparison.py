@@ -0,0 +1,69 @@
+"""
+Compare the time it takes to catch up on a backlog of waiting frames
+
+  - one at a time, each with its own FFT and its own binning, and
+  - all at once, as a 2D view of overlapping windows, with one FFT
+    along its rows and one np.add.reduceat() to bin them.
+
+A backlog builds up whenever the multi-FFT process doesn't get to run
+for a while. The longer the hiccup, the more frames are waiting.
+"""
+from time import perf_counter
+import numpy as np
+
+import config
+from multifft import SpectralBinner
+from tools.ring_buffer import SampleHistory
+
+n_reps = 200
+backlogs = [1, 2, 5, 10, 25, 50]
+
+window_duration = config.MULTIFFT_WINDOW_DURATION
+n_samples = int(window_duration * config.SAMPLING_RATE)
+stride = int(config.FFT_STRIDE_DURATION * config.SAMPLING_RATE)
+
+
+def one_at_a_time(binner, history, n_frames):
+    frames = []
+    for i_frame in range(n_frames):
+        freqs, mags = binner.time_to_freq(
+            history.window(i_frame * stride, n_samples)
+        )
+        frames.append(mags)
+    return frames
+
+
+def all_at_once(binner, history, n_frames):
+    freqs, mags = binner.time_to_freq_batch(
+        history.windows(0, n_samples, stride, n_frames)
+    )
+    return mags
+
+
+def time_it(catch_up, binner, history, n_frames):
+    # Run it once first, so that one-time setup isn't counted.
+    catch_up(binner, history, n_frames)
+    start = perf_counter()
+    for _ in range(n_reps):
+        catch_up(binner, history, n_frames)
+    return (perf_counter() - start) / n_reps
+
+
+np.random.seed(0)
+binner = SpectralBinner(n_samples, window_duration)
+history = SampleHistory(n_samples + stride * (max(backlogs) - 1))
+history.append(np.random.normal(size=history.n))
+
+print(f"Catching up on waiting frames, {n_samples} samples each")
+print("  frames     one at a time      all at once")
+for n_frames in backlogs:
+    single_time = time_it(one_at_a_time, binner, history, n_frames)
+    batch_time = time_it(all_at_once, binner, history, n_frames)
+    assert np.allclose(
+        one_at_a_time(binner, history, n_frames),
+        all_at_once(binner, history, n_frames),
+    )
+    print(
+        f"  {n_frames:6d}   {1000 * single_time:12.3f} ms"
+        + f"   {1000 * batch_time:11.3f} ms"
+    )
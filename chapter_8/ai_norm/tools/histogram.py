@@ -0,0 +1,66 @@
+import math
+import numpy as np
+
+
+class LogHistogram:
+    """
+    A histogram with buckets that get wider as the values get bigger,
+    in the style of an HDR histogram. Each bucket is a fixed fraction
+    wider than the one before it, so a microsecond and a second
+    are both measured to within a few percent, using a few hundred
+    buckets in all.
+
+    Adding a value is cheap enough to do on every pass through a loop.
+    Percentiles are found by walking the bucket counts, so they are
+    best left for occasional reports.
+
+    Values at or below min_value land in the first bucket and values
+    above max_value land in the last one.
+    """
+
+    def __init__(self, min_value=1e-7, max_value=100.0, buckets_per_octave=16):
+        self.min_value = min_value
+        self.buckets_per_octave = buckets_per_octave
+        n_octaves = math.log2(max_value / min_value)
+        self.n_buckets = int(math.ceil(n_octaves * buckets_per_octave)) + 1
+        self.upper_edges = min_value * 2 ** (
+            np.arange(self.n_buckets) / buckets_per_octave
+        )
+        self.counts = np.zeros(self.n_buckets, dtype=np.int64)
+        self.total = 0
+        self.max_value_seen = 0.0
+
+    def add(self, value):
+        if value <= self.min_value:
+            i_bucket = 0
+        else:
+            i_bucket = min(
+                self.n_buckets - 1,
+                int(
+                    math.ceil(
+                        math.log2(value / self.min_value)
+                        * self.buckets_per_octave
+                    )
+                ),
+            )
+        self.counts[i_bucket] += 1
+        self.total += 1
+        if value > self.max_value_seen:
+            self.max_value_seen = value
+
+    def percentile(self, p):
+        """
+        Returns the upper edge of the bucket that the p-th percentile
+        falls in, so it errs on the high side, but never by more than
+        the width of one bucket.
+        """
+        if self.total == 0:
+            return 0.0
+        rank = max(1, int(math.ceil(p / 100 * self.total)))
+        i_bucket = np.searchsorted(np.cumsum(self.counts), rank)
+        return float(min(self.upper_edges[i_bucket], self.max_value_seen))
+
+    def reset(self):
+        self.counts[:] = 0
+        self.total = 0
+        self.max_value_seen = 0.0
@@ -32,3 +32,87 @@ class RingBuffer:
         else:
             # If no wrapping is necessary
             self.x[self.i : self.i + m] += arr
+
+
+class SampleHistory:
+    """
+    A fixed-size history of the most recent samples in a stream.
+    Blocks of new samples get written in with append(), and window()
+    hands back any stretch of recent samples as a view, without copying.
+    windows() does the same for a whole series of overlapping stretches.
+
+    Every sample is written in two places, n apart, in an array that is
+    2n long. That way any run of up to n consecutive samples sits in one
+    unbroken piece of the array, even where it wraps around the end of
+    the ring.
+
+    Positions in the stream are counted from the first sample ever
+    appended. Only the most recent n are kept.
+    """
+
+    def __init__(self, size):
+        self.n = size
+        self.x = np.zeros(2 * self.n, dtype=float)
+        # Where the next sample gets written
+        self.i = 0
+        # How many samples have been appended, all told
+        self.n_appended = 0
+
+    def append(self, arr):
+        m = arr.size
+        if m > self.n:
+            raise IndexError(
+                f"Trying to append an array of size {arr.size}"
+                + f" to a sample history of size {self.n}."
+            )
+        n_left = self.n - self.i
+        if m > n_left:
+            # If wrapping is necessary
+            self.x[self.i : self.n] = arr[:n_left]
+            self.x[self.i + self.n :] = arr[:n_left]
+            n_wrap = m - n_left
+            self.x[:n_wrap] = arr[n_left:]
+            self.x[self.n : self.n + n_wrap] = arr[n_left:]
+        else:
+            # If no wrapping is necessary
+            self.x[self.i : self.i + m] = arr
+            self.x[self.i + self.n : self.i + self.n + m] = arr
+
+        self.i = (self.i + m) % self.n
+        self.n_appended += m
+
+    def oldest(self):
+        """
+        The position in the stream of the oldest sample still kept.
+        """
+        return max(0, self.n_appended - self.n)
+
+    def window(self, start, length):
+        """
+        A view of length samples, beginning at position start in the stream.
+        It is only good until the next append().
+        """
+        if start < self.oldest() or start + length > self.n_appended:
+            raise IndexError(
+                f"Samples {start} through {start + length - 1}"
+                + f" aren't all in the sample history. It holds samples"
+                + f" {self.oldest()} through {self.n_appended - 1}."
+            )
+        i_start = start % self.n
+        return self.x[i_start : i_start + length]
+
+    def windows(self, start, length, stride, count):
+        """
+        A 2D view of count windows, one per row, each length samples long.
+        The first begins at position start in the stream, and each one
+        after that begins stride samples later than the one before.
+        Like window(), it is only good until the next append().
+        """
+        span = self.window(start, (count - 1) * stride + length)
+        # Each row starts stride samples further along in the same memory.
+        return np.lib.stride_tricks.as_strided(
+            span,
+            shape=(count, length),
+            strides=(stride * span.itemsize, span.itemsize),
+            writeable=False,
+        )